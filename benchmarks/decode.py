@@ -0,0 +1,71 @@
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import typer
+
+# Run against the working tree rather than an installed copy
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from validate_camera_calibration.tools import general as gn
+from validate_camera_calibration.tools.image import (
+    REDUCED_DECODE_FACTORS,
+    Image,
+    supported_image_extensions,
+)
+from validate_camera_calibration.tools.synthetic import generate_dataset
+
+app = typer.Typer(add_completion=False)
+
+
+@app.command()
+def main(
+    images_dir: Optional[Path] = typer.Option(
+        None,
+        "--images_dir",
+        help="Directory of images to decode. Defaults to synthetic JPEGs.",
+    ),
+    images: int = typer.Option(8, "--images", help="Number of synthetic images."),
+    width: int = typer.Option(4000, "--width", help="Synthetic image width."),
+    height: int = typer.Option(3000, "--height", help="Synthetic image height."),
+    repeats: int = typer.Option(3, "--repeats", help="Decodes per image and mode."),
+):
+    # Median decode time and decoded size per frame of every decode mode
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        if images_dir is None:
+            images_dir = generate_dataset(
+                Path(dir_tmp),
+                n_images=images,
+                image_width=width,
+                image_height=height,
+                extension=".jpg",
+            )
+        image_paths = sorted(
+            os.path.join(images_dir, f)
+            for f in os.listdir(images_dir)
+            if Path(f).suffix.lower() in supported_image_extensions()
+        )
+        assert len(image_paths) > 0, f"Expected to find images in {images_dir}!"
+
+        modes = [("color", 1)] + [("grey", r) for r in REDUCED_DECODE_FACTORS]
+        print(f"{'Mode':<12}{'Time [ms]':>12}{'Frame size':>14}")
+        for mode, reduction in modes:
+            times = []
+            for image_path in image_paths:
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    image = Image.from_file(image_path, mode=mode, reduction=reduction)
+                    times.append(time.perf_counter() - start)
+            label = mode if reduction == 1 else f"{mode} 1/{reduction}"
+            print(
+                f"{label:<12}{1000 * statistics.median(times):>12.1f}"
+                f"{gn.format_bytes(image.img.nbytes):>14}"
+            )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,167 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import cv2
+import numpy as np
+import typer
+
+# Run against the working tree rather than an installed copy
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from validate_camera_calibration.tools.camera import Camera
+from validate_camera_calibration.tools.detectors import (
+    create_detector,
+    supported_detectors,
+)
+from validate_camera_calibration.tools.synthetic import (
+    generate_dataset,
+    synthetic_camera,
+)
+from validate_camera_calibration.tools.timing import StageTimer
+from validate_camera_calibration.tools.validation import (
+    detect_chessboards,
+    find_image_files,
+    get_calibration_grid_parameters,
+)
+
+app = typer.Typer(add_completion=False)
+
+# Grid rendered for the synthetic comparison of each detector
+GRID_TYPES = dict(
+    classic="chessboard",
+    sb="chessboard",
+    circles="circles",
+    asymmetric_circles="asymmetric_circles",
+)
+
+
+def corner_errors(
+    corners: np.ndarray, ground_truth: dict, index: int, camera: Camera, rPNn
+) -> np.ndarray:
+    # Distance of every detected point to the projection of its true position.
+    # Symmetric grids may be found starting from the opposite corner, so the
+    # reversed point order is tried as well.
+    rQOi, _ = cv2.projectPoints(
+        rPNn,
+        ground_truth["rvecs"][index],
+        ground_truth["tvecs"][index],
+        camera.Kc,
+        camera.dist,
+    )
+    rQOi = rQOi.reshape(-1, 2)
+    corners = corners.reshape(-1, 2)
+    return min(
+        (np.linalg.norm(points - rQOi, axis=1) for points in [corners, corners[::-1]]),
+        key=lambda errors: np.mean(errors),
+    )
+
+
+def run_detector(dir_calibration: Path, detector, detection_scale: float, workers: int):
+    calibration_grid = get_calibration_grid_parameters(
+        os.path.join(dir_calibration, "calibration_grid_params.yaml")
+    )
+    pattern_size = (calibration_grid["grid_width"], calibration_grid["grid_height"])
+    image_paths = [
+        os.path.join(dir_calibration, f) for f in find_image_files(dir_calibration)
+    ]
+    timer = StageTimer()
+    frames = list(
+        detect_chessboards(
+            image_paths,
+            pattern_size,
+            workers=workers,
+            detection_scale=detection_scale,
+            timer=timer,
+            detector=detector,
+        )
+    )
+    rPNn = detector.grid_points(pattern_size, calibration_grid["grid_square_size"])
+    return frames, timer.stages["detect"], rPNn
+
+
+@app.command()
+def main(
+    dataset: Optional[Path] = typer.Option(
+        None,
+        "--dataset",
+        help="Root path of a real dataset to compare the detectors on. Defaults to synthetic datasets with known corners, one per grid type.",
+    ),
+    detectors: str = typer.Option(
+        ",".join(supported_detectors()),
+        "--detectors",
+        help="Comma separated detectors to compare.",
+    ),
+    images: int = typer.Option(20, "--images", help="Synthetic images per grid."),
+    width: int = typer.Option(1920, "--width", help="Synthetic image width."),
+    height: int = typer.Option(1080, "--height", help="Synthetic image height."),
+    detection_scale: float = typer.Option(1.0, "--detection_scale"),
+    workers: int = typer.Option(1, "--workers", help="Detection processes."),
+):
+    # Detection rate, throughput and, on synthetic data, corner accuracy of
+    # each detector, to pick the fastest one that is accurate enough
+    names = [name.strip() for name in detectors.split(",") if name.strip()]
+    print(
+        f"{'Detector':<20}{'Detected':>10}{'Frames/s':>10}"
+        f"{'Error RMS [pix]':>17}{'Error max [pix]':>17}"
+    )
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        dirs_calibration = dict()
+        for name in names:
+            detector = create_detector(name)
+            ground_truth = None
+            if dataset is not None:
+                dir_calibration = Path(os.path.join(dataset, "calibration"))
+            else:
+                grid_type = GRID_TYPES[name]
+                dir_base = Path(os.path.join(dir_tmp, grid_type))
+                if grid_type not in dirs_calibration:
+                    pattern_size = (
+                        (4, 11) if grid_type == "asymmetric_circles" else (9, 6)
+                    )
+                    dirs_calibration[grid_type] = generate_dataset(
+                        dir_base,
+                        n_images=images,
+                        image_width=width,
+                        image_height=height,
+                        pattern_size=pattern_size,
+                        grid_type=grid_type,
+                    )
+                dir_calibration = dirs_calibration[grid_type]
+                with np.load(os.path.join(dir_base, "ground_truth.npz")) as data:
+                    ground_truth = {key: data[key] for key in data.files}
+
+            frames, stage, rPNn = run_detector(
+                dir_calibration, detector, detection_scale, workers
+            )
+            n_detected = sum(corners is not None for _, _, corners in frames)
+            fps = stage["frames"] / stage["seconds"] if stage["seconds"] > 0 else 0.0
+            error_rms, error_max = "-", "-"
+            if ground_truth is not None and n_detected > 0:
+                camera = synthetic_camera(width, height)
+                names_true = list(ground_truth["source_names"])
+                errors = np.concatenate(
+                    [
+                        corner_errors(
+                            corners,
+                            ground_truth,
+                            names_true.index(Path(image_path).name),
+                            camera,
+                            rPNn,
+                        )
+                        for image_path, _, corners in frames
+                        if corners is not None
+                    ]
+                )
+                error_rms = f"{np.sqrt(np.mean(errors**2)):.4f}"
+                error_max = f"{np.max(errors):.4f}"
+            print(
+                f"{name:<20}{n_detected:>5}/{len(frames):<4}{fps:>10.1f}"
+                f"{error_rms:>17}{error_max:>17}"
+            )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,176 @@
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import typer
+
+# Run against the working tree rather than an installed copy
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from validate_camera_calibration.tools import validation
+from validate_camera_calibration.tools.poses import load_poses
+from validate_camera_calibration.tools.synthetic import generate_dataset
+
+app = typer.Typer(add_completion=False)
+
+
+def pose_errors(poses: dict, ground_truth: dict) -> dict:
+    # Camera position and orientation errors of every frame with a pose. The
+    # grid is symmetric under a 180 degree rotation about its normal, so each
+    # pose is compared to whichever of the two equivalent board frames is closer.
+    names = list(ground_truth["source_names"])
+    index = [names.index(name) for name in poses["source_names"]]
+    rCNn_true = ground_truth["rCNn"][index]
+    Rnc_true = ground_truth["Rnc"][index]
+
+    pattern_size = ground_truth["pattern_size"]
+    rLNn = np.array([*(pattern_size - 1) * ground_truth["grid_square_size"], 0.0])
+    flip = np.diag([-1.0, -1.0, 1.0])
+    candidates = [(rCNn_true, Rnc_true), ((rCNn_true - rLNn) @ flip, flip @ Rnc_true)]
+
+    position = np.full(len(index), np.inf)
+    rotation = np.full(len(index), np.inf)
+    for rCNn, Rnc in candidates:
+        dp = np.linalg.norm(poses["rCNn"] - rCNn, axis=1)
+        dR = np.einsum("nji,njk->nik", poses["Rnc"], Rnc)
+        cos = np.clip((np.trace(dR, axis1=1, axis2=2) - 1) / 2, -1, 1)
+        dr = np.degrees(np.arccos(cos))
+        better = dp < position
+        position[better] = dp[better]
+        rotation[better] = dr[better]
+    distance = np.linalg.norm(rCNn_true, axis=1)
+
+    errors = dict()
+    errors["position_max"] = float(np.max(position))
+    errors["position_relative_max"] = float(np.max(position / distance))
+    errors["rotation_max_deg"] = float(np.max(rotation))
+    errors["reprojection_rms"] = float(
+        np.sqrt(np.mean(poses["reprojection_errors"] ** 2))
+    )
+    errors["detection_rate"] = len(index) / len(names)
+    return errors
+
+
+@app.command()
+def main(
+    dataset: Optional[Path] = typer.Option(
+        None,
+        "--dataset",
+        help="Directory of a synthetic dataset to reuse, generated there if missing. Defaults to a temporary directory.",
+    ),
+    images: int = typer.Option(50, "--images", help="Number of images with a grid."),
+    width: int = typer.Option(1920, "--width", help="Image width in pixels."),
+    height: int = typer.Option(1080, "--height", help="Image height in pixels."),
+    grid_width: int = typer.Option(9, "--grid_width", help="Inner corners per row."),
+    grid_height: int = typer.Option(
+        6, "--grid_height", help="Inner corners per column."
+    ),
+    extension: str = typer.Option(".png", "--extension", help="Image file type."),
+    workers: int = typer.Option(1, "--workers", help="Detection processes."),
+    detection_scale: float = typer.Option(1.0, "--detection_scale"),
+    prefetch: int = typer.Option(0, "--prefetch", help="Image files read ahead."),
+    export_undistorted: bool = typer.Option(False, "--export_undistorted"),
+    poses_format: str = typer.Option("npz", "--poses_format"),
+    report: Optional[Path] = typer.Option(
+        None, "--report", help="Write timings, accuracy and settings to this json file."
+    ),
+    max_position_error: float = typer.Option(
+        1e-3,
+        "--max_position_error",
+        help="Fail if a camera position error exceeds this fraction of its distance to the grid.",
+    ),
+    max_rotation_error: float = typer.Option(
+        0.1, "--max_rotation_error", help="Fail above this orientation error [deg]."
+    ),
+    max_rms: float = typer.Option(
+        0.1, "--max_rms", help="Fail above this reprojection RMS [pix]."
+    ),
+    min_detection_rate: float = typer.Option(
+        1.0, "--min_detection_rate", help="Fail below this fraction of detected grids."
+    ),
+):
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        dir_base = Path(dataset) if dataset is not None else Path(dir_tmp)
+        file_ground_truth = Path(os.path.join(dir_base, "ground_truth.npz"))
+        if not file_ground_truth.is_file():
+            generate_dataset(
+                dir_base,
+                n_images=images,
+                image_width=width,
+                image_height=height,
+                pattern_size=(grid_width, grid_height),
+                extension=extension,
+            )
+
+        file_timings = Path(os.path.join(dir_tmp, "timings.json"))
+        validation.validate(
+            dir_base,
+            Path(os.path.join(dir_base, "calibration")),
+            export_undistorted_images=export_undistorted,
+            export_poses=True,
+            workers=workers,
+            use_cache=False,
+            detection_scale=detection_scale,
+            poses_format=poses_format,
+            timings_file=file_timings,
+            prefetch_depth=prefetch,
+        )
+        with open(file_timings, "r") as f:
+            timings = json.load(f)
+
+        errors = None
+        if poses_format != "yaml":
+            poses = load_poses(os.path.join(dir_base, "poses", f"poses.{poses_format}"))
+            with np.load(file_ground_truth) as data:
+                ground_truth = {key: data[key] for key in data.files}
+            errors = pose_errors(poses, ground_truth)
+            print("Accuracy against ground truth:")
+            print(f"  Detection rate:     {errors['detection_rate']:.3f}")
+            print(f"  Position error:     {errors['position_max']:.3g} [m] max")
+            print(
+                f"                      {errors['position_relative_max']:.3g} max relative to distance"
+            )
+            print(f"  Orientation error:  {errors['rotation_max_deg']:.3g} [deg] max")
+            print(f"  Reprojection RMS:   {errors['reprojection_rms']:.3g} [pix]")
+
+    if report is not None:
+        data = dict()
+        data["settings"] = dict(
+            images=images,
+            width=width,
+            height=height,
+            pattern_size=[grid_width, grid_height],
+            extension=extension,
+            workers=workers,
+            detection_scale=detection_scale,
+            prefetch=prefetch,
+            export_undistorted=export_undistorted,
+            poses_format=poses_format,
+        )
+        data["timings"] = timings
+        data["accuracy"] = errors
+        with open(report, "w") as f:
+            json.dump(data, f, indent=2)
+        print(f"Saved report to {report}.")
+
+    failures = []
+    if errors is not None:
+        if errors["position_relative_max"] > max_position_error:
+            failures.append("camera position error regressed")
+        if errors["rotation_max_deg"] > max_rotation_error:
+            failures.append("camera orientation error regressed")
+        if errors["reprojection_rms"] > max_rms:
+            failures.append("reprojection RMS regressed")
+        if errors["detection_rate"] < min_detection_rate:
+            failures.append("detection rate regressed")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    raise typer.Exit(code=1 if failures else 0)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,117 @@
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import typer
+
+# Run against the working tree rather than an installed copy
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from validate_camera_calibration.tools.pnp import PnPSolver, supported_pnp_methods
+from validate_camera_calibration.tools.synthetic import (
+    random_board_poses,
+    synthetic_camera,
+)
+from validate_camera_calibration.tools.validation import calibration_grid_points
+
+app = typer.Typer(add_completion=False)
+
+
+def board_trajectory(
+    n_frames: int,
+    n_keyframes: int,
+    pattern_size,
+    grid_square_size: float,
+    camera,
+    rng: np.random.Generator,
+):
+    # Smooth sequence of board poses through a few random ones, like a board
+    # moved slowly in front of a video camera
+    rvecs_key, tvecs_key = random_board_poses(
+        n_keyframes, pattern_size, grid_square_size, camera, rng
+    )
+    t = np.linspace(0, n_keyframes - 1, n_frames)
+    keys = np.arange(n_keyframes)
+    rvecs = np.stack([np.interp(t, keys, rvecs_key[:, i]) for i in range(3)], axis=1)
+    tvecs = np.stack([np.interp(t, keys, tvecs_key[:, i]) for i in range(3)], axis=1)
+    return rvecs, tvecs
+
+
+@app.command()
+def main(
+    frames: int = typer.Option(500, "--frames", help="Number of frames."),
+    keyframes: int = typer.Option(6, "--keyframes", help="Poses the sequence visits."),
+    width: int = typer.Option(1920, "--width", help="Image width in pixels."),
+    height: int = typer.Option(1080, "--height", help="Image height in pixels."),
+    grid_width: int = typer.Option(9, "--grid_width", help="Inner corners per row."),
+    grid_height: int = typer.Option(
+        6, "--grid_height", help="Inner corners per column."
+    ),
+    noise: float = typer.Option(0.2, "--noise", help="Corner noise [pix]."),
+    shuffle: bool = typer.Option(
+        False, "--shuffle", help="Solve the frames out of order."
+    ),
+    seed: int = typer.Option(0, "--seed"),
+):
+    # Per-frame solve time, reprojection RMS and camera position error of every
+    # PnP method, cold and warm started, on grid corners projected along a
+    # smooth trajectory with Gaussian noise
+    rng = np.random.default_rng(seed)
+    pattern_size = (grid_width, grid_height)
+    grid_square_size = 0.03
+    camera = synthetic_camera(width, height)
+    rPNn = calibration_grid_points(pattern_size, grid_square_size)
+    rvecs, tvecs = board_trajectory(
+        frames, keyframes, pattern_size, grid_square_size, camera, rng
+    )
+    corners = np.stack(
+        [
+            cv2.projectPoints(rPNn, rvec, tvec, camera.Kc, camera.dist)[0].reshape(
+                -1, 2
+            )
+            for rvec, tvec in zip(rvecs, tvecs)
+        ]
+    )
+    corners += rng.normal(0, noise, corners.shape)
+    order = rng.permutation(frames) if shuffle else np.arange(frames)
+    rCNn_true = np.stack(
+        [-cv2.Rodrigues(rvec)[0].T @ tvec for rvec, tvec in zip(rvecs, tvecs)]
+    )
+
+    print(
+        f"{'Method':<12}{'Warm start':>11}{'Time [us]':>11}{'RMS [pix]':>11}"
+        f"{'Position error':>16}{'Restarts':>10}"
+    )
+    for method in supported_pnp_methods():
+        for warm_start in [False, True]:
+            solver = PnPSolver(
+                rPNn, camera.Kc, camera.dist, method=method, warm_start=warm_start
+            )
+            times = []
+            squared = []
+            position = []
+            for i in order:
+                start = time.perf_counter()
+                rvec, tvec = solver.solve(corners[i])
+                times.append(time.perf_counter() - start)
+                projected, _ = cv2.projectPoints(
+                    rPNn, rvec, tvec, camera.Kc, camera.dist
+                )
+                squared.append(np.sum((projected.reshape(-1, 2) - corners[i]) ** 2, 1))
+                rCNn = -cv2.Rodrigues(rvec)[0].T @ tvec.reshape(3)
+                position.append(
+                    np.linalg.norm(rCNn - rCNn_true[i]) / np.linalg.norm(rCNn_true[i])
+                )
+            rms = np.sqrt(np.mean(np.concatenate(squared)))
+            print(
+                f"{method:<12}{'yes' if warm_start else 'no':>11}"
+                f"{1e6 * statistics.median(times):>11.1f}{rms:>11.4f}"
+                f"{max(position):>16.3g}{solver.n_restarted:>10}"
+            )
+
+
+if __name__ == "__main__":
+    app()
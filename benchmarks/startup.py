@@ -0,0 +1,90 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+import typer
+
+app = typer.Typer(add_completion=False)
+
+# Modules that must not be imported just to parse arguments or print --help
+HEAVY_MODULES = ["cv2", "numpy", "numba", "emoji", "rich.progress", "yaml"]
+
+
+def import_times(module: str) -> dict:
+    # Cumulative import time in microseconds of every module imported by
+    # `import module`, as reported by python -X importtime
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        cumulative = cumulative.strip()
+        if not cumulative.isdigit():
+            continue
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def help_wall_times(repeats: int) -> List[float]:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "validate_camera_calibration", "--help"],
+            capture_output=True,
+            check=True,
+            env=dict(os.environ, COLUMNS="80"),
+        )
+        times.append(time.perf_counter() - start)
+    return times
+
+
+@app.command()
+def main(
+    repeats: int = typer.Option(10, "--repeats", help="Number of --help runs."),
+    max_import_ms: float = typer.Option(
+        250.0, "--max_import_ms", help="Fail if importing __main__ takes longer."
+    ),
+    max_help_ms: float = typer.Option(
+        1000.0, "--max_help_ms", help="Fail if the median --help run takes longer."
+    ),
+):
+    module = "validate_camera_calibration.__main__"
+    times = import_times(module)
+    import_ms = times[module] / 1000
+    heavy = [m for m in HEAVY_MODULES if m in times]
+    print(f"import {module}: {import_ms:.1f} ms")
+    slowest = sorted(times.items(), key=lambda x: x[1], reverse=True)[1:6]
+    for name, us in slowest:
+        print(f"    {name}: {us / 1000:.1f} ms")
+
+    help_times = help_wall_times(repeats)
+    help_ms = 1000 * statistics.median(help_times)
+    print(
+        f"--help: {help_ms:.1f} ms median, {1000 * min(help_times):.1f} ms min "
+        f"over {repeats} runs"
+    )
+
+    failures = []
+    if heavy:
+        failures.append(f"heavy modules imported at start up: {', '.join(heavy)}")
+    if import_ms > max_import_ms:
+        failures.append(f"import took {import_ms:.1f} ms > {max_import_ms} ms")
+    if help_ms > max_help_ms:
+        failures.append(f"--help took {help_ms:.1f} ms > {max_help_ms} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    raise typer.Exit(code=1 if failures else 0)
+
+
+if __name__ == "__main__":
+    app()
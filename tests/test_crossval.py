@@ -0,0 +1,131 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from validate_camera_calibration.tools.crossval import (
+    LEAVE_ONE_OUT,
+    cross_validate,
+    fold_count,
+    fold_indices,
+)
+from validate_camera_calibration.tools.detectors import grid_points
+from validate_camera_calibration.tools.frames import FrameStore
+from validate_camera_calibration.tools.synthetic import (
+    random_board_poses,
+    synthetic_camera,
+)
+
+N_FRAMES = 10
+PATTERN_SIZE = (9, 6)
+GRID_SQUARE_SIZE = 0.03
+
+
+def noise_free_frames(camera, n_frames, seed=0):
+    # Corners projected exactly with the camera, with one frame without a
+    # grid among them, which cross-validation leaves out
+    rng = np.random.default_rng(seed)
+    rPNn = grid_points(PATTERN_SIZE, GRID_SQUARE_SIZE)
+    rvecs, tvecs = random_board_poses(
+        n_frames, PATTERN_SIZE, GRID_SQUARE_SIZE, camera, rng
+    )
+    frames = []
+    for i, (rvec, tvec) in enumerate(zip(rvecs, tvecs)):
+        corners, _ = cv2.projectPoints(rPNn, rvec, tvec, camera.Kc, camera.dist)
+        frames.append((f"frame_{i:06d}.png", (480, 640), corners))
+    frames.insert(3, ("blank.png", (480, 640), None))
+    return FrameStore.from_frames(frames, len(rPNn)), rPNn
+
+
+class TestFolds(unittest.TestCase):
+    def test_fold_count(self):
+        self.assertEqual(fold_count("5", 12), 5)
+        self.assertEqual(fold_count(LEAVE_ONE_OUT, 12), 12)
+        with self.assertRaises(AssertionError):
+            fold_count("1", 12)
+        with self.assertRaises(AssertionError):
+            fold_count("13", 12)
+
+    def test_fold_indices(self):
+        # Every frame is held out by exactly one fold, and the folds differ in
+        # size by at most one frame
+        for n_frames, n_folds in [(10, 2), (11, 3), (12, 5), (7, 7)]:
+            with self.subTest(n_frames=n_frames, n_folds=n_folds):
+                folds = fold_indices(n_frames, n_folds)
+                self.assertEqual(len(folds), n_folds)
+                sizes = [len(fold) for fold in folds]
+                self.assertLessEqual(max(sizes) - min(sizes), 1)
+                np.testing.assert_array_equal(
+                    np.sort(np.concatenate(folds)), np.arange(n_frames)
+                )
+                for fold in folds:
+                    np.testing.assert_array_equal(fold, np.sort(fold))
+
+    def test_deterministic(self):
+        for a, b in zip(fold_indices(20, 4, seed=1), fold_indices(20, 4, seed=1)):
+            np.testing.assert_array_equal(a, b)
+        self.assertFalse(
+            all(
+                np.array_equal(a, b)
+                for a, b in zip(fold_indices(20, 4, seed=1), fold_indices(20, 4))
+            )
+        )
+
+
+# Refitting on noise-free corners, stored as float32, gives back the camera
+# they were projected with, so the frames held out are predicted all but
+# exactly
+class TestCrossValidate(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.camera = synthetic_camera(640, 480)
+        cls.store, cls.rPNn = noise_free_frames(cls.camera, N_FRAMES)
+
+    def run_cross_validate(self, folds, workers=1):
+        return cross_validate(
+            self.store,
+            self.rPNn,
+            self.camera,
+            folds=folds,
+            workers=workers,
+            progress_bar=False,
+        )
+
+    def check_noise_free(self, result):
+        self.assertEqual(result.n_frames, N_FRAMES)
+        self.assertEqual(result.residuals.shape, (N_FRAMES, len(self.rPNn)))
+        rms, _, _ = result.held_out_statistics()
+        self.assertLess(rms, 1e-3)
+        np.testing.assert_allclose(
+            result.parameters,
+            np.broadcast_to(result.supplied, result.parameters.shape),
+            rtol=1e-4,
+            atol=1e-4,
+        )
+
+    def test_k_fold(self):
+        result = self.run_cross_validate("3")
+        self.assertEqual(result.n_folds, 3)
+        self.assertEqual(sorted(len(fold) for fold in result.folds), [3, 3, 4])
+        self.check_noise_free(result)
+        data = result.as_dict()
+        self.assertEqual(data["n_folds"], 3)
+        self.assertEqual(list(data["parameters"])[:4], ["fx", "fy", "cx", "cy"])
+
+    def test_leave_one_out(self):
+        result = self.run_cross_validate(LEAVE_ONE_OUT)
+        self.assertEqual(result.n_folds, N_FRAMES)
+        self.assertEqual([len(fold) for fold in result.folds], [1] * N_FRAMES)
+        self.check_noise_free(result)
+        self.assertIn("leave-one-out", repr(result))
+
+    def test_workers(self):
+        # Folds fitted in a process pool give the same result
+        single = self.run_cross_validate("4")
+        pool = self.run_cross_validate("4", workers=2)
+        np.testing.assert_array_equal(single.parameters, pool.parameters)
+        np.testing.assert_array_equal(single.residuals, pool.residuals)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from validate_camera_calibration.tools.detectors import create_detector
+from validate_camera_calibration.tools.image import Image
+from validate_camera_calibration.tools.synthetic import (
+    generate_dataset,
+    synthetic_camera,
+)
+
+IMAGE_WIDTH = 640
+IMAGE_HEIGHT = 480
+# Largest distance of a detected point to its true position [pix]
+MAX_POINT_ERROR = 0.5
+
+
+# Every detector finds the grid in each synthetic image, with its points
+# within a fraction of a pixel of the projection of their true positions
+class TestDetectors(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir_tmp = tempfile.TemporaryDirectory()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dir_tmp.cleanup()
+
+    def check_detector(self, name, grid_type, pattern_size):
+        dir_base = Path(os.path.join(self.dir_tmp.name, name))
+        dir_calibration = generate_dataset(
+            dir_base,
+            n_images=4,
+            image_width=IMAGE_WIDTH,
+            image_height=IMAGE_HEIGHT,
+            pattern_size=pattern_size,
+            grid_square_size=0.03,
+            grid_type=grid_type,
+        )
+        with np.load(os.path.join(dir_base, "ground_truth.npz")) as data:
+            ground_truth = {key: data[key] for key in data.files}
+        camera = synthetic_camera(IMAGE_WIDTH, IMAGE_HEIGHT)
+        detector = create_detector(name)
+        rPNn = detector.grid_points(pattern_size, 0.03)
+
+        for i, source_name in enumerate(ground_truth["source_names"]):
+            image = Image.from_file(os.path.join(dir_calibration, source_name))
+            image.detect_chessboard(pattern_size, detector=detector)
+            self.assertTrue(image.has_chessboard(), f"{name} missed {source_name}")
+
+            rQOi, _ = cv2.projectPoints(
+                rPNn,
+                ground_truth["rvecs"][i],
+                ground_truth["tvecs"][i],
+                camera.Kc,
+                camera.dist,
+            )
+            rQOi = rQOi.reshape(-1, 2)
+            corners = image.chess_board_corners.reshape(-1, 2)
+            # Symmetric grids may be found starting from the opposite corner
+            error = min(
+                np.max(np.linalg.norm(points - rQOi, axis=1))
+                for points in [corners, corners[::-1]]
+            )
+            self.assertLess(error, MAX_POINT_ERROR)
+
+    def test_classic(self):
+        self.check_detector("classic", "chessboard", (9, 6))
+
+    def test_sector_based(self):
+        self.check_detector("sb", "chessboard", (9, 6))
+
+    def test_circles(self):
+        self.check_detector("circles", "circles", (7, 5))
+
+    def test_asymmetric_circles(self):
+        self.check_detector("asymmetric_circles", "asymmetric_circles", (4, 11))
+
+    def test_unknown_parameters(self):
+        with self.assertRaises(AssertionError):
+            create_detector("classic", dict(not_a_parameter=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
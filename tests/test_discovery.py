@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from validate_camera_calibration.tools import validation
+from validate_camera_calibration.tools.discovery import (
+    FileDiscovery,
+    read_manifest,
+    scan_files,
+    verify_file,
+    verify_unread_file,
+)
+from validate_camera_calibration.tools.synthetic import generate_dataset
+
+
+def touch(dir_root, path, data=b""):
+    file_path = os.path.join(dir_root, path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "wb") as f:
+        f.write(data)
+
+
+def write_manifest(file_manifest, entries):
+    with open(file_manifest, "w") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+        f.write("\n")
+
+
+# A tree with images, a video, files of other types, and hidden files and
+# directories that are never listed
+class TestScanFiles(unittest.TestCase):
+    def setUp(self):
+        self.dir_tmp = tempfile.TemporaryDirectory()
+        self.dir_root = self.dir_tmp.name
+        for path in [
+            "a.png",
+            "b.JPG",
+            "notes.txt",
+            ".hidden.png",
+            "clip.mp4",
+            os.path.join("sub", "c.png"),
+            os.path.join("sub", "deeper", "d.png"),
+            os.path.join(".cache", "e.png"),
+        ]:
+            touch(self.dir_root, path)
+
+    def tearDown(self):
+        self.dir_tmp.cleanup()
+
+    def test_non_recursive(self):
+        self.assertEqual(
+            sorted(scan_files(self.dir_root, [".png", ".jpg"])), ["a.png", "b.JPG"]
+        )
+
+    def test_recursive(self):
+        self.assertEqual(
+            sorted(scan_files(self.dir_root, [".png"], recursive=True)),
+            [
+                "a.png",
+                os.path.join("sub", "c.png"),
+                os.path.join("sub", "deeper", "d.png"),
+            ],
+        )
+
+    def test_file_discovery(self):
+        discovery = FileDiscovery(self.dir_root, recursive=True)
+        image_files, video_files = discovery.collect()
+        self.assertEqual(
+            image_files,
+            sorted(
+                [
+                    "a.png",
+                    "b.JPG",
+                    os.path.join("sub", "c.png"),
+                    os.path.join("sub", "deeper", "d.png"),
+                ]
+            ),
+        )
+        self.assertEqual(video_files, ["clip.mp4"])
+        self.assertFalse(discovery.ordered)
+        self.assertEqual(discovery.checksums, dict())
+
+    def test_unique_names(self):
+        touch(self.dir_root, os.path.join("other", "a.png"))
+        self.assertEqual(
+            len(FileDiscovery(self.dir_root, recursive=True).collect()[0]), 5
+        )
+        with self.assertRaises(AssertionError) as context:
+            FileDiscovery(self.dir_root, recursive=True, unique_names=True).collect()
+        self.assertIn("a.png", str(context.exception))
+
+
+# Paths in a manifest are relative to it, and are listed in its order with the
+# size and sha256 it gives for them
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.dir_tmp = tempfile.TemporaryDirectory()
+        self.dir_root = os.path.join(self.dir_tmp.name, "images")
+        self.data = b"not really an image"
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+        for name in ["z.png", "a.png", "m.png"]:
+            touch(self.dir_root, name, self.data)
+        self.file_manifest = os.path.join(self.dir_tmp.name, "manifest.jsonl")
+        write_manifest(
+            self.file_manifest,
+            [
+                {"path": os.path.join("images", "z.png"), "size": len(self.data)},
+                {"path": os.path.join("images", "a.png"), "sha256": self.sha256},
+                {"path": os.path.join("images", "m.png")},
+            ],
+        )
+
+    def tearDown(self):
+        self.dir_tmp.cleanup()
+
+    def test_read_manifest(self):
+        self.assertEqual(
+            list(read_manifest(self.file_manifest)),
+            [
+                (os.path.join(self.dir_root, "z.png"), (len(self.data), None)),
+                (os.path.join(self.dir_root, "a.png"), (None, self.sha256)),
+                (os.path.join(self.dir_root, "m.png"), (None, None)),
+            ],
+        )
+
+    def test_manifest_order(self):
+        discovery = FileDiscovery(self.dir_root, file_manifest=self.file_manifest)
+        image_files, video_files = discovery.collect()
+        self.assertTrue(discovery.ordered)
+        self.assertEqual(image_files, ["z.png", "a.png", "m.png"])
+        self.assertEqual(video_files, [])
+        self.assertEqual(
+            discovery.checksums[os.path.join(self.dir_root, "a.png")],
+            (None, self.sha256),
+        )
+
+    def test_verify_file(self):
+        file_path = os.path.join(self.dir_root, "a.png")
+        verify_file(file_path, self.data, (len(self.data), self.sha256.upper()))
+        with self.assertRaises(AssertionError):
+            verify_file(file_path, self.data, (len(self.data) + 1, None))
+        with self.assertRaises(AssertionError):
+            verify_file(file_path, self.data, (None, "0" * 64))
+
+    def test_verify_unread_file(self):
+        file_path = os.path.join(self.dir_root, "a.png")
+        verify_unread_file(file_path, (len(self.data), self.sha256))
+        with self.assertRaises(AssertionError):
+            verify_unread_file(file_path, (len(self.data) + 1, None))
+        with self.assertRaises(AssertionError):
+            verify_unread_file(file_path, (None, "0" * 64))
+
+
+# Images served from the detection cache are not read by the workers, they
+# are still checked against the manifest
+class TestCachedManifest(unittest.TestCase):
+    def setUp(self):
+        self.dir_tmp = tempfile.TemporaryDirectory()
+        self.dir_base = Path(self.dir_tmp.name)
+        self.dir_calibration = generate_dataset(
+            self.dir_base, n_images=3, image_width=640, image_height=480
+        )
+        self.image_paths = sorted(
+            Path(self.dir_calibration).glob("*.png"), key=lambda path: path.name
+        )
+        self.file_manifest = os.path.join(self.dir_base, "manifest.jsonl")
+
+    def tearDown(self):
+        self.dir_tmp.cleanup()
+
+    def run_validate(self, entries):
+        write_manifest(self.file_manifest, entries)
+        return validation.validate(
+            self.dir_base,
+            self.dir_calibration,
+            bootstrap_resamples=10,
+            file_manifest=self.file_manifest,
+        )
+
+    def entries(self, sha256=False, corrupt=None):
+        # One entry per image, the one named corrupt listed with a size, or
+        # with sha256 a digest, that it does not have
+        entries = []
+        for image_path in self.image_paths:
+            data = image_path.read_bytes()
+            entry = dict(
+                path=os.path.relpath(image_path, self.dir_base), size=len(data)
+            )
+            if sha256:
+                entry["sha256"] = hashlib.sha256(data).hexdigest()
+            if image_path.name == corrupt:
+                if sha256:
+                    entry["sha256"] = "0" * 64
+                else:
+                    entry["size"] += 1
+            entries.append(entry)
+        return entries
+
+    def test_cached_size(self):
+        self.run_validate(self.entries())
+        warm = self.run_validate(self.entries())
+        self.assertEqual(warm.timer.stages.get("detect", dict()).get("frames", 0), 0)
+        with self.assertRaises(AssertionError) as context:
+            self.run_validate(self.entries(corrupt=self.image_paths[1].name))
+        self.assertIn("bytes as listed in the manifest", str(context.exception))
+
+    def test_cached_sha256(self):
+        self.run_validate(self.entries(sha256=True))
+        warm = self.run_validate(self.entries(sha256=True))
+        self.assertEqual(warm.timer.stages.get("detect", dict()).get("frames", 0), 0)
+        with self.assertRaises(AssertionError) as context:
+            self.run_validate(
+                self.entries(sha256=True, corrupt=self.image_paths[1].name)
+            )
+        self.assertIn("sha256", str(context.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
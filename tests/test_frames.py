@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from validate_camera_calibration.tools.frames import FrameStore
+
+N_POINTS = 54
+
+
+def make_frames(n_frames, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(n_frames):
+        corners = None
+        if i % 3 != 0:
+            corners = rng.uniform(0, 640, size=(N_POINTS, 1, 2)).astype(np.float32)
+        frames.append((f"frame_{i:06d}.png", (480, 640, 3), corners))
+    return frames
+
+
+class TestFrameStore(unittest.TestCase):
+    def check_frames(self, store, frames):
+        self.assertEqual(len(store), len(frames))
+        self.assertEqual(store.source_names, [name for name, _, _ in frames])
+        for i, (_, shape, corners) in enumerate(frames):
+            np.testing.assert_array_equal(store.shapes[i], shape[:2])
+            self.assertEqual(store.detected[i], corners is not None)
+            if corners is not None:
+                np.testing.assert_array_equal(store.corners[i], corners.reshape(-1, 2))
+
+    def test_grow(self):
+        frames = make_frames(11)
+        store = FrameStore.from_frames(frames, N_POINTS, capacity=2)
+        self.check_frames(store, frames)
+        self.assertEqual(store.n_detected, 7)
+
+    def test_memmap_reopen(self):
+        frames = make_frames(11)
+        with tempfile.TemporaryDirectory() as dir_memmap:
+            store = FrameStore.from_frames(
+                frames, N_POINTS, capacity=2, dir_memmap=dir_memmap
+            )
+            self.check_frames(store, frames)
+            store.rvecs[:] = np.arange(33).reshape(11, 3)
+            store.rms[:] = np.arange(11)
+            store.flush()
+            self.assertTrue(os.path.isfile(os.path.join(dir_memmap, "frames.json")))
+            del store
+
+            store = FrameStore.open(dir_memmap)
+            self.check_frames(store, frames)
+            np.testing.assert_array_equal(store.rvecs, np.arange(33).reshape(11, 3))
+            np.testing.assert_array_equal(store.rms, np.arange(11))
+
+            # Rows appended after reopening grow the mapped files again
+            more = make_frames(6, seed=1)
+            for frame in more:
+                store.append(*frame)
+            store.flush()
+            del store
+            self.check_frames(FrameStore.open(dir_memmap), frames + more)
+
+    def test_reorder(self):
+        frames = make_frames(6)
+        store = FrameStore.from_frames(frames, N_POINTS)
+        permutation = np.array([5, 3, 1, 0, 2, 4])
+        store.reorder(permutation)
+        self.check_frames(store, [frames[i] for i in permutation])
+
+    def test_from_columns(self):
+        frames = make_frames(5)
+        store = FrameStore.from_frames(frames, N_POINTS)
+        copy = FrameStore.from_columns(store.source_names, store.columns())
+        self.check_frames(copy, frames)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+import validate_camera_calibration.tools.yaml_utils as yu
+from validate_camera_calibration.tools.frames import FrameStore
+from validate_camera_calibration.tools.poses import (
+    export_poses,
+    load_poses,
+    supported_pose_formats,
+)
+
+N_FRAMES = 5
+N_POINTS = 54
+
+
+def make_store():
+    # Frames with poses and residuals, of which the second has no grid
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(N_FRAMES):
+        corners = None
+        if i != 1:
+            corners = rng.uniform(0, 640, size=(N_POINTS, 1, 2))
+        frames.append((f"sub/frame_{i:06d}.png", (480, 640), corners))
+    store = FrameStore.from_frames(frames, N_POINTS)
+    store.rvecs[:] = rng.uniform(-0.5, 0.5, size=(N_FRAMES, 3))
+    store.tvecs[:] = rng.uniform(-0.2, 0.2, size=(N_FRAMES, 3)) + [0, 0, 1]
+    store.residuals[:] = rng.uniform(0, 0.1, size=(N_FRAMES, N_POINTS))
+    store.rms[:] = np.sqrt(np.mean(store.residuals**2, axis=1))
+    return store
+
+
+def rvecs_tvecs(Rnc, rCNn):
+    # Inverse of FrameStore.rotation_matrices and camera_positions
+    Rcn = np.transpose(Rnc, (0, 2, 1))
+    rvecs = np.array([cv2.Rodrigues(R)[0].ravel() for R in Rcn])
+    tvecs = -np.einsum("nij,nj->ni", Rcn, rCNn)
+    return rvecs, tvecs
+
+
+# Poses exported in every format load back as the poses of the detected frames
+class TestPoses(unittest.TestCase):
+    def setUp(self):
+        self.dir_tmp = tempfile.TemporaryDirectory()
+        self.dir_poses = Path(self.dir_tmp.name)
+        self.store = make_store()
+        self.indices = self.store.detected_indices()
+        self.names = [Path(self.store.source_names[i]).name for i in self.indices]
+
+    def tearDown(self):
+        self.dir_tmp.cleanup()
+
+    def check_poses(self, names, rvecs, tvecs, rms):
+        self.assertEqual(list(names), self.names)
+        np.testing.assert_allclose(rvecs, self.store.rvecs[self.indices], atol=1e-12)
+        np.testing.assert_allclose(tvecs, self.store.tvecs[self.indices], atol=1e-12)
+        np.testing.assert_allclose(rms, self.store.rms[self.indices], rtol=1e-15)
+
+    def test_round_trip(self):
+        for poses_format in ["npz", "jsonl"]:
+            with self.subTest(poses_format=poses_format):
+                export_poses(self.store, self.dir_poses, poses_format)
+                data = load_poses(os.path.join(self.dir_poses, f"poses.{poses_format}"))
+                self.check_poses(
+                    data["source_names"],
+                    *rvecs_tvecs(data["Rnc"], data["rCNn"]),
+                    data["reprojection_rms"],
+                )
+                np.testing.assert_array_equal(
+                    data["reprojection_errors"], self.store.residuals[self.indices]
+                )
+
+    def test_yaml(self):
+        # One file per pose, which load_poses does not read
+        export_poses(self.store, self.dir_poses, "yaml")
+        Rnc, rCNn, rms = [], [], []
+        for name in self.names:
+            file_pose = os.path.join(self.dir_poses, f"pose_{Path(name).stem}.yaml")
+            with open(file_pose) as f:
+                pose = yaml.safe_load(f)
+            Rnc.append(yu.yaml_to_numpy(pose["Rnc"]))
+            rCNn.append(yu.yaml_to_numpy(pose["rCNn"]).ravel())
+            rms.append(pose["reprojection_error"])
+        self.assertEqual(len(os.listdir(self.dir_poses)), len(self.names))
+        self.check_poses(self.names, *rvecs_tvecs(np.array(Rnc), np.array(rCNn)), rms)
+
+    def test_formats(self):
+        self.assertEqual(supported_pose_formats(), ["yaml", "npz", "jsonl"])
+        with self.assertRaises(AssertionError):
+            export_poses(self.store, self.dir_poses, "csv")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from validate_camera_calibration.tools.detectors import grid_points
+from validate_camera_calibration.tools.projection import (
+    project_points_batch,
+    projection_backends,
+    rodrigues_batch,
+)
+
+N_FRAMES = 20
+KC = np.array([[820.0, 0.0, 331.5], [0.0, 815.0, 238.25], [0.0, 0.0, 1.0]])
+# k1, k2, p1, p2, k3
+DIST = np.array([-0.28, 0.11, 1.2e-3, -8e-4, -0.021])
+MAX_DIFFERENCE = 1e-9
+
+
+def random_poses(n_frames, seed=0):
+    # Boards in front of the camera, tilted by up to about 35 degrees, with
+    # one pose without any rotation
+    rng = np.random.default_rng(seed)
+    rvecs = rng.uniform(-0.6, 0.6, size=(n_frames, 3))
+    rvecs[0] = 0.0
+    tvecs = np.column_stack(
+        [
+            rng.uniform(-0.15, 0.05, n_frames),
+            rng.uniform(-0.1, 0.05, n_frames),
+            rng.uniform(0.4, 1.2, n_frames),
+        ]
+    )
+    return rvecs, tvecs
+
+
+def project_opencv(rPNn, rvecs, tvecs, Kc, dist):
+    return np.stack(
+        [
+            cv2.projectPoints(rPNn, rvec, tvec, Kc, dist)[0].reshape(-1, 2)
+            for rvec, tvec in zip(rvecs, tvecs)
+        ]
+    )
+
+
+# The batched Brown-Conrady kernels must project exactly as cv2.projectPoints
+class TestProjection(unittest.TestCase):
+    def setUp(self):
+        self.rPNn = grid_points((9, 6), 0.03)
+        self.rvecs, self.tvecs = random_poses(N_FRAMES)
+        self.expected = project_opencv(self.rPNn, self.rvecs, self.tvecs, KC, DIST)
+
+    def check_backend(self, backend):
+        rQOi = project_points_batch(
+            self.rPNn, self.rvecs, self.tvecs, KC, DIST, backend=backend
+        )
+        self.assertEqual(rQOi.shape, (N_FRAMES, len(self.rPNn), 2))
+        np.testing.assert_allclose(rQOi, self.expected, rtol=0, atol=MAX_DIFFERENCE)
+
+    def test_numpy(self):
+        self.check_backend("numpy")
+
+    @unittest.skipUnless("numba" in projection_backends(), "numba is not installed")
+    def test_numba(self):
+        self.check_backend("numba")
+
+    def test_opencv(self):
+        self.check_backend("opencv")
+
+    def test_rodrigues(self):
+        R = rodrigues_batch(self.rvecs)
+        for rvec, R_n in zip(self.rvecs, R):
+            np.testing.assert_allclose(R_n, cv2.Rodrigues(rvec)[0], atol=1e-12)
+
+    def test_higher_order_distortion(self):
+        # Rational terms are left to OpenCV by every backend
+        dist = np.concatenate([DIST, [0.01, 0.002, -0.001]])
+        expected = project_opencv(self.rPNn, self.rvecs, self.tvecs, KC, dist)
+        rQOi = project_points_batch(
+            self.rPNn, self.rvecs, self.tvecs, KC, dist, backend="numpy"
+        )
+        np.testing.assert_allclose(rQOi, expected, rtol=0, atol=MAX_DIFFERENCE)
+
+
+if __name__ == "__main__":
+    unittest.main()
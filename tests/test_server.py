@@ -0,0 +1,182 @@
+import http.client
+import json
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from validate_camera_calibration.tools.server import ValidationService, create_server
+from validate_camera_calibration.tools.synthetic import generate_dataset
+from validate_camera_calibration.tools.validation import load_calibration_setup
+
+N_IMAGES = 3
+
+
+# Runs the service on a free localhost port on a thread, and talks to it over
+# http as a client would
+class TestServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir_tmp = tempfile.TemporaryDirectory()
+        cls.dir_base = Path(cls.dir_tmp.name)
+        cls.dir_calibration = generate_dataset(
+            cls.dir_base,
+            n_images=N_IMAGES,
+            image_width=640,
+            image_height=480,
+            n_blank_images=1,
+        )
+        with np.load(os.path.join(cls.dir_base, "ground_truth.npz")) as data:
+            cls.source_names = [str(name) for name in data["source_names"]]
+        camera, pattern_size, rPNn, detector = load_calibration_setup(
+            cls.dir_calibration
+        )
+        cls.service = ValidationService(
+            camera,
+            pattern_size,
+            rPNn,
+            detector,
+            dir_base=cls.dir_calibration,
+            dir_undistorted=Path(os.path.join(cls.dir_base, "undistorted")),
+        )
+        cls.service.start()
+        cls.server = create_server(cls.service, "127.0.0.1", 0)
+        cls.host, cls.port = cls.server.server_address[:2]
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.thread.join()
+        cls.service.close()
+        cls.dir_tmp.cleanup()
+
+    def request(self, method, path, body=None, content_type="application/json"):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        try:
+            headers = dict() if body is None else {"Content-Type": content_type}
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+    def post_paths(self, paths, **fields):
+        body = json.dumps(dict(paths=paths, **fields)).encode()
+        return self.request("POST", "/frames", body)
+
+    def test_image_bytes(self):
+        with open(os.path.join(self.dir_calibration, self.source_names[0]), "rb") as f:
+            data = f.read()
+        status, response = self.request(
+            "POST", "/frames?name=posted.png", data, "image/png"
+        )
+        self.assertEqual(status, 200)
+        (frame,) = response["frames"]
+        self.assertEqual(frame["name"], "posted.png")
+        self.assertTrue(frame["detected"])
+        self.assertEqual(len(frame["corners"]), 54)
+        self.assertLess(frame["reprojection_rms"], 0.1)
+
+    def test_paths(self):
+        status, response = self.post_paths(self.source_names + ["blank_000000.png"])
+        self.assertEqual(status, 200)
+        frames = response["frames"]
+        self.assertEqual(
+            [Path(frame["name"]).name for frame in frames],
+            self.source_names + ["blank_000000.png"],
+        )
+        self.assertEqual([frame["detected"] for frame in frames], [True] * 3 + [False])
+
+    def test_missing_file(self):
+        # A frame that fails gets an error, the others are still answered
+        status, response = self.post_paths(["missing.png", self.source_names[0]])
+        self.assertEqual(status, 200)
+        self.assertIn("error", response["frames"][0])
+        self.assertTrue(response["frames"][1]["detected"])
+
+    def test_bad_requests(self):
+        status, response = self.request("POST", "/frames", b"{}")
+        self.assertEqual(status, 400)
+        status, _ = self.request("POST", "/frames", b"not json")
+        self.assertEqual(status, 400)
+        status, _ = self.request("GET", "/nothing")
+        self.assertEqual(status, 404)
+
+    def test_bad_content_length(self):
+        # Answered with a json error, and the connection is closed after it
+        for length in ["abc", "-5", "1.5"]:
+            with self.subTest(length=length):
+                connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=30
+                )
+                try:
+                    connection.putrequest("POST", "/frames")
+                    connection.putheader("Content-Type", "image/png")
+                    connection.putheader("Content-Length", length)
+                    connection.endheaders()
+                    response = connection.getresponse()
+                    self.assertEqual(response.status, 400)
+                    self.assertIn(
+                        "Content-Length", json.loads(response.read())["error"]
+                    )
+                    self.assertEqual(response.getheader("Connection"), "close")
+                finally:
+                    connection.close()
+
+    def test_undistorted_dir(self):
+        status, _ = self.post_paths(self.source_names[:1], undistorted_dir="session")
+        self.assertEqual(status, 200)
+        self.assertTrue(
+            os.path.isfile(
+                os.path.join(
+                    self.dir_base, "undistorted", "session", self.source_names[0]
+                )
+            )
+        )
+
+    def test_undistorted_dir_outside(self):
+        # Nothing is written outside of the service's undistorted directory
+        for dir_undistorted in ["../escaped", os.path.join(self.dir_base, "escaped")]:
+            status, response = self.post_paths(
+                self.source_names[:1], undistorted_dir=dir_undistorted
+            )
+            self.assertEqual(status, 400)
+            self.assertIn("Expected undistorted_dir", response["error"])
+        self.assertFalse(os.path.exists(os.path.join(self.dir_base, "escaped")))
+
+    def test_internal_error(self):
+        # An error outside of the frames, here creating the undistorted
+        # directory inside a file, is answered with a json error
+        Path(os.path.join(self.dir_base, "undistorted")).mkdir(exist_ok=True)
+        Path(os.path.join(self.dir_base, "undistorted", "file")).touch()
+        status, response = self.post_paths(
+            self.source_names[:1], undistorted_dir="file/session"
+        )
+        self.assertEqual(status, 500)
+        self.assertIn("error", response)
+
+    def test_status_and_metrics(self):
+        self.post_paths(self.source_names)
+        status, response = self.request("GET", "/status")
+        self.assertEqual(status, 200)
+        self.assertEqual(response["status"], "ok")
+        self.assertEqual(response["pattern_size"], [9, 6])
+        self.assertEqual(response["camera"]["image_width"], 640)
+
+        status, metrics = self.request("GET", "/metrics")
+        self.assertEqual(status, 200)
+        self.assertGreaterEqual(metrics["frames"], N_IMAGES)
+        self.assertGreaterEqual(metrics["detected"], N_IMAGES)
+        self.assertEqual(metrics["queue_depth"], 0)
+        self.assertIn("p50", metrics["latency_ms"])
+        self.assertIn("detect", metrics["stages"])
+
+
+if __name__ == "__main__":
+    unittest.main()
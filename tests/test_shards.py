@@ -0,0 +1,177 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from validate_camera_calibration.tools import validation
+from validate_camera_calibration.tools.frames import FrameStore
+from validate_camera_calibration.tools.shards import (
+    find_partial_files,
+    frame_order,
+    merge_partials,
+    partial_file_name,
+    save_partial,
+    shard_range,
+)
+from validate_camera_calibration.tools.synthetic import generate_dataset
+
+N_IMAGES = 7
+N_SHARDS = 3
+N_POINTS = 54
+DIR_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Shards of a run, each in its own process as on separate machines, merged
+# must give exactly the frames and results of a run without shards
+class TestShards(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir_tmp = tempfile.TemporaryDirectory()
+        cls.dir_base = Path(cls.dir_tmp.name)
+        cls.dir_calibration = generate_dataset(
+            cls.dir_base,
+            n_images=N_IMAGES,
+            image_width=640,
+            image_height=480,
+            n_blank_images=2,
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dir_tmp.cleanup()
+
+    def run_shards(self):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            [DIR_REPO] + [p for p in [env.get("PYTHONPATH")] if p]
+        )
+        processes = [
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "validate_camera_calibration",
+                    str(self.dir_base),
+                    "--shard",
+                    f"{index}/{N_SHARDS}",
+                    "--workers",
+                    "1",
+                    "--no_cache",
+                ],
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            )
+            for index in range(1, N_SHARDS + 1)
+        ]
+        for process in processes:
+            output, _ = process.communicate(timeout=300)
+            self.assertEqual(process.returncode, 0, output.decode())
+
+    def test_merge_is_identical(self):
+        self.run_shards()
+        self.assertEqual(len(find_partial_files(self.dir_base)), N_SHARDS)
+        merged = validation.merge(self.dir_base, bootstrap_resamples=200)
+        single = validation.validate(
+            self.dir_base,
+            self.dir_calibration,
+            use_cache=False,
+            bootstrap_resamples=200,
+        )
+        self.assertEqual(merged.source_names, single.source_names)
+        merged_columns = merged.store.columns()
+        for name, column in single.store.columns().items():
+            np.testing.assert_array_equal(merged_columns[name], column, err_msg=name)
+        self.assertEqual(merged.statistics, single.statistics)
+        np.testing.assert_array_equal(merged.intervals, single.intervals)
+
+
+def make_store(names, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = [
+        (name, (480, 640), rng.uniform(0, 640, size=(N_POINTS, 1, 2))) for name in names
+    ]
+    return FrameStore.from_frames(frames, N_POINTS)
+
+
+# merge_partials refuses partial results that do not make up one run
+class TestMergePartials(unittest.TestCase):
+    def setUp(self):
+        self.dir_tmp = tempfile.TemporaryDirectory()
+        self.names = [f"frame_{i:06d}.png" for i in range(8)]
+        self.metadata = dict(pattern_size=[9, 6], image_size=[640, 480])
+        self.arrays = dict(
+            Kc=np.array([[500.0, 0, 320], [0, 500.0, 240], [0, 0, 1]]),
+            dist=np.zeros(5),
+            rPNn=np.zeros((N_POINTS, 3)),
+        )
+
+    def tearDown(self):
+        self.dir_tmp.cleanup()
+
+    def save(self, shard, file_name=None, metadata=None, arrays=None):
+        indices = shard_range(len(self.names), shard)
+        file_path = Path(
+            os.path.join(self.dir_tmp.name, file_name or partial_file_name(shard))
+        )
+        save_partial(
+            file_path,
+            make_store([self.names[i] for i in indices], seed=shard[0]),
+            frame_order(indices, []),
+            dict(self.metadata, shard=list(shard), **(metadata or dict())),
+            dict(self.arrays, **(arrays or dict())),
+        )
+        return file_path
+
+    def assert_refused(self, file_paths, message):
+        with self.assertRaises(AssertionError) as context:
+            merge_partials(file_paths)
+        self.assertIn(message, str(context.exception))
+
+    def test_merge(self):
+        # The shards may be given in any order
+        file_paths = [self.save((i, 3)) for i in [3, 1, 2]]
+        store, setup, arrays = merge_partials(file_paths)
+        self.assertEqual(store.source_names, self.names)
+        self.assertEqual(setup["pattern_size"], [9, 6])
+        np.testing.assert_array_equal(arrays["Kc"], self.arrays["Kc"])
+
+    def test_different_camera(self):
+        Kc = self.arrays["Kc"].copy()
+        Kc[0, 0] += 1e-9
+        file_paths = [self.save((1, 2)), self.save((2, 2), arrays=dict(Kc=Kc))]
+        self.assert_refused(file_paths, "['Kc']")
+
+    def test_different_grid(self):
+        rPNn = np.full((N_POINTS, 3), 0.03)
+        file_paths = [
+            self.save((1, 2)),
+            self.save(
+                (2, 2), metadata=dict(pattern_size=[6, 9]), arrays=dict(rPNn=rPNn)
+            ),
+        ]
+        self.assert_refused(file_paths, "['pattern_size', 'rPNn']")
+
+    def test_different_shard_count(self):
+        file_paths = [self.save((1, 2)), self.save((2, 3))]
+        self.assert_refused(file_paths, "to be a shard of 2")
+
+    def test_duplicate_shard(self):
+        file_paths = [
+            self.save((1, 2)),
+            self.save((2, 2)),
+            self.save((2, 2), file_name="copy.npz"),
+        ]
+        self.assert_refused(file_paths, "Expected one partial result of shard 2/2")
+
+    def test_missing_shards(self):
+        file_paths = [self.save((1, 4)), self.save((3, 4))]
+        self.assert_refused(file_paths, "shards [2, 4] are missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+
+import numpy as np
+
+from validate_camera_calibration.tools.statistics import (
+    RunningStatistics,
+    bootstrap_intervals,
+)
+
+
+def numpy_statistics(samples):
+    samples = np.asarray(samples, dtype=float).ravel()
+    return np.sqrt(np.mean(samples**2)), np.mean(samples), np.std(samples)
+
+
+class TestRunningStatistics(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.frames = [rng.normal(0.3, 0.2, size=54) for _ in range(10)]
+
+    def test_empty(self):
+        statistics = RunningStatistics.from_samples([])
+        self.assertEqual(statistics.count, 0)
+        self.assertEqual(statistics.as_tuple(), (0.0, 0.0, 0.0))
+
+    def test_add(self):
+        statistics = RunningStatistics()
+        for frame in self.frames:
+            statistics = statistics + RunningStatistics.from_samples(frame)
+        self.assertEqual(statistics.count, 540)
+        np.testing.assert_allclose(
+            statistics.as_tuple(), numpy_statistics(self.frames), rtol=1e-12
+        )
+
+    def test_sub(self):
+        # Taking frames out again leaves the statistics of the others
+        statistics = RunningStatistics.from_samples(np.concatenate(self.frames))
+        for frame in self.frames[:4]:
+            statistics = statistics - RunningStatistics.from_samples(frame)
+        self.assertEqual(statistics.count, 324)
+        np.testing.assert_allclose(
+            statistics.as_tuple(), numpy_statistics(self.frames[4:]), rtol=1e-9
+        )
+        for frame in self.frames[4:]:
+            statistics = statistics - RunningStatistics.from_samples(frame)
+        self.assertEqual(statistics.count, 0)
+
+    def test_sub_too_many(self):
+        statistics = RunningStatistics.from_samples(self.frames[0])
+        with self.assertRaises(AssertionError):
+            statistics - RunningStatistics.from_samples(np.concatenate(self.frames))
+
+
+class TestBootstrapIntervals(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.reprojection_errors = np.abs(rng.normal(0.2, 0.1, size=(30, 54)))
+
+    def test_shape_and_order(self):
+        intervals = bootstrap_intervals(self.reprojection_errors, n_resamples=500)
+        self.assertEqual(intervals.shape, (3, 2))
+        self.assertTrue(np.all(intervals[:, 0] <= intervals[:, 1]))
+        # The intervals contain the statistics of the frames themselves
+        statistics = numpy_statistics(self.reprojection_errors)
+        self.assertTrue(np.all(intervals[:, 0] <= statistics))
+        self.assertTrue(np.all(statistics <= intervals[:, 1]))
+
+    def test_deterministic(self):
+        np.testing.assert_array_equal(
+            bootstrap_intervals(self.reprojection_errors, n_resamples=200, seed=3),
+            bootstrap_intervals(self.reprojection_errors, n_resamples=200, seed=3),
+        )
+
+    def test_blocks(self):
+        # Drawing the resamples in small blocks gives the same intervals
+        np.testing.assert_allclose(
+            bootstrap_intervals(self.reprojection_errors, n_resamples=200),
+            bootstrap_intervals(
+                self.reprojection_errors, n_resamples=200, max_elements=100
+            ),
+        )
+
+    def test_wider_with_confidence(self):
+        narrow = bootstrap_intervals(self.reprojection_errors, confidence=0.5)
+        wide = bootstrap_intervals(self.reprojection_errors, confidence=0.99)
+        self.assertTrue(np.all(np.diff(narrow, axis=1) < np.diff(wide, axis=1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
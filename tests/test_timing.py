@@ -0,0 +1,45 @@
+import json
+import os
+import tempfile
+import unittest
+
+from validate_camera_calibration.tools.timing import StageTimer
+
+
+class TestStageTimer(unittest.TestCase):
+    def setUp(self):
+        self.dir_tmp = tempfile.TemporaryDirectory()
+        self.timer = StageTimer()
+        self.timer.add("detect", 2.0, frames=4)
+        with self.timer.measure("total", frames=4):
+            pass
+
+    def tearDown(self):
+        self.dir_tmp.cleanup()
+
+    def check_file(self, file_path):
+        with open(file_path) as f:
+            data = json.load(f)
+        self.assertEqual(list(data), ["detect", "total"])
+        self.assertEqual(data["detect"]["frames_per_second"], 2.0)
+        self.assertTrue(data["detect"]["summed_over_workers"])
+
+    def test_to_file(self):
+        # Paths are kept as given, only one without an extension gets .json
+        for name, written in [
+            ("timings", "timings.json"),
+            ("timings.json", "timings.json"),
+            ("timings.txt", "timings.txt"),
+            (os.path.join("run.1", "timings"), os.path.join("run.1", "timings.json")),
+        ]:
+            with self.subTest(name=name):
+                os.makedirs(os.path.join(self.dir_tmp.name, "run.1"), exist_ok=True)
+                file_path = self.timer.to_file(os.path.join(self.dir_tmp.name, name))
+                self.assertEqual(
+                    str(file_path), os.path.join(self.dir_tmp.name, written)
+                )
+                self.check_file(file_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+from validate_camera_calibration.tools import validation
+from validate_camera_calibration.tools.cache import cache_directory
+from validate_camera_calibration.tools.synthetic import generate_dataset
+
+N_IMAGES = 6
+PATTERN_SIZE = (9, 6)
+GRID_SQUARE_SIZE = 0.03
+
+
+def pose_errors(poses, ground_truth):
+    # Camera position error relative to the distance to the grid, and
+    # orientation error [deg], of every pose. The grid is symmetric under a
+    # 180 degree rotation about its normal, so each pose is compared to the
+    # closer of the two equivalent board frames.
+    names = list(ground_truth["source_names"])
+    index = [names.index(name) for name in poses["source_names"]]
+    rCNn_true = ground_truth["rCNn"][index]
+    Rnc_true = ground_truth["Rnc"][index]
+    rLNn = np.array([*(np.array(PATTERN_SIZE) - 1) * GRID_SQUARE_SIZE, 0.0])
+    flip = np.diag([-1.0, -1.0, 1.0])
+
+    position = np.full(len(index), np.inf)
+    rotation = np.full(len(index), np.inf)
+    for rCNn, Rnc in [
+        (rCNn_true, Rnc_true),
+        ((rCNn_true - rLNn) @ flip, flip @ Rnc_true),
+    ]:
+        dp = np.linalg.norm(poses["rCNn"] - rCNn, axis=1)
+        dR = np.einsum("nji,njk->nik", poses["Rnc"], Rnc)
+        cos = np.clip((np.trace(dR, axis1=1, axis2=2) - 1) / 2, -1, 1)
+        better = dp < position
+        position[better] = dp[better]
+        rotation[better] = np.degrees(np.arccos(cos))[better]
+    return position / np.linalg.norm(rCNn_true, axis=1), rotation
+
+
+# Runs the whole pipeline on a synthetic dataset rendered with the calibration
+# it is validated against, so the poses must match the true board poses and
+# the reprojection errors are down to the detection noise
+class TestValidate(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir_tmp = tempfile.TemporaryDirectory()
+        cls.dir_base = Path(cls.dir_tmp.name)
+        cls.dir_calibration = generate_dataset(
+            cls.dir_base,
+            n_images=N_IMAGES,
+            image_width=640,
+            image_height=480,
+            pattern_size=PATTERN_SIZE,
+            grid_square_size=GRID_SQUARE_SIZE,
+            n_blank_images=1,
+        )
+        with np.load(os.path.join(cls.dir_base, "ground_truth.npz")) as data:
+            cls.ground_truth = {key: data[key] for key in data.files}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dir_tmp.cleanup()
+
+    def run_validate(self, **kwargs):
+        return validation.validate(
+            self.dir_base,
+            self.dir_calibration,
+            use_cache=False,
+            bootstrap_resamples=200,
+            **kwargs,
+        )
+
+    def test_against_ground_truth(self):
+        result = self.run_validate()
+        self.assertEqual(result.n_frames, N_IMAGES + 1)
+        self.assertEqual(result.n_poses, N_IMAGES)
+        self.assertLess(result.rms, 0.1)
+        poses = result.poses()
+        np.testing.assert_allclose(
+            result.rms, np.sqrt(np.mean(poses["reprojection_errors"] ** 2))
+        )
+        position, rotation = pose_errors(poses, self.ground_truth)
+        self.assertLess(np.max(position), 1e-3)
+        self.assertLess(np.max(rotation), 0.1)
+        self.assertLessEqual(result.intervals[0, 0], result.rms)
+        self.assertLessEqual(result.rms, result.intervals[0, 1])
+
+    def test_workers(self):
+        # Detection in a process pool gives the same frames in the same order
+        single = self.run_validate(workers=1)
+        pool = self.run_validate(workers=2)
+        self.assertEqual(single.source_names, pool.source_names)
+        np.testing.assert_array_equal(single.store.corners, pool.store.corners)
+        self.assertEqual(single.rms, pool.rms)
+
+    def test_validate_frames(self):
+        # Frames in memory give the statistics of the files they were read from
+        files = self.run_validate()
+        camera, _, _, _ = validation.load_calibration_setup(self.dir_calibration)
+        with open(
+            os.path.join(self.dir_calibration, "calibration_grid_params.yaml")
+        ) as f:
+            calibration_grid = yaml.safe_load(f)
+        frames = [
+            cv2.imread(os.path.join(self.dir_calibration, name), cv2.IMREAD_GRAYSCALE)
+            for name in files.source_names
+        ]
+        memory = validation.validate_frames(
+            frames, camera, calibration_grid, bootstrap_resamples=200
+        )
+        self.assertEqual(memory.n_frames, files.n_frames)
+        np.testing.assert_array_equal(memory.detected, files.detected)
+        np.testing.assert_array_equal(memory.store.corners, files.store.corners)
+        self.assertEqual(memory.statistics, files.statistics)
+        np.testing.assert_array_equal(memory.intervals, files.intervals)
+
+    def test_evaluate_frames(self):
+        # Solving the poses of the detected frames again gives the same result
+        files = self.run_validate()
+        camera, pattern_size, rPNn, detector = validation.load_calibration_setup(
+            self.dir_calibration
+        )
+        store = files.store.select(np.arange(files.n_frames))
+        store.rvecs[:] = 0.0
+        store.tvecs[:] = 0.0
+        result = validation.evaluate_frames(
+            store,
+            camera,
+            pattern_size,
+            rPNn,
+            detector,
+            bootstrap_resamples=200,
+            progress_bar=False,
+        )
+        np.testing.assert_array_equal(result.store.rvecs, files.store.rvecs)
+        np.testing.assert_array_equal(result.store.residuals, files.store.residuals)
+        self.assertEqual(result.statistics, files.statistics)
+        np.testing.assert_array_equal(result.intervals, files.intervals)
+
+    def test_exported_poses(self):
+        self.run_validate(export_poses=True, poses_format="npz")
+        with np.load(os.path.join(self.dir_base, "poses", "poses.npz")) as data:
+            poses = {key: data[key] for key in data.files}
+        self.assertEqual(len(poses["source_names"]), N_IMAGES)
+        position, rotation = pose_errors(poses, self.ground_truth)
+        self.assertLess(np.max(position), 1e-3)
+        self.assertLess(np.max(rotation), 0.1)
+
+
+def detected_frames(result):
+    # Frames that went through detection rather than coming from the cache
+    return result.timer.stages.get("detect", dict()).get("frames", 0)
+
+
+# The detection cache serves unchanged images on a warm run, and is keyed by
+# file size, modification time and the detection parameters
+class TestDetectionCache(unittest.TestCase):
+    def setUp(self):
+        self.dir_tmp = tempfile.TemporaryDirectory()
+        self.dir_base = Path(self.dir_tmp.name)
+        self.dir_calibration = generate_dataset(
+            self.dir_base, n_images=3, image_width=640, image_height=480
+        )
+        self.image_paths = sorted(
+            Path(self.dir_calibration).glob("*.png"), key=lambda path: path.name
+        )
+
+    def tearDown(self):
+        self.dir_tmp.cleanup()
+
+    def run_validate(self, **kwargs):
+        return validation.validate(
+            self.dir_base, self.dir_calibration, bootstrap_resamples=10, **kwargs
+        )
+
+    def cache_files(self):
+        return sorted(Path(cache_directory(self.dir_base)).glob("*.npz"))
+
+    def test_warm_run(self):
+        cold = self.run_validate()
+        self.assertEqual(detected_frames(cold), 3)
+        warm = self.run_validate()
+        self.assertEqual(detected_frames(warm), 0)
+        self.assertEqual(warm.source_names, cold.source_names)
+        np.testing.assert_array_equal(warm.store.corners, cold.store.corners)
+        self.assertEqual(len(self.cache_files()), 1)
+
+    def test_changed_mtime(self):
+        self.run_validate()
+        stat = os.stat(self.image_paths[1])
+        os.utime(self.image_paths[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertEqual(detected_frames(self.run_validate()), 1)
+        self.assertEqual(detected_frames(self.run_validate()), 0)
+
+    def test_changed_size(self):
+        # The same pixels written with another compression, at the old time
+        self.run_validate()
+        image_path = self.image_paths[0]
+        stat = os.stat(image_path)
+        img = cv2.imread(str(image_path), cv2.IMREAD_UNCHANGED)
+        cv2.imwrite(str(image_path), img, [cv2.IMWRITE_PNG_COMPRESSION, 0])
+        os.utime(image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertNotEqual(os.stat(image_path).st_size, stat.st_size)
+        self.assertEqual(detected_frames(self.run_validate()), 1)
+
+    def test_changed_params(self):
+        # Each setting that changes the corners gets its own cache file
+        self.run_validate()
+        for kwargs in [
+            dict(detection_scale=0.5),
+            dict(detector_name="sb"),
+            dict(export_undistorted_images=True),
+        ]:
+            with self.subTest(**kwargs):
+                n_files = len(self.cache_files())
+                self.assertGreater(detected_frames(self.run_validate(**kwargs)), 0)
+                self.assertEqual(len(self.cache_files()), n_files + 1)
+                self.assertEqual(detected_frames(self.run_validate(**kwargs)), 0)
+        self.assertEqual(detected_frames(self.run_validate()), 0)
+
+    def test_prune_removed_files(self):
+        self.run_validate()
+        (file_cache,) = self.cache_files()
+        os.remove(self.image_paths[0])
+        self.assertEqual(detected_frames(self.run_validate()), 0)
+        with np.load(file_cache) as data:
+            names = sorted(Path(name).name for name in data["names"])
+        self.assertEqual(names, [path.name for path in self.image_paths[1:]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+import numpy as np
+
+from validate_camera_calibration.tools.frames import FrameStore
+from validate_camera_calibration.tools.statistics import RunningStatistics
+from validate_camera_calibration.tools.watch import WatchState
+
+N_POINTS = 54
+N_IMAGES = 4
+
+
+def make_frames(names, seed):
+    # Frames as _process adds them, with residuals that differ on every poll
+    rng = np.random.default_rng(seed)
+    frames = [
+        (name, (480, 640), rng.uniform(0, 640, size=(N_POINTS, 1, 2))) for name in names
+    ]
+    store = FrameStore.from_frames(frames, N_POINTS)
+    store.residuals[:] = rng.uniform(0, 0.1, size=(len(names), N_POINTS))
+    store.rms[:] = np.sqrt(np.mean(store.residuals**2, axis=1))
+    return store
+
+
+# Images that keep being overwritten add rows on every poll, the store is
+# compacted to the latest row of every image without changing what it reports
+class TestWatchState(unittest.TestCase):
+    def setUp(self):
+        self.state = WatchState(N_POINTS)
+        self.names = [f"frame_{i:06d}.png" for i in range(N_IMAGES)]
+        self.latest = dict()
+
+    def poll(self, names, seed):
+        new = make_frames(names, seed)
+        rows = self.state.store.extend(new)
+        for i, (name, row) in enumerate(zip(names, rows)):
+            self.state.add(name, (seed, i), row)
+            self.latest[name] = new.residuals[i].copy()
+
+    def check_state(self):
+        frames = self.state.sorted_frames()
+        self.assertEqual(frames.source_names, sorted(self.latest))
+        for i, name in enumerate(frames.source_names):
+            np.testing.assert_array_equal(frames.residuals[i], self.latest[name])
+        expected = RunningStatistics.from_samples(
+            np.concatenate([self.latest[name] for name in sorted(self.latest)])
+        )
+        np.testing.assert_allclose(
+            self.state.total.as_tuple(), expected.as_tuple(), rtol=1e-9
+        )
+
+    def test_compact(self):
+        self.poll(self.names, seed=0)
+        for seed in range(1, 6):
+            self.poll(self.names[1:3], seed=seed)
+        self.assertEqual(len(self.state.store), N_IMAGES + 10)
+        self.assertFalse(self.state.compact(min_rows=100))
+        self.assertTrue(self.state.compact(min_rows=4))
+        self.assertEqual(len(self.state.store), N_IMAGES)
+        self.assertEqual(self.state.n_dead_rows, 0)
+        self.check_state()
+
+        # Adding and removing goes on as before after compacting
+        self.poll(self.names[:1], seed=6)
+        self.state.remove(self.names[3])
+        del self.latest[self.names[3]]
+        self.check_state()
+
+    def test_bounded(self):
+        # Overwriting the same images forever keeps the store bounded
+        self.poll(self.names, seed=0)
+        for seed in range(1, 200):
+            self.poll(self.names, seed=seed)
+            self.state.compact(min_rows=8)
+            self.assertLessEqual(len(self.state.store), 3 * N_IMAGES)
+        self.check_state()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from validate_camera_calibration.tools.writer import (
+    EXPORT_MANIFEST,
+    ImageWriter,
+    finish_export_directory,
+    prepare_export_directory,
+)
+
+SETTINGS = dict(camera="synthetic")
+
+
+class TestExportDirectory(unittest.TestCase):
+    def setUp(self):
+        self.dir_tmp = tempfile.TemporaryDirectory()
+        self.dir_source = Path(os.path.join(self.dir_tmp.name, "source"))
+        self.dir_export = Path(os.path.join(self.dir_tmp.name, "export"))
+        self.dir_source.mkdir()
+        self.img = np.zeros((8, 8), dtype=np.uint8)
+
+    def tearDown(self):
+        self.dir_tmp.cleanup()
+
+    def source_paths(self, names):
+        return [Path(os.path.join(self.dir_source, name)) for name in names]
+
+    def export(self, names, writer=None, **kwargs):
+        # Exports the images that are not up to date, as validate does
+        writer = ImageWriter(export_format="png") if writer is None else writer
+        prepare_export_directory(self.dir_export, writer, SETTINGS)
+        source_paths = self.source_paths(names)
+        for source_path in source_paths:
+            if not source_path.exists():
+                source_path.touch()
+            if not writer.up_to_date(self.dir_export, source_path):
+                writer.write(writer.output_path(self.dir_export, source_path), self.img)
+        finish_export_directory(
+            self.dir_export, writer, SETTINGS, source_paths, **kwargs
+        )
+        return writer
+
+    def exported(self):
+        return sorted(os.listdir(self.dir_export))
+
+    def test_incremental(self):
+        self.export(["a.jpg", "b.jpg"])
+        writer = self.export(["a.jpg", "b.jpg", "c.jpg"])
+        self.assertEqual(writer.n_written, 1)
+        self.assertEqual(self.exported(), [EXPORT_MANIFEST, "a.png", "b.png", "c.png"])
+
+    def test_prune_removed_sources(self):
+        # Images exported for sources that are gone are removed, files that no
+        # export wrote are left alone
+        self.export(["a.jpg", "b.jpg", "c.jpg"])
+        Path(os.path.join(self.dir_export, "notes.txt")).touch()
+        self.export(["a.jpg", "c.jpg"])
+        self.assertEqual(
+            self.exported(), [EXPORT_MANIFEST, "a.png", "c.png", "notes.txt"]
+        )
+        with open(os.path.join(self.dir_export, EXPORT_MANIFEST)) as f:
+            self.assertEqual(json.load(f)["files"], ["a.png", "c.png"])
+
+    def test_no_prune(self):
+        # Stale files stay listed, so a later export that prunes removes them
+        self.export(["a.jpg", "b.jpg"])
+        self.export(["a.jpg"], prune=False)
+        self.assertEqual(self.exported(), [EXPORT_MANIFEST, "a.png", "b.png"])
+        self.export(["a.jpg"])
+        self.assertEqual(self.exported(), [EXPORT_MANIFEST, "a.png"])
+
+    def test_changed_settings(self):
+        # Every file of an export with other settings is written again
+        self.export(["a.jpg", "b.jpg"])
+        writer = self.export(["a.jpg"], writer=ImageWriter(export_format="bmp"))
+        self.assertEqual(writer.n_written, 1)
+        self.assertEqual(self.exported(), [EXPORT_MANIFEST, "a.bmp"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,19 @@
+# The library API. Its modules are only imported on first use, so that the
+# command line still starts without loading OpenCV and numpy.
+_API = dict(
+    Camera="validate_camera_calibration.tools.camera",
+    Image="validate_camera_calibration.tools.image",
+    ValidationResult="validate_camera_calibration.tools.result",
+    validate="validate_camera_calibration.tools.validation",
+    validate_frames="validate_camera_calibration.tools.validation",
+)
+
+__all__ = list(_API)
+
+
+def __getattr__(name: str):
+    if name not in _API:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    return getattr(importlib.import_module(_API[name]), name)
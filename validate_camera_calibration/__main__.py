@@ -1,20 +1,27 @@
 import cProfile
-import glob
 import os
 import sys
 import textwrap
 from pathlib import Path
 from typing import List, Optional
 
-import emoji
-import numpy as np
 import typer
+from typer.core import TyperCommand
 
+# Only light modules are imported here, so that --help and argument errors do
+# not pay for loading OpenCV, numpy and rich. The validation itself is
+# imported once a run actually starts.
 from validate_camera_calibration.tools import general as gn
-from validate_camera_calibration.tools import image, validation
-from validate_camera_calibration.tools import yaml_utils as yu
+from validate_camera_calibration.tools import image, video
+from validate_camera_calibration.tools.detectors import supported_detectors
+from validate_camera_calibration.tools.parallel import default_workers
+from validate_camera_calibration.tools.pnp import supported_pnp_methods
+from validate_camera_calibration.tools.poses import supported_pose_formats
+from validate_camera_calibration.tools.writer import supported_export_formats
 
 app = typer.Typer(add_completion=False, rich_markup_mode="rich")
+serve_app = typer.Typer(add_completion=False, rich_markup_mode="rich")
+merge_app = typer.Typer(add_completion=False, rich_markup_mode="rich")
 
 filename = os.path.basename(__file__)
 
@@ -23,6 +30,7 @@ def expected_calibration_directory_contents() -> str:
     supported_list = gn.join_string_with_commas(
         image.supported_image_extensions(), "or"
     )
+    video_list = gn.join_string_with_commas(video.supported_video_extensions(), "or")
     structure = ""
     structure += "camera_params.yaml            # Camera parameters"
     structure += "\ncalibration_grid_params.yaml  # Calibration grid parameters"
@@ -30,36 +38,35 @@ def expected_calibration_directory_contents() -> str:
     structure += f"\n<second_image_filename>.(ext) # Any file name with either {supported_list} extension"
     structure += "\n ..."
     structure += f"\n<last_image_filename>.(ext)   # Any file name with either {supported_list} extension"
+    structure += f"\n<video_filename>.(ext)        # Optional videos with either {video_list} extension"
     return structure
 
 
 def expected_poses_directory_contents() -> str:
     structure = ""
-    structure += "<first_image_filename>.yaml  # Same name as source file\n"
-    structure += "<second_image_filename>.yaml # Same name as source file\n"
+    structure += "pose_<first_image_filename>.yaml  # Same name as source file\n"
+    structure += "pose_<second_image_filename>.yaml # Same name as source file\n"
     structure += " ...\n"
-    structure += "<last_image_filename>.yaml   # Same name as source file\n"
+    structure += "pose_<last_image_filename>.yaml   # Same name as source file\n"
+    structure += "poses.(npz|jsonl)                 # All poses, if --poses_format is npz or jsonl\n"
     return structure
 
 
 def expected_undistorted_directory_contents() -> str:
     structure = ""
-    structure += (
-        f"<first_image_filename>.(ext)  # Same name and extension as source file\n"
-    )
-    structure += (
-        f"<second_image_filename>.(ext) # Same name and extension as source file\n"
-    )
+    structure += "<first_image_filename>.(ext)  # Same name as source file, extension set by --export_format\n"
+    structure += "<second_image_filename>.(ext) # Same name as source file, extension set by --export_format\n"
     structure += " ...\n"
-    structure += (
-        f"<last_image_filename>.(ext)   # Same name and extension as source file\n"
-    )
+    structure += "<last_image_filename>.(ext)   # Same name as source file, extension set by --export_format\n"
+    structure += ".export.json                  # Settings and files of the last complete export\n"
     return structure
 
 
 def check_calibration_directory_exists(root_path: Path) -> Path:
     dir_calibration = Path(os.path.join(root_path, "calibration"))
     if not dir_calibration.is_dir():
+        import emoji
+
         folder_icon = emoji.emojize(":open_file_folder:")
         structure = (
             f"Expected calibration{folder_icon} to be a directory in {root_path}! "
@@ -79,6 +86,14 @@ def root_path_callback(root_path: Path):
     return root_path
 
 
+def root_paths_file_callback(root_paths_file: Path):
+    if root_paths_file is None:
+        return None
+    if not root_paths_file.is_file():
+        raise typer.BadParameter(f"Expected {root_paths_file} to be a file.")
+    return root_paths_file
+
+
 def camera_params_callback(camera_params_file: Path):
     if camera_params_file is None:
         return None
@@ -88,9 +103,90 @@ def camera_params_callback(camera_params_file: Path):
     return camera_params_file
 
 
+def manifest_callback(manifest: Optional[Path]):
+    if manifest is not None and not Path(manifest).is_file():
+        raise typer.BadParameter(f"Expected {manifest} to be a file.")
+    return manifest
+
+
+def output_file_callback(file_path: Optional[Path]):
+    # Output files are written once the run is done, so a directory that is
+    # not there would only show after all the work
+    if file_path is not None and not Path(file_path).resolve().parent.is_dir():
+        raise typer.BadParameter(f"Expected the directory of {file_path} to exist.")
+    return file_path
+
+
+def poses_format_callback(poses_format: str):
+    if poses_format not in supported_pose_formats():
+        supported_list = gn.join_string_with_commas(supported_pose_formats(), "or")
+        raise typer.BadParameter(
+            f"Expected poses format to be {supported_list}, but it is {poses_format}."
+        )
+    return poses_format
+
+
+def export_format_callback(export_format: str):
+    if export_format not in supported_export_formats():
+        supported_list = gn.join_string_with_commas(supported_export_formats(), "or")
+        raise typer.BadParameter(
+            f"Expected export format to be {supported_list}, but it is {export_format}."
+        )
+    return export_format
+
+
+def detector_callback(detector: Optional[str]):
+    if detector is not None and detector not in supported_detectors():
+        supported_list = gn.join_string_with_commas(supported_detectors(), "or")
+        raise typer.BadParameter(
+            f"Expected detector to be {supported_list}, but it is {detector}."
+        )
+    return detector
+
+
+def cross_validation_callback(cross_validation: Optional[str]):
+    if cross_validation is None or cross_validation == "loo":
+        return cross_validation
+    if not cross_validation.isdigit() or int(cross_validation) < 2:
+        raise typer.BadParameter(
+            f"Expected cross validation to be loo or a number of folds of at least 2, but it is {cross_validation}."
+        )
+    return cross_validation
+
+
+def shard_callback(shard: Optional[str]):
+    if shard is None:
+        return None
+    index, _, count = shard.partition("/")
+    if not (index.isdigit() and count.isdigit() and 1 <= int(index) <= int(count)):
+        raise typer.BadParameter(
+            f"Expected shard to be i/n with 1 <= i <= n, but it is {shard}."
+        )
+    return shard
+
+
+def pnp_method_callback(pnp_method: str):
+    if pnp_method not in supported_pnp_methods():
+        supported_list = gn.join_string_with_commas(supported_pnp_methods(), "or")
+        raise typer.BadParameter(
+            f"Expected PnP method to be {supported_list}, but it is {pnp_method}."
+        )
+    return pnp_method
+
+
+def detection_scale_callback(detection_scale: float):
+    if not 0 < detection_scale <= 1:
+        raise typer.BadParameter(
+            f"Expected detection scale to be in (0, 1], but it is {detection_scale}."
+        )
+    return detection_scale
+
+
 # --------------------------------------------------
 
-docstring = f"""
+
+def help_text() -> str:
+    docstring = f"""
 A minimalistic camera calibration validation toolbox that makes use of the camera intrinsics provided by a yaml file, the calibration grid parameters, and a set of images containing the calibration grid.\n
 \b
 [bold green]Expected directory structure: [/bold green]
@@ -110,31 +206,56 @@ A minimalistic camera calibration validation toolbox that makes use of the camer
 # Validates camera calibration on image files located in <root_path>/calibration
 $ validate_camera_calibration <root_path>:open_file_folder:
 
+# Validates several cameras on one worker pool, with a summary table and a json report
+$ validate_camera_calibration <root_path_1> <root_path_2> ... --report report.json
+$ validate_camera_calibration --root_paths_file cameras.txt --report report.json
+
 """
-# Split the string into lines
-lines = docstring.strip().split("\n")
+    # Split the string into lines
+    lines = docstring.strip().split("\n")
+
+    # Find the maximum index of the '#' character in each line
+    matching_str = " # "
+    max_index = max(line.index(matching_str) for line in lines if matching_str in line)
+
+    # Add padding to the left of the '#' characters
+    padded_lines = [
+        (
+            line[: line.index(matching_str)].ljust(max_index)
+            + line[line.index(matching_str) :]
+            if matching_str in line
+            else line
+        )
+        for line in lines
+    ]
+    docstring = "\n".join(padded_lines)
+    return docstring
+
 
-# Find the maximum index of the '#' character in each line
-matching_str = " # "
-max_index = max(line.index(matching_str) for line in lines if matching_str in line)
+class LazyHelpCommand(TyperCommand):
+    # Builds the help text only when it is displayed rather than on import
+    @property
+    def help(self) -> str:
+        return help_text()
 
-# Add padding to the left of the '#' characters
-padded_lines = [
-    line[: line.index(matching_str)].ljust(max_index) + line[line.index(matching_str) :]
-    if matching_str in line
-    else line
-    for line in lines
-]
-docstring = "\n".join(padded_lines)
+    @help.setter
+    def help(self, value: Optional[str]) -> None:
+        pass
 
 
-@app.command(help=docstring)
+@app.command(cls=LazyHelpCommand)
 def run_validation(
-    root_path: Path = typer.Argument(
-        ...,
-        help="The data directory used for running calibration.",
+    root_paths: Optional[List[Path]] = typer.Argument(
+        None,
+        help="The data directories used for running calibration. Glob patterns such as 'cameras/*' are expanded.",
         show_default=False,
-        callback=root_path_callback,
+    ),
+    root_paths_file: Optional[Path] = typer.Option(
+        None,
+        "--root_paths_file",
+        help="Text file listing one data directory or glob pattern per line, relative to the file.",
+        show_default=False,
+        callback=root_paths_file_callback,
     ),
     export_poses: bool = typer.Option(
         False,
@@ -142,12 +263,45 @@ def run_validation(
         help="Export poses to <root_path>/poses.",
         show_default=False,
     ),
+    poses_format: str = typer.Option(
+        "yaml",
+        "--poses_format",
+        help="Format of the exported poses: one yaml file per image, or a single npz or jsonl file.",
+        callback=poses_format_callback,
+    ),
     export_undistorted: bool = typer.Option(
         False,
         "--export_undistorted",
         help="Export undistorted to <root_path>/undistorted.",
         show_default=False,
     ),
+    export_format: str = typer.Option(
+        "same",
+        "--export_format",
+        help="Format of the undistorted images: same as the source image, jpg, png, tiff or bmp, which is uncompressed.",
+        callback=export_format_callback,
+    ),
+    jpeg_quality: int = typer.Option(
+        95,
+        "--jpeg_quality",
+        help="Quality of undistorted JPEG images.",
+        min=0,
+        max=100,
+    ),
+    png_compression: int = typer.Option(
+        1,
+        "--png_compression",
+        help="Compression level of undistorted PNG images, 0 stores them uncompressed and 9 is the smallest and slowest.",
+        min=0,
+        max=9,
+    ),
+    export_threads: Optional[int] = typer.Option(
+        None,
+        "--export_threads",
+        help="Threads that encode and write undistorted images while the next ones are processed, only with --workers 1, as the worker processes write their own images. 0 writes each image before going on. Defaults to 2.",
+        min=0,
+        show_default=False,
+    ),
     camera_params_file: Optional[Path] = typer.Option(
         None,
         "--camera_params_file",
@@ -155,26 +309,436 @@ def run_validation(
         show_default=False,
         callback=camera_params_callback,
     ),
+    workers: int = typer.Option(
+        default_workers(),
+        "--workers",
+        help="Number of processes used for chessboard detection. Defaults to the number of CPUs.",
+        min=1,
+    ),
+    detection_scale: float = typer.Option(
+        1.0,
+        "--detection_scale",
+        help="Find the calibration grid on images downscaled by this factor, then refine the corners at full resolution.",
+        callback=detection_scale_callback,
+    ),
+    detector: Optional[str] = typer.Option(
+        None,
+        "--detector",
+        help="Calibration grid detector: classic, sb (findChessboardCornersSB), circles or asymmetric_circles. Overrides the detector in calibration_grid_params.yaml, which defaults to classic.",
+        callback=detector_callback,
+        show_default=False,
+    ),
+    reduced_decode: bool = typer.Option(
+        False,
+        "--reduced_decode",
+        help="With --detection_scale of 0.5 or less, decode JPEGs at reduced resolution for the coarse search, and at full resolution only where a grid is found.",
+        show_default=False,
+    ),
+    prefetch: int = typer.Option(
+        0,
+        "--prefetch",
+        help="Read up to this many image files ahead of the chessboard detection on background threads, for slow or network file systems. 0 disables read ahead.",
+        min=0,
+    ),
+    pnp_method: str = typer.Option(
+        "iterative",
+        "--pnp_method",
+        help="Camera pose solver: iterative refinement, ippe for planar targets, sqpnp or epnp.",
+        callback=pnp_method_callback,
+    ),
+    pnp_warm_start: bool = typer.Option(
+        False,
+        "--pnp_warm_start",
+        help="Start each pose from that of the previous frame, for ordered sequences such as videos. Frames the previous pose does not suit are solved from scratch.",
+        show_default=False,
+    ),
+    cross_validation: Optional[str] = typer.Option(
+        None,
+        "--cross_validation",
+        help="Refit the calibration on the detected corners in this many folds, or loo to leave out one frame at a time, starting from the supplied parameters. Reports the reprojection error of the held out frames and the spread of the fitted intrinsics.",
+        callback=cross_validation_callback,
+        show_default=False,
+    ),
+    bootstrap: int = typer.Option(
+        1000,
+        "--bootstrap",
+        help="Resample the frames this many times for 95% confidence intervals of the reprojection RMS, mean and STD. 0 disables the intervals.",
+        min=0,
+    ),
+    recursive: bool = typer.Option(
+        False,
+        "--recursive",
+        help="Also find images and videos in the subdirectories of <root_path>/calibration, such as one per capture session.",
+        show_default=False,
+    ),
+    manifest: Optional[Path] = typer.Option(
+        None,
+        "--manifest",
+        help="Read the images and videos from this file instead of listing <root_path>/calibration. One json object per line with the path of a file relative to the manifest, and optionally its size and sha256, which are checked when the file is read. Files are kept in the order listed.",
+        show_default=False,
+        callback=manifest_callback,
+    ),
+    shard: Optional[str] = typer.Option(
+        None,
+        "--shard",
+        help="Only validate the i-th of n blocks of the sorted images, and every n-th video, given as i/n, and save its frames to <root_path>/shards for the merge command. Run one shard per machine or process.",
+        callback=shard_callback,
+        show_default=False,
+    ),
+    no_cache: bool = typer.Option(
+        False,
+        "--no_cache",
+        help="Do not read or write detected corners in <root_path>/.vcc_cache.",
+        show_default=False,
+    ),
+    profile: Optional[Path] = typer.Option(
+        None,
+        "--profile",
+        help="Profile the validation with cProfile and write the stats to this file.",
+        show_default=False,
+    ),
+    timings: Optional[Path] = typer.Option(
+        None,
+        "--timings",
+        help="Write the time, throughput and peak memory of each stage to this json file.",
+        show_default=False,
+        callback=output_file_callback,
+    ),
+    frame_step: int = typer.Option(
+        1,
+        "--frame_step",
+        help="Only search every n-th frame of a video for the calibration grid.",
+        min=1,
+    ),
+    duplicate_threshold: float = typer.Option(
+        1.0,
+        "--duplicate_threshold",
+        help="Skip video frames that differ from the last searched frame by less than this mean grey level on a small thumbnail. 0 disables the check.",
+        min=0.0,
+    ),
+    report: Optional[Path] = typer.Option(
+        None,
+        "--report",
+        help="With several data directories, write the per-dataset results to this json file.",
+        show_default=False,
+    ),
+    frame_store_dir: Optional[Path] = typer.Option(
+        None,
+        "--frame_store_dir",
+        help="Keep the per-frame corners, poses and residuals in memory-mapped files in this directory instead of in memory.",
+        show_default=False,
+    ),
+    watch: bool = typer.Option(
+        False,
+        "--watch",
+        help="Keep watching <root_path>/calibration and only process new or changed images, updating the reprojection statistics as they arrive. Stop with Ctrl+C.",
+        show_default=False,
+    ),
+    watch_interval: float = typer.Option(
+        1.0,
+        "--watch_interval",
+        help="Seconds between polls of the calibration directory in --watch mode.",
+        min=0.05,
+    ),
+    watch_timeout: Optional[float] = typer.Option(
+        None,
+        "--watch_timeout",
+        help="Stop --watch mode once no image has arrived for this many seconds.",
+        show_default=False,
+    ),
+):
+    from validate_camera_calibration.tools.batch import expand_root_paths
+
+    root_paths = expand_root_paths(root_paths or [], root_paths_file)
+    if len(root_paths) == 0:
+        raise typer.BadParameter("Expected at least one root path.")
+    if watch and cross_validation is not None:
+        raise typer.BadParameter("Expected --cross_validation without --watch.")
+    if watch and (recursive or manifest is not None):
+        raise typer.BadParameter("Expected --watch without --recursive and --manifest.")
+    if len(root_paths) > 1 and manifest is not None:
+        raise typer.BadParameter("Expected a single root path with --manifest.")
+    if shard is not None:
+        # The shards only see part of the frames, merge reports on all of them
+        if len(root_paths) > 1 or watch:
+            raise typer.BadParameter(
+                "Expected a single root path without --watch with --shard."
+            )
+        if export_poses or cross_validation is not None:
+            raise typer.BadParameter(
+                "Expected --export_poses and --cross_validation with merge rather than with --shard."
+            )
+    if export_threads is not None and workers > 1:
+        raise typer.BadParameter(
+            f"Expected --export_threads with --workers 1, the {workers} worker processes write the undistorted images."
+        )
+    if len(root_paths) > 1:
+        if watch:
+            raise typer.BadParameter("Expected a single root path with --watch.")
+        if cross_validation is not None:
+            raise typer.BadParameter(
+                "Expected a single root path with --cross_validation."
+            )
+        if prefetch > 0 or frame_store_dir is not None:
+            raise typer.BadParameter(
+                "Expected a single root path with --prefetch and --frame_store_dir."
+            )
+        typer.echo(f"Validating {len(root_paths)} datasets")
+    else:
+        root_path = root_path_callback(root_paths[0])
+        typer.echo(f"root_path is {root_path}")
+        dir_calibration = check_calibration_directory_exists(root_path)
+
+    from validate_camera_calibration.tools import validation
+    from validate_camera_calibration.tools.shards import parse_shard
+    from validate_camera_calibration.tools.writer import ImageWriter
+
+    writer = ImageWriter(
+        export_format=export_format,
+        jpeg_quality=jpeg_quality,
+        png_compression=png_compression,
+        threads=2 if export_threads is None else export_threads,
+    )
+    if profile is not None:
+        pr = cProfile.Profile()
+        pr.enable()
+    try:
+        if len(root_paths) > 1:
+            from validate_camera_calibration.tools.batch import validate_batch
+
+            datasets = validate_batch(
+                root_paths,
+                export_poses=export_poses,
+                export_undistorted_images=export_undistorted,
+                file_camera_params=camera_params_file,
+                workers=workers,
+                use_cache=not no_cache,
+                detection_scale=detection_scale,
+                poses_format=poses_format,
+                timings_file=timings,
+                report_file=report,
+                frame_step=frame_step,
+                duplicate_threshold=duplicate_threshold,
+                reduced_decode=reduced_decode,
+                pnp_method=pnp_method,
+                pnp_warm_start=pnp_warm_start,
+                detector_name=detector,
+                bootstrap_resamples=bootstrap,
+                writer=writer,
+                recursive=recursive,
+            )
+            n_failed = sum(dataset.failed for dataset in datasets)
+            if n_failed > 0:
+                typer.echo(f"{n_failed} out of {len(datasets)} datasets failed.")
+                raise typer.Exit(code=1)
+        elif watch:
+            from validate_camera_calibration.tools.watch import watch as watch_directory
+
+            watch_directory(
+                root_path,
+                dir_calibration,
+                export_poses=export_poses,
+                export_undistorted_images=export_undistorted,
+                file_camera_params=camera_params_file,
+                workers=workers,
+                use_cache=not no_cache,
+                detection_scale=detection_scale,
+                poses_format=poses_format,
+                timings_file=timings,
+                interval=watch_interval,
+                idle_timeout=watch_timeout,
+                prefetch_depth=prefetch,
+                pnp_method=pnp_method,
+                detector_name=detector,
+                writer=writer,
+            )
+        else:
+            validation.validate(
+                root_path,
+                dir_calibration,
+                export_poses=export_poses,
+                export_undistorted_images=export_undistorted,
+                file_camera_params=camera_params_file,
+                workers=workers,
+                use_cache=not no_cache,
+                detection_scale=detection_scale,
+                poses_format=poses_format,
+                timings_file=timings,
+                frame_step=frame_step,
+                duplicate_threshold=duplicate_threshold,
+                reduced_decode=reduced_decode,
+                frame_store_dir=frame_store_dir,
+                prefetch_depth=prefetch,
+                pnp_method=pnp_method,
+                pnp_warm_start=pnp_warm_start,
+                detector_name=detector,
+                cross_validation=cross_validation,
+                bootstrap_resamples=bootstrap,
+                writer=writer,
+                shard=None if shard is None else parse_shard(shard),
+                recursive=recursive,
+                file_manifest=manifest,
+            )
+    finally:
+        if profile is not None:
+            pr.disable()
+            pr.dump_stats(profile)
+            typer.echo(f"Saved profile to {profile}.")
+
+
+@serve_app.command(
+    help="Keep the camera, the grid detector and the worker pool loaded and validate frames posted to a local HTTP service. POST image bytes, or json with the paths of image files, to /frames for the corners, pose and reprojection error of each frame. GET /status and /metrics for the setup, throughput and queue depth."
+)
+def run_server(
+    root_path: Path = typer.Argument(
+        ...,
+        help="The data directory whose camera_params.yaml and calibration_grid_params.yaml the service validates frames with.",
+        callback=root_path_callback,
+    ),
+    host: str = typer.Option(
+        "127.0.0.1", "--host", help="Address the HTTP service listens on."
+    ),
+    port: int = typer.Option(
+        8765, "--port", help="Port the HTTP service listens on, 0 for any free port."
+    ),
+    socket: Optional[Path] = typer.Option(
+        None,
+        "--socket",
+        help="Listen on this Unix socket instead of a TCP port.",
+        show_default=False,
+    ),
+    workers: int = typer.Option(
+        1,
+        "--workers",
+        help="Number of processes kept running for chessboard detection.",
+        min=1,
+    ),
+    camera_params_file: Optional[Path] = typer.Option(
+        None,
+        "--camera_params",
+        help="Camera parameters file to use instead of <root_path>/calibration/camera_params.yaml.",
+        show_default=False,
+        callback=camera_params_callback,
+    ),
+    detection_scale: float = typer.Option(
+        1.0,
+        "--detection_scale",
+        help="Find the calibration grid on images downscaled by this factor, then refine the corners at full resolution.",
+        callback=detection_scale_callback,
+    ),
+    detector: Optional[str] = typer.Option(
+        None,
+        "--detector",
+        help="Calibration grid detector, overrides the detector in calibration_grid_params.yaml.",
+        callback=detector_callback,
+        show_default=False,
+    ),
+    pnp_method: str = typer.Option(
+        "iterative",
+        "--pnp_method",
+        help="Camera pose solver: iterative refinement, ippe for planar targets, sqpnp or epnp.",
+        callback=pnp_method_callback,
+    ),
 ):
-    typer.echo(f"root_path is {root_path}")
-
     dir_calibration = check_calibration_directory_exists(root_path)
 
-    validation.validate(
+    from validate_camera_calibration.tools.server import serve
+
+    serve(
         root_path,
         dir_calibration,
-        export_poses=export_poses,
-        export_undistorted_images=export_undistorted,
+        host=host,
+        port=port,
+        socket_path=socket,
+        workers=workers,
         file_camera_params=camera_params_file,
+        detection_scale=detection_scale,
+        pnp_method=pnp_method,
+        detector_name=detector,
     )
 
 
-pr = cProfile.Profile()
-pr.enable()
-try:
-    app()
-except KeyboardInterrupt:
-    pass
-finally:
-    pr.disable()
-    pr.dump_stats("validate_camera_calibration.pstat")
+@merge_app.command(
+    help="Merge the frames saved by the --shard runs of a validation, by default those in <root_path>/shards, and report and export the same as a run without shards."
+)
+def run_merge(
+    root_path: Path = typer.Argument(
+        ...,
+        help="The data directory the shards validated, poses are exported to <root_path>/poses.",
+        callback=root_path_callback,
+    ),
+    partials: Optional[List[Path]] = typer.Argument(
+        None,
+        help="Files saved by the shards, instead of those in <root_path>/shards.",
+        show_default=False,
+    ),
+    export_poses: bool = typer.Option(
+        False,
+        "--export_poses",
+        help="Export poses to <root_path>/poses.",
+        show_default=False,
+    ),
+    poses_format: str = typer.Option(
+        "yaml",
+        "--poses_format",
+        help="Format of the exported poses: one yaml file per image, or a single npz or jsonl file.",
+        callback=poses_format_callback,
+    ),
+    workers: int = typer.Option(
+        default_workers(),
+        "--workers",
+        help="Number of processes used for cross-validation. Defaults to the number of CPUs.",
+        min=1,
+    ),
+    cross_validation: Optional[str] = typer.Option(
+        None,
+        "--cross_validation",
+        help="Refit the calibration on the detected corners in this many folds, or loo to leave out one frame at a time.",
+        callback=cross_validation_callback,
+        show_default=False,
+    ),
+    bootstrap: int = typer.Option(
+        1000,
+        "--bootstrap",
+        help="Resample the frames this many times for 95% confidence intervals of the reprojection RMS, mean and STD. 0 disables the intervals.",
+        min=0,
+    ),
+    timings: Optional[Path] = typer.Option(
+        None,
+        "--timings",
+        help="Write the time, throughput and peak memory of each stage to this json file.",
+        show_default=False,
+        callback=output_file_callback,
+    ),
+):
+    from validate_camera_calibration.tools.validation import merge
+
+    merge(
+        root_path,
+        partial_files=partials,
+        export_poses=export_poses,
+        workers=workers,
+        poses_format=poses_format,
+        timings_file=timings,
+        bootstrap_resamples=bootstrap,
+        cross_validation=cross_validation,
+    )
+
+
+def main():
+    try:
+        # validate_camera_calibration serve <root_path> runs the service,
+        # merge <root_path> puts the results of shards together, any other
+        # arguments run a validation
+        if sys.argv[1:2] == ["serve"]:
+            serve_app(args=sys.argv[2:], prog_name=f"{filename} serve")
+        elif sys.argv[1:2] == ["merge"]:
+            merge_app(args=sys.argv[2:], prog_name=f"{filename} merge")
+        else:
+            app()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
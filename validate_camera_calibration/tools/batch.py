@@ -0,0 +1,461 @@
+from __future__ import annotations
+
+import copy
+import glob
+import itertools
+import json
+import os
+import time
+from functools import partial
+from pathlib import Path
+
+from typing_extensions import List, Optional
+
+import validate_camera_calibration.tools.general as gn
+from validate_camera_calibration.tools.cache import DetectionCache, cache_directory
+from validate_camera_calibration.tools.discovery import FileDiscovery
+from validate_camera_calibration.tools.frames import FrameStore
+from validate_camera_calibration.tools.image import (
+    decode_reduction as choose_decode_reduction,
+    detection_parameters,
+)
+from validate_camera_calibration.tools.parallel import worker_pool
+from validate_camera_calibration.tools.timing import StageTimer
+from validate_camera_calibration.tools.validation import (
+    detect_chessboards_in_video,
+    evaluate_frames,
+    finish_undistorted_directory,
+    load_calibration_setup,
+    prepare_undistorted_directory,
+    process_image_file,
+    save_poses,
+)
+from validate_camera_calibration.tools.video import VideoFrameReader
+from validate_camera_calibration.tools.writer import ImageWriter
+
+progress = gn.lazy_import("rich.progress")
+futures = gn.lazy_import("concurrent.futures")
+
+
+def expand_root_paths(
+    root_paths: List[Path], root_paths_file: Optional[Path] = None
+) -> List[Path]:
+    # Root paths given directly or listed one per line in root_paths_file,
+    # relative to that file. Lines starting with # are skipped, and patterns
+    # such as cameras/* are expanded to the directories they match.
+    patterns = [str(root_path) for root_path in root_paths]
+    if root_paths_file is not None:
+        dir_file = Path(root_paths_file).parent
+        with open(root_paths_file, "r") as f:
+            for line in f:
+                line = line.strip()
+                if len(line) > 0 and not line.startswith("#"):
+                    patterns.append(os.path.join(dir_file, line))
+    expanded = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            expanded += sorted(Path(p) for p in glob.glob(pattern) if Path(p).is_dir())
+        else:
+            expanded.append(Path(pattern))
+    return list(dict.fromkeys(expanded))
+
+
+# One <root_path> of a batch run. Detections arrive from the shared worker pool
+# in any order and are put back in image order before poses are solved.
+class BatchDataset:
+    def __init__(self, dir_base: Path) -> None:
+        self.dir_base = Path(dir_base)
+        self.dir_calibration = Path(os.path.join(self.dir_base, "calibration"))
+        self.error = None
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+        self.frames = []
+        self.futures = []
+        self.n_pending = 0
+        self.n_frames = 0
+        self.camera = None
+        self.pattern_size = None
+        self.rPNn = None
+        self.detector = None
+        self.detect_seconds = 0.0
+        self.n_searched = 0
+        self.video_files = []
+        self.dir_undistorted = None
+        self.writer = None
+        self.process = None
+        self.cache = None
+        self.statistics = None
+        self.intervals = None
+        self.n_poses = 0
+
+    def __repr__(self) -> str:
+        return f"BatchDataset({self.dir_base})"
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+    def fail(self, error: Exception) -> None:
+        if self.error is None:
+            self.error = f"{type(error).__name__}: {error}"
+        for future in self.futures:
+            future.cancel()
+
+    def as_dict(self) -> dict:
+        data = dict()
+        data["root_path"] = str(self.dir_base)
+        data["status"] = "failed" if self.failed else "ok"
+        data["error"] = self.error
+        data["images"] = self.n_frames
+        data["poses"] = self.n_poses
+        data["detector"] = self.detector.name if self.detector is not None else None
+        data["detection_rate"] = (
+            self.n_poses / self.n_frames if self.n_frames > 0 else None
+        )
+        # Frames searched per second of detection time, summed over workers
+        data["detect_frames_per_second"] = (
+            self.n_searched / self.detect_seconds if self.detect_seconds > 0 else None
+        )
+        rms, mean, std = self.statistics if self.statistics else (None,) * 3
+        data["reprojection_rms"] = rms
+        data["reprojection_mean"] = mean
+        data["reprojection_std"] = std
+        # 95% bootstrap confidence intervals over frames, if computed
+        rms, mean, std = self.intervals if self.intervals else (None,) * 3
+        data["reprojection_rms_ci"] = rms
+        data["reprojection_mean_ci"] = mean
+        data["reprojection_std_ci"] = std
+        data["cache_hits"] = self.cache.hits if self.cache is not None else 0
+        data["seconds"] = self.seconds
+        return data
+
+
+def _prepare(
+    dataset: BatchDataset,
+    export_undistorted_images: bool,
+    file_camera_params: Optional[Path],
+    use_cache: bool,
+    detection_scale: float,
+    reduced_decode: bool,
+    detector_name: Optional[str],
+    writer: Optional[ImageWriter] = None,
+    recursive: bool = False,
+    unique_names: bool = False,
+) -> List[tuple]:
+    # Loads the setup of a dataset, serves what it can from the cache and
+    # returns the detection tasks left for the worker pool. With unique_names
+    # images of the same name in different subdirectories, whose poses and
+    # exports would overwrite each other, fail the dataset as in a single run.
+    assert (
+        dataset.dir_calibration.is_dir()
+    ), f"Expected {dataset.dir_calibration} to be a directory!"
+    (
+        dataset.camera,
+        dataset.pattern_size,
+        dataset.rPNn,
+        dataset.detector,
+    ) = load_calibration_setup(
+        dataset.dir_calibration, file_camera_params, detector_name
+    )
+    image_files, dataset.video_files = FileDiscovery(
+        dataset.dir_calibration, recursive=recursive, unique_names=unique_names
+    ).collect()
+    assert (
+        len(image_files) + len(dataset.video_files) > 0
+    ), f"Expected to find at least one image or video in {dataset.dir_calibration}!"
+
+    decode_reduction = 1
+    if reduced_decode and not export_undistorted_images:
+        decode_reduction = choose_decode_reduction(
+            detection_scale, dataset.camera.image_width, dataset.camera.image_height
+        )
+    if use_cache:
+        dataset.cache = DetectionCache(
+            cache_directory(dataset.dir_base),
+            detection_parameters(
+                dataset.pattern_size,
+                scale=detection_scale,
+                reduction=decode_reduction,
+                detector=dataset.detector,
+                decode_mode="color" if export_undistorted_images else "grey",
+            ),
+        )
+    dataset.dir_undistorted = None
+    if export_undistorted_images:
+        # The images are written by the workers, each dataset keeps track of
+        # its own earlier export
+        dataset.writer = ImageWriter() if writer is None else copy.copy(writer)
+        dataset.dir_undistorted = prepare_undistorted_directory(
+            dataset.dir_base, dataset.writer, dataset.camera
+        )
+    dataset.process = partial(
+        process_image_file,
+        pattern_size=dataset.pattern_size,
+        camera=dataset.camera,
+        dir_undistorted=dataset.dir_undistorted,
+        detection_scale=detection_scale,
+        decode_reduction=decode_reduction,
+        detector=dataset.detector,
+        writer=dataset.writer,
+    )
+
+    tasks = []
+    for index, image_file in enumerate(image_files):
+        image_path = os.path.join(dataset.dir_calibration, image_file)
+        entry = dataset.cache.get(image_path) if dataset.cache is not None else None
+        dataset.frames.append(None if entry is None else (image_path, *entry))
+        export = dataset.dir_undistorted is not None
+        if export and dataset.writer.up_to_date(dataset.dir_undistorted, image_path):
+            dataset.writer.n_kept += 1
+            export = False
+        if entry is None or export:
+            tasks.append((index, (image_path, entry is None, None, None)))
+    dataset.n_frames = len(image_files)
+    return tasks
+
+
+def _stage_seconds(timer: StageTimer, name: str) -> float:
+    return timer.stages[name]["seconds"] if name in timer.stages else 0.0
+
+
+def _finish(
+    dataset: BatchDataset,
+    pool: futures.Executor,
+    workers: int,
+    timer: StageTimer,
+    export_poses: bool,
+    projection_backend: str,
+    detection_scale: float,
+    poses_format: str,
+    frame_step: int,
+    duplicate_threshold: float,
+    pnp_method: str,
+    pnp_warm_start: bool,
+    bootstrap_resamples: int,
+) -> None:
+    # Everything after the detection in the image files, run in the main
+    # process once all detections of the dataset have arrived
+    if dataset.cache is not None:
+        dataset.cache.save()
+    readers = [
+        VideoFrameReader(
+            os.path.join(dataset.dir_calibration, f),
+            frame_step=frame_step,
+            duplicate_threshold=duplicate_threshold,
+        )
+        for f in dataset.video_files
+    ]
+    frames = itertools.chain(
+        dataset.frames,
+        *(
+            detect_chessboards_in_video(
+                reader,
+                dataset.pattern_size,
+                workers=workers,
+                camera=dataset.camera,
+                dir_undistorted=dataset.dir_undistorted,
+                detection_scale=detection_scale,
+                timer=timer,
+                executor=pool,
+                detector=dataset.detector,
+                writer=dataset.writer,
+            )
+            for reader in readers
+        ),
+    )
+    # Nothing else is collected from the pool meanwhile, so the detection
+    # time added to the timer here is all spent on the videos of this dataset
+    detect_before = _stage_seconds(timer, "detect")
+    store = FrameStore.from_frames(
+        frames, len(dataset.rPNn), capacity=max(1, len(dataset.frames))
+    )
+    dataset.detect_seconds += _stage_seconds(timer, "detect") - detect_before
+    dataset.n_searched += sum(reader.n_accepted for reader in readers)
+    dataset.frames = []
+    dataset.n_frames = len(store)
+    dataset.n_poses = store.n_detected
+    if dataset.dir_undistorted is not None:
+        finish_undistorted_directory(
+            dataset.dir_undistorted, dataset.writer, dataset.camera, store.source_names
+        )
+    assert (
+        dataset.n_poses > 0
+    ), f"Expected to find a calibration grid in at least one image in {dataset.dir_calibration}!"
+
+    result = evaluate_frames(
+        store,
+        dataset.camera,
+        dataset.pattern_size,
+        dataset.rPNn,
+        dataset.detector,
+        timer=timer,
+        projection_backend=projection_backend,
+        pnp_method=pnp_method,
+        pnp_warm_start=pnp_warm_start,
+        bootstrap_resamples=bootstrap_resamples,
+    )
+    dataset.statistics = result.statistics
+    if result.intervals is not None:
+        dataset.intervals = result.intervals.tolist()
+    if export_poses:
+        with timer.measure("export_poses", frames=dataset.n_poses):
+            save_poses(dataset.dir_base, store, poses_format)
+
+
+def summary_table(datasets: List[BatchDataset]) -> str:
+    width = max([len("Dataset")] + [len(str(d.dir_base)) for d in datasets]) + 2
+    out_str = (
+        f"{'Dataset':<{width}}{'Detector':<20}{'Images':>8}{'Grids':>7}"
+        f"{'Frames/s':>10}{'RMS':>10}{'Mean':>10}{'STD':>10}{'Time [s]':>10}  Status\n"
+    )
+    for dataset in datasets:
+        data = dataset.as_dict()
+        statistics = [
+            f"{data[key]:.4g}" if data[key] is not None else "-"
+            for key in ["reprojection_rms", "reprojection_mean", "reprojection_std"]
+        ]
+        status = data["status"] if not dataset.failed else f"failed: {dataset.error}"
+        detector = data["detector"] or "-"
+        fps = data["detect_frames_per_second"]
+        fps = f"{fps:.1f}" if fps is not None else "-"
+        out_str += (
+            f"{str(dataset.dir_base):<{width}}{detector:<20}{data['images']:>8}"
+            f"{data['poses']:>7}{fps:>10}{statistics[0]:>10}{statistics[1]:>10}{statistics[2]:>10}"
+            f"{data['seconds']:>10.2f}  {status}\n"
+        )
+    return out_str
+
+
+def validate_batch(
+    dirs_base: List[Path],
+    export_undistorted_images: bool = False,
+    export_poses: bool = False,
+    file_camera_params: Path = None,
+    workers: int = 1,
+    use_cache: bool = True,
+    projection_backend: str = "auto",
+    detection_scale: float = 1.0,
+    poses_format: str = "yaml",
+    timings_file: Optional[Path] = None,
+    report_file: Optional[Path] = None,
+    frame_step: int = 1,
+    duplicate_threshold: float = 1.0,
+    reduced_decode: bool = False,
+    pnp_method: str = "iterative",
+    pnp_warm_start: bool = False,
+    detector_name: Optional[str] = None,
+    bootstrap_resamples: int = 1000,
+    writer: Optional[ImageWriter] = None,
+    recursive: bool = False,
+) -> List[BatchDataset]:
+    # Validates many datasets on one worker pool. The detections of all
+    # datasets are queued together and each dataset is finished as soon as its
+    # last detection arrives, while the pool keeps working on the others. A
+    # failing dataset is reported and does not stop the others.
+    assert len(dirs_base) > 0, "Expected at least one dataset!"
+    timer = StageTimer()
+    datasets = [BatchDataset(dir_base) for dir_base in dirs_base]
+    finish = partial(
+        _finish,
+        workers=workers,
+        timer=timer,
+        export_poses=export_poses,
+        projection_backend=projection_backend,
+        detection_scale=detection_scale,
+        poses_format=poses_format,
+        frame_step=frame_step,
+        duplicate_threshold=duplicate_threshold,
+        pnp_method=pnp_method,
+        pnp_warm_start=pnp_warm_start,
+        bootstrap_resamples=bootstrap_resamples,
+    )
+
+    def finish_guarded(dataset: BatchDataset) -> None:
+        try:
+            if not dataset.failed:
+                finish(dataset, pool)
+        except Exception as error:
+            dataset.fail(error)
+        dataset.seconds = time.perf_counter() - dataset.start
+        status = "failed" if dataset.failed else f"{dataset.n_poses} poses"
+        print(f"Finished {dataset.dir_base}: {status}.")
+
+    with timer.measure("total") as stage, worker_pool(workers) as pool:
+        tasks = []
+        with timer.measure("scan"):
+            for dataset in datasets:
+                dataset.start = time.perf_counter()
+                try:
+                    tasks.append(
+                        _prepare(
+                            dataset,
+                            export_undistorted_images,
+                            file_camera_params,
+                            use_cache,
+                            detection_scale,
+                            reduced_decode,
+                            detector_name,
+                            writer=writer,
+                            recursive=recursive,
+                            unique_names=export_undistorted_images or export_poses,
+                        )
+                    )
+                except Exception as error:
+                    dataset.fail(error)
+                    tasks.append([])
+
+        # Queue the smallest datasets first. The pool stays just as busy, but
+        # small datasets finish early instead of waiting behind a large one.
+        submitted = dict()
+        order = sorted(range(len(datasets)), key=lambda i: len(tasks[i]))
+        for dataset, dataset_tasks in ((datasets[i], tasks[i]) for i in order):
+            for index, args in dataset_tasks:
+                future = pool.submit(dataset.process, args)
+                submitted[future] = (dataset, index, args[0])
+                dataset.futures.append(future)
+                dataset.n_pending += 1
+        completed = progress.track(
+            futures.as_completed(submitted),
+            f"Detecting calibration grid in {len(datasets)} datasets",
+            total=len(submitted),
+        )
+        for future in completed:
+            dataset, index, image_path = submitted.pop(future)
+            dataset.n_pending -= 1
+            if not dataset.failed:
+                try:
+                    shape, corners, timings = future.result()
+                    for name, seconds in timings.items():
+                        timer.add(name, seconds)
+                    if "detect" in timings:
+                        dataset.detect_seconds += timings["detect"]
+                        dataset.n_searched += 1
+                    if dataset.frames[index] is None:
+                        if dataset.cache is not None:
+                            dataset.cache.put(image_path, shape, corners)
+                        dataset.frames[index] = (image_path, shape, corners)
+                except Exception as error:
+                    dataset.fail(error)
+            if dataset.n_pending == 0:
+                finish_guarded(dataset)
+        # Datasets without detections left in the pool, such as fully cached
+        # ones or those with only videos, whose frames are decoded here and
+        # would hold up collecting the results of the others
+        for dataset in datasets:
+            if len(dataset.futures) == 0:
+                finish_guarded(dataset)
+        stage["frames"] = sum(dataset.n_frames for dataset in datasets)
+
+    print(summary_table(datasets))
+    print(timer)
+    if timings_file is not None:
+        file_timings = timer.to_file(timings_file)
+        print(f"Saved timings to {file_timings}.")
+    if report_file is not None:
+        report = dict()
+        report["datasets"] = [dataset.as_dict() for dataset in datasets]
+        report["timings"] = timer.as_dict()
+        with open(report_file, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved report to {report_file}.")
+    return datasets
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from typing_extensions import Dict, Optional, Tuple
+
+import validate_camera_calibration.tools.general as gn
+
+np = gn.lazy_import("numpy")
+
+
+def cache_directory(dir_base: Path) -> Path:
+    return Path(os.path.join(dir_base, ".vcc_cache"))
+
+
+# Chessboard corners stored on disk for one set of detection parameters and
+# keyed by file size and modification time. Frames without a chessboard are
+# cached too, so a warm run skips decoding and detection for unchanged images.
+# Entries of files that were not looked up since the cache was loaded, such as
+# deleted or renamed ones, are dropped when it is saved, so it does not grow
+# without bound.
+class DetectionCache:
+    def __init__(self, dir_cache: Path, params: dict) -> None:
+        assert isinstance(params, dict), "Expected params to be a dict!"
+        self.dir_cache = Path(dir_cache)
+        self.params = params
+        key = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        self.file_path = Path(
+            os.path.join(self.dir_cache, f"detections_{key[:16]}.npz")
+        )
+        self._entries: Dict[str, Tuple[int, int, Tuple[int], Optional[np.ndarray]]] = {}
+        self._seen = set()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        if self.file_path.is_file():
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return f"DetectionCache({self.file_path}, {len(self)} entries)"
+
+    @staticmethod
+    def _stat(file_path: Path) -> Tuple[str, int, int]:
+        stat = os.stat(file_path)
+        return str(Path(file_path).resolve()), stat.st_size, stat.st_mtime_ns
+
+    def _load(self) -> None:
+        with np.load(self.file_path) as data:
+            names = data["names"]
+            sizes = data["sizes"]
+            mtimes = data["mtimes"]
+            shapes = data["shapes"]
+            found = data["found"]
+            corners = data["corners"]
+        for i, name in enumerate(names):
+            c = corners[i].reshape(-1, 1, 2) if found[i] else None
+            self._entries[str(name)] = (
+                int(sizes[i]),
+                int(mtimes[i]),
+                tuple(int(s) for s in shapes[i]),
+                c,
+            )
+
+    def get(self, file_path: Path) -> Optional[Tuple[Tuple[int], Optional[np.ndarray]]]:
+        name, size, mtime = self._stat(file_path)
+        self._seen.add(name)
+        entry = self._entries.get(name)
+        if entry is None or entry[0] != size or entry[1] != mtime:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[2], entry[3]
+
+    def put(
+        self, file_path: Path, shape: Tuple[int], corners: Optional[np.ndarray]
+    ) -> None:
+        name, size, mtime = self._stat(file_path)
+        if corners is not None:
+            corners = np.asarray(corners, dtype=np.float32).reshape(-1, 1, 2)
+        self._seen.add(name)
+        self._entries[name] = (size, mtime, tuple(shape[:2]), corners)
+        self._dirty = True
+
+    def save(self, prune: bool = True) -> None:
+        # Only a run that went through all its files knows which entries are
+        # stale, an interrupted one keeps them all
+        if prune:
+            stale = [name for name in self._entries if name not in self._seen]
+            for name in stale:
+                del self._entries[name]
+            self._dirty = self._dirty or len(stale) > 0
+        if not self._dirty:
+            return
+        n_points = int(np.prod(self.params["pattern_size"]))
+        names = list(self._entries.keys())
+        sizes = np.empty(len(names), dtype=np.int64)
+        mtimes = np.empty(len(names), dtype=np.int64)
+        shapes = np.empty((len(names), 2), dtype=np.int32)
+        found = np.zeros(len(names), dtype=bool)
+        corners = np.zeros((len(names), n_points, 2), dtype=np.float32)
+        for i, name in enumerate(names):
+            size, mtime, shape, c = self._entries[name]
+            sizes[i] = size
+            mtimes[i] = mtime
+            shapes[i] = shape
+            if c is not None:
+                found[i] = True
+                corners[i] = c.reshape(-1, 2)
+
+        self.dir_cache.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so an interrupted run never leaves a
+        # truncated cache behind
+        file_tmp = Path(str(self.file_path) + ".tmp")
+        with open(file_tmp, "wb") as f:
+            np.savez(
+                f,
+                names=np.array(names, dtype=str),
+                sizes=sizes,
+                mtimes=mtimes,
+                shapes=shapes,
+                found=found,
+                corners=corners,
+            )
+        os.replace(file_tmp, self.file_path)
+        self._dirty = False
@@ -1,14 +1,17 @@
+from __future__ import annotations
+
 from pathlib import Path
 
-import cv2
-import numpy as np
-import yaml
-from typing_extensions import Any, List, Self
+from typing_extensions import Self, Tuple
 
 import validate_camera_calibration.tools.general as gn
 import validate_camera_calibration.tools.yaml_utils as yu
 from validate_camera_calibration.tools.image import Image
 
+cv2 = gn.lazy_import("cv2")
+np = gn.lazy_import("numpy")
+yaml = gn.lazy_import("yaml")
+
 
 class Camera:
     def __init__(
@@ -29,6 +32,7 @@ class Camera:
         self.image_width = image_width
         self.image_height = image_height
         self.from_file = from_file
+        self._undistort_maps = dict()
 
         if from_file is not None:
             print(f"Loaded camera parameters from {from_file}.")
@@ -47,10 +51,12 @@ class Camera:
         return Camera(Kc, dist, image_width, image_height, file_path)
 
     def to_file(self, file_path: Path) -> None:
-        file_path = gn.add_extension(file_path, "yaml")
+        file_path = gn.add_extension(str(file_path), "yaml")
         data = dict()
         data["camera_matrix"] = yu.numpy_to_yaml_dict(self.Kc)
         data["distortion_coefficients"] = yu.numpy_to_yaml_dict(self.dist)
+        data["image_width"] = self.image_width
+        data["image_height"] = self.image_height
         with open(file_path, "w") as f:
             yaml.dump(data, f)
 
@@ -105,6 +111,22 @@ class Camera:
         table_str += "\n%%"
         return table_str
 
+    def __getstate__(self) -> dict:
+        # Undistortion maps are large and cheap to rebuild, so they are not
+        # sent along when a camera is pickled to a worker process
+        state = self.__dict__.copy()
+        state["_undistort_maps"] = dict()
+        return state
+
+    def undistort_maps(self, image_size: Tuple[int]) -> Tuple[np.ndarray, np.ndarray]:
+        # Fixed-point maps for cv2.remap, built once per image size (width, height)
+        image_size = tuple(image_size)
+        if image_size not in self._undistort_maps:
+            self._undistort_maps[image_size] = cv2.initUndistortRectifyMap(
+                self.Kc, self.dist, None, self.Kc, image_size, cv2.CV_16SC2
+            )
+        return self._undistort_maps[image_size]
+
     def undistort(self, img: np.ndarray) -> np.ndarray:
         assert isinstance(img, np.ndarray), "Expected img to be a numpy array!"
         assert (
@@ -112,8 +134,9 @@ class Camera:
         ), "Expected img to be 2d if grayscale or 3d if colour!"
         assert img.shape[0] == self.image_height, "Expected img to have correct height!"
         assert img.shape[1] == self.image_width, "Expected img to have correct width!"
-        return cv2.undistort(img, self.Kc, self.dist)
+        map1, map2 = self.undistort_maps((img.shape[1], img.shape[0]))
+        return cv2.remap(img, map1, map2, cv2.INTER_LINEAR)
 
     def undistort_image(self, img: Image) -> Image:
         assert isinstance(img, Image), "Expected img to be an Image object!"
-        return Image(self.undistort(img.img), img.from_file)
+        return Image(self.undistort(img.img), img.file_path)
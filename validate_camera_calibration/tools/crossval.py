@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+from typing_extensions import List, Tuple
+
+import validate_camera_calibration.tools.general as gn
+from validate_camera_calibration.tools.camera import Camera
+from validate_camera_calibration.tools.frames import FrameStore
+from validate_camera_calibration.tools.parallel import ordered_map, worker_pool
+from validate_camera_calibration.tools.pnp import PnPSolver
+from validate_camera_calibration.tools.projection import (
+    reprojection_errors_batch,
+    reprojection_statistics,
+)
+
+cv2 = gn.lazy_import("cv2")
+np = gn.lazy_import("numpy")
+progress = gn.lazy_import("rich.progress")
+
+LEAVE_ONE_OUT = "loo"
+
+# Names of the distortion coefficients in the order OpenCV stores them
+DISTORTION_NAMES = [
+    "k1",
+    "k2",
+    "p1",
+    "p2",
+    "k3",
+    "k4",
+    "k5",
+    "k6",
+    "s1",
+    "s2",
+    "s3",
+    "s4",
+    "tx",
+    "ty",
+]
+
+# Grid points, detected corners and supplied parameters shared by every fold
+# a worker fits, handed over once by the pool initializer
+_SHARED = dict()
+
+
+def fold_count(folds: str, n_frames: int) -> int:
+    # folds is a number of folds or loo for one fold per frame
+    if folds == LEAVE_ONE_OUT:
+        return n_frames
+    n_folds = int(folds)
+    assert n_folds >= 2, f"Expected at least 2 folds, but got {n_folds}!"
+    assert (
+        n_folds <= n_frames
+    ), f"Expected at most one fold per frame, but got {n_folds} folds for {n_frames} frames!"
+    return n_folds
+
+
+def fold_indices(n_frames: int, n_folds: int, seed: int = 0) -> List[np.ndarray]:
+    # Frames held out by each fold, shuffled so that folds do not follow the
+    # order of the images, and the same from one run to the next
+    order = np.random.default_rng(seed).permutation(n_frames)
+    return [np.sort(fold) for fold in np.array_split(order, n_folds)]
+
+
+def calibration_flags(n_coefficients: int) -> int:
+    # Start from the supplied intrinsics and fit the distortion model they use
+    assert n_coefficients in [
+        4,
+        5,
+        8,
+        12,
+        14,
+    ], f"Expected 4, 5, 8, 12 or 14 distortion coefficients, but got {n_coefficients}!"
+    flags = cv2.CALIB_USE_INTRINSIC_GUESS
+    if n_coefficients == 4:
+        flags |= cv2.CALIB_FIX_K3
+    if n_coefficients >= 8:
+        flags |= cv2.CALIB_RATIONAL_MODEL
+    if n_coefficients >= 12:
+        flags |= cv2.CALIB_THIN_PRISM_MODEL
+    if n_coefficients == 14:
+        flags |= cv2.CALIB_TILTED_MODEL
+    return flags
+
+
+def intrinsic_parameter_names(n_coefficients: int) -> List[str]:
+    return ["fx", "fy", "cx", "cy"] + DISTORTION_NAMES[:n_coefficients]
+
+
+def intrinsic_parameters(Kc: np.ndarray, dist: np.ndarray) -> np.ndarray:
+    return np.concatenate(
+        [[Kc[0, 0], Kc[1, 1], Kc[0, 2], Kc[1, 2]], np.ravel(dist)]
+    ).astype(float)
+
+
+def _init_fold_worker(
+    rPNn: np.ndarray,
+    corners: np.ndarray,
+    image_size: Tuple[int],
+    Kc: np.ndarray,
+    dist: np.ndarray,
+) -> None:
+    _SHARED.update(rPNn=rPNn, corners=corners, image_size=image_size, Kc=Kc, dist=dist)
+
+
+def calibrate_fold(
+    held_out: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, float, np.ndarray]:
+    # Calibrates on every frame but the held out ones, then solves the pose of
+    # each held out frame with the fitted intrinsics and returns its residuals
+    rPNn = _SHARED["rPNn"]
+    corners = _SHARED["corners"]
+    n_coefficients = np.size(_SHARED["dist"])
+    train = np.ones(len(corners), dtype=bool)
+    train[held_out] = False
+
+    dist = np.zeros((1, max(5, n_coefficients)))
+    dist[0, :n_coefficients] = np.ravel(_SHARED["dist"])
+    rms, Kc, dist, _, _ = cv2.calibrateCamera(
+        [rPNn] * int(np.sum(train)),
+        list(corners[train]),
+        _SHARED["image_size"],
+        _SHARED["Kc"].copy(),
+        dist,
+        flags=calibration_flags(n_coefficients),
+    )
+    dist = dist.reshape(1, -1)[:, :n_coefficients]
+
+    solver = PnPSolver(rPNn, Kc, dist)
+    poses = [solver.solve(corners[i]) for i in held_out]
+    residuals = reprojection_errors_batch(
+        rPNn,
+        corners[held_out],
+        np.stack([rvec.reshape(3) for rvec, _ in poses]),
+        np.stack([tvec.reshape(3) for _, tvec in poses]),
+        Kc,
+        dist,
+    )
+    return Kc, dist, rms, residuals
+
+
+# Intrinsics fitted by every fold and residuals of the frames each fold held
+# out. The spread of the fitted parameters shows how well the frames pin them
+# down, and the held out residuals how well they predict frames that were not
+# used to fit them. Parameters are compared by their standard deviation over
+# the folds and by the grouped jackknife estimate of their standard error.
+class CrossValidation:
+    def __init__(
+        self,
+        folds: List[np.ndarray],
+        parameters: np.ndarray,
+        supplied: np.ndarray,
+        names: List[str],
+        train_rms: np.ndarray,
+        residuals: np.ndarray,
+    ) -> None:
+        self.folds = folds
+        self.parameters = parameters
+        self.supplied = supplied
+        self.names = names
+        self.train_rms = train_rms
+        self.residuals = residuals
+
+    @property
+    def n_folds(self) -> int:
+        return len(self.folds)
+
+    @property
+    def n_frames(self) -> int:
+        return len(self.residuals)
+
+    def held_out_statistics(self) -> Tuple[float]:
+        return reprojection_statistics(self.residuals)
+
+    def parameter_statistics(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Mean, standard deviation and jackknife standard error per parameter
+        mean = np.mean(self.parameters, axis=0)
+        std = np.std(self.parameters, axis=0)
+        k = self.n_folds
+        std_error = np.sqrt((k - 1) / k * np.sum((self.parameters - mean) ** 2, axis=0))
+        return mean, std, std_error
+
+    def as_dict(self) -> dict:
+        rms, mean, std = self.held_out_statistics()
+        data = dict()
+        data["n_folds"] = self.n_folds
+        data["n_frames"] = self.n_frames
+        data["held_out_rms"] = float(rms)
+        data["held_out_mean"] = float(mean)
+        data["held_out_std"] = float(std)
+        data["train_rms"] = float(np.mean(self.train_rms))
+        data["parameters"] = dict()
+        for name, supplied, mean, std, std_error in zip(
+            self.names, self.supplied, *self.parameter_statistics()
+        ):
+            data["parameters"][name] = dict(
+                supplied=float(supplied),
+                mean=float(mean),
+                std=float(std),
+                std_error=float(std_error),
+            )
+        return data
+
+    def __repr__(self) -> str:
+        data = self.as_dict()
+        kind = (
+            "leave-one-out" if self.n_folds == self.n_frames else f"{self.n_folds}-fold"
+        )
+        out_str = f"Cross-validation ({kind}) over {self.n_frames} frames:\n"
+        out_str += f" Held-out RMS: {data['held_out_rms']:4g} [pix] (training RMS: {data['train_rms']:4g} [pix])\n"
+        out_str += f"Held-out Mean: {data['held_out_mean']:4g} [pix]\n"
+        out_str += f" Held-out STD: {data['held_out_std']:4g} [pix]\n"
+        out_str += f"{'Parameter':<12}{'Supplied':>14}{'Mean':>14}{'STD':>14}{'Std. error':>14}\n"
+        for name, stats in data["parameters"].items():
+            out_str += (
+                f"{name:<12}{stats['supplied']:>14.6g}{stats['mean']:>14.6g}"
+                f"{stats['std']:>14.4g}{stats['std_error']:>14.4g}\n"
+            )
+        return out_str
+
+
+def cross_validate(
+    store: FrameStore,
+    rPNn: np.ndarray,
+    camera: Camera,
+    folds: str = "5",
+    workers: int = 1,
+    seed: int = 0,
+    progress_bar: bool = True,
+) -> CrossValidation:
+    # Refits the calibration on the corners already detected, one fold per
+    # task. Every fit starts from the supplied intrinsics, so it converges in
+    # a few iterations.
+    indices = store.detected_indices()
+    n_frames = len(indices)
+    assert (
+        n_frames >= 3
+    ), f"Expected at least 3 frames with a calibration grid to cross-validate, but got {n_frames}!"
+    held_out = fold_indices(n_frames, fold_count(folds, n_frames), seed)
+
+    rPNn = np.ascontiguousarray(rPNn, dtype=np.float32)
+    corners = np.ascontiguousarray(store.corners[indices], dtype=np.float32)
+    image_size = (camera.image_width, camera.image_height)
+    shared = (rPNn, corners, image_size, camera.Kc, camera.dist)
+    description = "Cross-validating the calibration"
+    workers = min(workers, len(held_out))
+    if workers == 1:
+        _init_fold_worker(*shared)
+        try:
+            fits = list(
+                progress.track(
+                    map(calibrate_fold, held_out),
+                    description,
+                    total=len(held_out),
+                    disable=not progress_bar,
+                )
+            )
+        finally:
+            _SHARED.clear()
+    else:
+        with worker_pool(workers, _init_fold_worker, shared) as pool:
+            fits = list(
+                progress.track(
+                    ordered_map(calibrate_fold, held_out, executor=pool),
+                    description,
+                    total=len(held_out),
+                    disable=not progress_bar,
+                )
+            )
+
+    # Residuals back in frame order
+    residuals = np.empty((n_frames, len(rPNn)))
+    for fold, (_, _, _, fold_residuals) in zip(held_out, fits):
+        residuals[fold] = fold_residuals
+    return CrossValidation(
+        held_out,
+        np.stack([intrinsic_parameters(Kc, dist) for Kc, dist, _, _ in fits]),
+        intrinsic_parameters(camera.Kc, camera.dist),
+        intrinsic_parameter_names(np.size(camera.dist)),
+        np.array([rms for _, _, rms, _ in fits]),
+        residuals,
+    )
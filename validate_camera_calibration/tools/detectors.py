@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+from typing_extensions import Dict, List, Optional, Tuple
+
+import validate_camera_calibration.tools.general as gn
+
+cv2 = gn.lazy_import("cv2")
+np = gn.lazy_import("numpy")
+
+
+def supported_detectors() -> List[str]:
+    # classic: findChessboardCorners and cornerSubPix, sb: the sector based
+    # findChessboardCornersSB, circles and asymmetric_circles: findCirclesGrid
+    return list(_DETECTORS)
+
+
+def grid_points(
+    pattern_size: Tuple[int], grid_square_size: float, asymmetric: bool = False
+) -> np.ndarray:
+    # Grid points in the board frame, row by row in the order the detectors
+    # return them. Rows of an asymmetric circle grid are offset by half a
+    # column, and its columns are two spacings apart.
+    cols, rows = np.meshgrid(
+        np.arange(0, pattern_size[0]), np.arange(0, pattern_size[1])
+    )
+    if asymmetric:
+        cols = 2 * cols + rows % 2
+    rPNn = (
+        np.hstack(
+            (
+                cols.reshape(-1, 1),
+                rows.reshape(-1, 1),
+                np.zeros((pattern_size[0] * pattern_size[1], 1)),
+            )
+        ).astype(float)
+        * grid_square_size
+    )
+    return rPNn
+
+
+# Finds the calibration grid in a grey image. find returns the grid points in
+# pixels of the image it is given, without subpixel refinement, and refine
+# improves points found on a copy downscaled by scale using the full
+# resolution pixels around them. Detectors are sent to worker processes, so
+# they only hold their parameters.
+class Detector:
+    name = ""
+    default_params: Dict[str, object] = dict()
+
+    def __init__(self, **params) -> None:
+        unknown = sorted(set(params) - set(self.default_params))
+        assert (
+            len(unknown) == 0
+        ), f"Expected parameters of the {self.name} detector to be among {sorted(self.default_params)}, but got {unknown}!"
+        self.params = dict(self.default_params)
+        self.params.update(params)
+
+    def __repr__(self) -> str:
+        params = ", ".join(f"{key}={value}" for key, value in self.params.items())
+        return f"{type(self).__name__}({params})"
+
+    def cache_parameters(self) -> dict:
+        # Everything besides the pixels that the detected points depend on
+        params = dict()
+        params["detector"] = self.name
+        params.update(self.params)
+        return params
+
+    def grid_points(
+        self, pattern_size: Tuple[int], grid_square_size: float
+    ) -> np.ndarray:
+        return grid_points(pattern_size, grid_square_size)
+
+    def find(
+        self, img_grey: np.ndarray, pattern_size: Tuple[int], scale: float = 1.0
+    ) -> Optional[np.ndarray]:
+        raise NotImplementedError
+
+    def refine(
+        self,
+        img_grey: np.ndarray,
+        corners: np.ndarray,
+        pattern_size: Tuple[int],
+        scale: float = 1.0,
+    ) -> Optional[np.ndarray]:
+        raise NotImplementedError
+
+    def roi_margin(self, corners: np.ndarray, scale: float) -> int:
+        # Pixels around the coarse points that refine needs
+        raise NotImplementedError
+
+
+def _subpix_criteria(params: dict) -> Tuple[int, int, float]:
+    return (
+        cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER,
+        params["subpix_iterations"],
+        params["subpix_epsilon"],
+    )
+
+
+def _corner_subpix(
+    img_grey: np.ndarray, corners: np.ndarray, params: dict
+) -> np.ndarray:
+    window = params["subpix_window"]
+    return cv2.cornerSubPix(
+        img_grey,
+        np.ascontiguousarray(corners, dtype=np.float32),
+        (window, window),
+        (-1, -1),
+        _subpix_criteria(params),
+    )
+
+
+class ClassicDetector(Detector):
+    name = "classic"
+    default_params = dict(
+        adaptive_thresh=True,
+        normalize_image=True,
+        fast_check=True,
+        filter_quads=False,
+        subpix_window=11,
+        subpix_iterations=30,
+        subpix_epsilon=0.001,
+    )
+
+    def flags(self) -> int:
+        flags = 0
+        if self.params["fast_check"]:
+            flags += cv2.CALIB_CB_FAST_CHECK
+        if self.params["adaptive_thresh"]:
+            flags += cv2.CALIB_CB_ADAPTIVE_THRESH
+        if self.params["normalize_image"]:
+            flags += cv2.CALIB_CB_NORMALIZE_IMAGE
+        if self.params["filter_quads"]:
+            flags += cv2.CALIB_CB_FILTER_QUADS
+        return flags
+
+    def cache_parameters(self) -> dict:
+        # Same keys as before detectors could be chosen, so existing caches of
+        # the default detector stay valid
+        params = dict()
+        params["flags"] = self.flags()
+        window = self.params["subpix_window"]
+        params["subpix_window"] = [window, window]
+        params["subpix_criteria"] = list(_subpix_criteria(self.params))
+        return params
+
+    def find(
+        self, img_grey: np.ndarray, pattern_size: Tuple[int], scale: float = 1.0
+    ) -> Optional[np.ndarray]:
+        retval, corners = cv2.findChessboardCorners(
+            img_grey, pattern_size, None, flags=self.flags()
+        )
+        return corners if retval else None
+
+    def refine(
+        self,
+        img_grey: np.ndarray,
+        corners: np.ndarray,
+        pattern_size: Tuple[int],
+        scale: float = 1.0,
+    ) -> Optional[np.ndarray]:
+        return _corner_subpix(img_grey, corners, self.params)
+
+    def roi_margin(self, corners: np.ndarray, scale: float) -> int:
+        return self.params["subpix_window"] + int(np.ceil(2 / scale))
+
+
+# The sector based detector is more robust to blur and noise and already
+# locates the corners to subpixel accuracy, so at full resolution there is no
+# separate refinement. Points found on a downscaled copy are still refined at
+# full resolution with cornerSubPix.
+class SectorBasedDetector(Detector):
+    name = "sb"
+    default_params = dict(
+        normalize_image=True,
+        exhaustive=False,
+        accuracy=False,
+        subpix_window=11,
+        subpix_iterations=30,
+        subpix_epsilon=0.001,
+    )
+
+    def flags(self) -> int:
+        flags = 0
+        if self.params["normalize_image"]:
+            flags += cv2.CALIB_CB_NORMALIZE_IMAGE
+        if self.params["exhaustive"]:
+            flags += cv2.CALIB_CB_EXHAUSTIVE
+        if self.params["accuracy"]:
+            flags += cv2.CALIB_CB_ACCURACY
+        return flags
+
+    def find(
+        self, img_grey: np.ndarray, pattern_size: Tuple[int], scale: float = 1.0
+    ) -> Optional[np.ndarray]:
+        retval, corners = cv2.findChessboardCornersSB(
+            img_grey, pattern_size, flags=self.flags()
+        )
+        return corners.reshape(-1, 1, 2) if retval else None
+
+    def refine(
+        self,
+        img_grey: np.ndarray,
+        corners: np.ndarray,
+        pattern_size: Tuple[int],
+        scale: float = 1.0,
+    ) -> Optional[np.ndarray]:
+        if scale == 1:
+            return corners
+        return _corner_subpix(img_grey, corners, self.params)
+
+    def roi_margin(self, corners: np.ndarray, scale: float) -> int:
+        return self.params["subpix_window"] + int(np.ceil(2 / scale))
+
+
+# Dark circles on a light board. The blob areas are in full resolution pixels.
+# Circle centres cannot be refined like corners, so points found on a
+# downscaled copy are refined by finding the grid again on the full resolution
+# pixels around it.
+class CircleGridDetector(Detector):
+    name = "circles"
+    asymmetric = False
+    default_params = dict(
+        clustering=False,
+        min_area=25.0,
+        max_area=None,
+        invert=False,
+    )
+
+    def flags(self) -> int:
+        flags = (
+            cv2.CALIB_CB_ASYMMETRIC_GRID
+            if self.asymmetric
+            else cv2.CALIB_CB_SYMMETRIC_GRID
+        )
+        if self.params["clustering"]:
+            flags += cv2.CALIB_CB_CLUSTERING
+        return flags
+
+    def grid_points(
+        self, pattern_size: Tuple[int], grid_square_size: float
+    ) -> np.ndarray:
+        return grid_points(pattern_size, grid_square_size, asymmetric=self.asymmetric)
+
+    def blob_detector(
+        self, img_grey: np.ndarray, scale: float
+    ) -> cv2.SimpleBlobDetector:
+        params = cv2.SimpleBlobDetector_Params()
+        params.blobColor = 255 if self.params["invert"] else 0
+        params.minArea = self.params["min_area"] * scale**2
+        max_area = self.params["max_area"]
+        # By default a circle may cover up to a tenth of the image
+        params.maxArea = img_grey.size / 10 if max_area is None else max_area * scale**2
+        return cv2.SimpleBlobDetector_create(params)
+
+    def find(
+        self, img_grey: np.ndarray, pattern_size: Tuple[int], scale: float = 1.0
+    ) -> Optional[np.ndarray]:
+        retval, centres = cv2.findCirclesGrid(
+            img_grey,
+            pattern_size,
+            flags=self.flags(),
+            blobDetector=self.blob_detector(img_grey, scale),
+        )
+        return centres.reshape(-1, 1, 2) if retval else None
+
+    def refine(
+        self,
+        img_grey: np.ndarray,
+        corners: np.ndarray,
+        pattern_size: Tuple[int],
+        scale: float = 1.0,
+    ) -> Optional[np.ndarray]:
+        if scale == 1:
+            return corners
+        centres = self.find(img_grey, pattern_size)
+        if centres is None:
+            return None
+        # Keep the point order of the coarse detection, which the full
+        # resolution search may have started from another corner
+        distances = np.linalg.norm(
+            centres.reshape(1, -1, 2) - corners.reshape(-1, 1, 2), axis=2
+        )
+        return centres[np.argmin(distances, axis=1)]
+
+    def roi_margin(self, corners: np.ndarray, scale: float) -> int:
+        # Half a grid spacing covers the circles around the outer centres
+        spacing = np.median(
+            np.linalg.norm(np.diff(corners.reshape(-1, 2), axis=0), axis=1)
+        )
+        return int(np.ceil(spacing)) + int(np.ceil(2 / scale))
+
+
+class AsymmetricCircleGridDetector(CircleGridDetector):
+    name = "asymmetric_circles"
+    asymmetric = True
+
+
+_DETECTORS = {
+    detector.name: detector
+    for detector in [
+        ClassicDetector,
+        SectorBasedDetector,
+        CircleGridDetector,
+        AsymmetricCircleGridDetector,
+    ]
+}
+
+
+def create_detector(name: str = "classic", params: Optional[dict] = None) -> Detector:
+    assert (
+        name in _DETECTORS
+    ), f"Expected detector to be one of {supported_detectors()}, but it is {name}!"
+    return _DETECTORS[name](**(params or dict()))
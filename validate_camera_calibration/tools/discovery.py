@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+from typing_extensions import Dict, Iterator, List, Optional, Tuple
+
+from validate_camera_calibration.tools.image import supported_image_extensions
+from validate_camera_calibration.tools.video import supported_video_extensions
+
+# Size and sha256 hex digest a manifest lists for a file, either may be None
+FileChecksum = Tuple[Optional[int], Optional[str]]
+
+# Marks the end of the files found by the discovery thread
+_DONE = object()
+
+
+def scan_files(
+    dir_root: Path, extensions: List[str], recursive: bool = False
+) -> Iterator[str]:
+    # Paths relative to dir_root of the non-hidden files with one of the
+    # extensions, in the order os.scandir lists them. Only the names and the
+    # file types, which scandir reads along with the names on most file
+    # systems, are looked at, so no file is stat'ed. With recursive the
+    # subdirectories are scanned as well, hidden ones and links aside.
+    extensions = set(extensions)
+    dirs = [""]
+    while len(dirs) > 0:
+        dir_relative = dirs.pop()
+        subdirs = []
+        with os.scandir(os.path.join(dir_root, dir_relative)) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                path = os.path.join(dir_relative, entry.name)
+                if recursive and entry.is_dir(follow_symlinks=False):
+                    subdirs.append(path)
+                elif (
+                    os.path.splitext(entry.name)[1].lower() in extensions
+                    and entry.is_file()
+                ):
+                    yield path
+        dirs += sorted(subdirs, reverse=True)
+
+
+def read_manifest(file_manifest: Path) -> Iterator[Tuple[str, FileChecksum]]:
+    # One json object per line with the path of a file, relative to the
+    # manifest, and optionally its size and sha256, in the order listed
+    file_manifest = Path(file_manifest)
+    assert file_manifest.is_file(), f"Expected {file_manifest} to be a file!"
+    dir_manifest = file_manifest.parent
+    with open(file_manifest, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            entry = json.loads(line)
+            assert (
+                isinstance(entry, dict) and "path" in entry
+            ), f"Expected line {line_number} of {file_manifest} to be a json object with a path!"
+            yield os.path.join(dir_manifest, entry["path"]), (
+                entry.get("size"),
+                entry.get("sha256"),
+            )
+
+
+def verify_file(file_path: Path, data: bytes, checksum: FileChecksum) -> None:
+    size, sha256 = checksum
+    assert (
+        size is None or len(data) == size
+    ), f"Expected {file_path} to have {size} bytes as listed in the manifest, but it has {len(data)}!"
+    if sha256 is not None:
+        digest = hashlib.sha256(data).hexdigest()
+        assert (
+            digest == sha256.lower()
+        ), f"Expected {file_path} to have sha256 {sha256} as listed in the manifest, but it has {digest}!"
+
+
+def verify_unread_file(file_path: Path, checksum: FileChecksum) -> None:
+    # Checks a file that is not read otherwise, such as an image served from
+    # the detection cache, against the manifest. Its size is taken with a
+    # stat, and it is only read when the manifest lists a sha256 to check.
+    size, sha256 = checksum
+    if sha256 is not None:
+        with open(file_path, "rb") as f:
+            verify_file(file_path, f.read(), checksum)
+        return
+    file_size = os.stat(file_path).st_size
+    assert (
+        size is None or file_size == size
+    ), f"Expected {file_path} to have {size} bytes as listed in the manifest, but it has {file_size}!"
+
+
+# Finds the image and video files of a calibration directory on a thread,
+# listing it with os.scandir or reading them from a manifest, while the images
+# found so far are already being processed. Images are handed out as they are
+# found, at most depth of them ahead of the consumer, and videos are collected
+# for after the images. With unique_names two images of the same name in
+# different subdirectories, whose exports would overwrite each other, are an
+# error.
+class FileDiscovery:
+    def __init__(
+        self,
+        dir_root: Path,
+        recursive: bool = False,
+        file_manifest: Optional[Path] = None,
+        unique_names: bool = False,
+        depth: int = 1024,
+    ) -> None:
+        assert depth >= 1, f"Expected depth to be at least 1, but it is {depth}!"
+        self.dir_root = Path(dir_root)
+        self.recursive = recursive
+        self.file_manifest = file_manifest
+        self.unique_names = unique_names
+        self.video_files: List[str] = []
+        self.checksums: Dict[str, FileChecksum] = dict()
+        self.n_images = 0
+        # Time spent finding files, not waiting for the consumer
+        self.seconds = 0.0
+        self._waited = 0.0
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __repr__(self) -> str:
+        source = self.file_manifest if self.file_manifest else self.dir_root
+        return f"FileDiscovery({source}, {self.n_images} images, {len(self.video_files)} videos)"
+
+    @property
+    def ordered(self) -> bool:
+        # Files listed in a manifest come in its order, listed ones in none
+        return self.file_manifest is not None
+
+    def files(self) -> Iterator[Tuple[str, Optional[FileChecksum]]]:
+        # Paths relative to dir_root, or as the manifest gives them
+        if self.file_manifest is not None:
+            for path, checksum in read_manifest(self.file_manifest):
+                yield os.path.relpath(path, self.dir_root), checksum
+            return
+        extensions = supported_image_extensions() + supported_video_extensions()
+        for path in scan_files(self.dir_root, extensions, self.recursive):
+            yield path, None
+
+    def _put(self, item: object) -> bool:
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        finally:
+            self._waited += time.perf_counter() - start
+
+    def _discover(self) -> None:
+        start = time.perf_counter()
+        names = set()
+        try:
+            for path, checksum in self.files():
+                suffix = os.path.splitext(path)[1].lower()
+                if suffix in supported_video_extensions():
+                    self.video_files.append(path)
+                    continue
+                assert (
+                    suffix in supported_image_extensions()
+                ), f"Expected {path} to be an image or a video!"
+                if self.unique_names:
+                    name = os.path.basename(path)
+                    assert (
+                        name not in names
+                    ), f"Expected image names to be unique to export them, but {name} is found more than once!"
+                    names.add(name)
+                if checksum is not None:
+                    self.checksums[os.path.join(self.dir_root, path)] = checksum
+                self.n_images += 1
+                if not self._put(path):
+                    return
+            if not self.ordered:
+                self.video_files.sort()
+            self.seconds = time.perf_counter() - start - self._waited
+            self._put(_DONE)
+        except BaseException as error:
+            self._put(error)
+
+    def __iter__(self) -> Iterator[str]:
+        assert self._thread is None, "Expected the files to be discovered only once!"
+        self._thread = threading.Thread(
+            target=self._discover, name="discovery", daemon=True
+        )
+        self._thread.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self._stop.set()
+            self._thread.join()
+
+    def collect(self) -> Tuple[List[str], List[str]]:
+        # All image and video files at once, sorted unless a manifest gives
+        # their order
+        image_files = list(self)
+        if not self.ordered:
+            image_files.sort()
+        return image_files, self.video_files
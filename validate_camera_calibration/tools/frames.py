@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+
+from typing_extensions import Dict, Iterable, List, Optional, Tuple
+
+import validate_camera_calibration.tools.general as gn
+from validate_camera_calibration.tools.projection import rodrigues_batch
+
+np = gn.lazy_import("numpy")
+
+
+def frame_columns(n_points: int) -> Dict[str, Tuple[type, Tuple[int]]]:
+    # dtype and per-frame shape of every column of a FrameStore
+    columns = dict()
+    columns["shapes"] = (np.int32, (2,))
+    columns["detected"] = (np.bool_, ())
+    columns["corners"] = (np.float32, (n_points, 2))
+    columns["rvecs"] = (np.float64, (3,))
+    columns["tvecs"] = (np.float64, (3,))
+    columns["residuals"] = (np.float64, (n_points,))
+    columns["rms"] = (np.float64, ())
+    return columns
+
+
+# Detections, poses and reprojection errors of every frame as one array per
+# quantity, instead of an object per image and a dict per pose. Rows are
+# appended as frames come out of the detection, and the arrays grow by
+# doubling. With dir_memmap the numeric columns are .npy files mapped from
+# that directory, so very long runs are not bound by memory.
+class FrameStore:
+    def __init__(
+        self,
+        n_points: int,
+        capacity: int = 1024,
+        dir_memmap: Optional[Path] = None,
+    ) -> None:
+        assert n_points > 0, f"Expected n_points to be positive, but it is {n_points}!"
+        self.n_points = n_points
+        self.dir_memmap = Path(dir_memmap) if dir_memmap is not None else None
+        if self.dir_memmap is not None:
+            self.dir_memmap.mkdir(parents=True, exist_ok=True)
+        self.source_names: List[str] = []
+        self._n = 0
+        self._capacity = max(1, capacity)
+        self._columns = {
+            name: self._allocate(name, self._capacity)
+            for name in frame_columns(n_points)
+        }
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __repr__(self) -> str:
+        backing = f", memmap in {self.dir_memmap}" if self.dir_memmap else ""
+        return f"FrameStore({self._n} frames, {self.n_detected} detected{backing})"
+
+    def _allocate(self, name: str, capacity: int) -> np.ndarray:
+        dtype, shape = frame_columns(self.n_points)[name]
+        if self.dir_memmap is None:
+            return np.zeros((capacity,) + shape, dtype=dtype)
+        return np.lib.format.open_memmap(
+            os.path.join(self.dir_memmap, f"{name}.npy"),
+            mode="w+",
+            dtype=dtype,
+            shape=(capacity,) + shape,
+        )
+
+    def _grow(self, capacity: int) -> None:
+        for name, column in self._columns.items():
+            if self.dir_memmap is None:
+                grown = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+                grown[: self._n] = column[: self._n]
+            else:
+                # A mapped file cannot grow in place, so copy into a new file
+                # next to it and swap them
+                file_column = os.path.join(self.dir_memmap, f"{name}.npy")
+                file_grown = file_column + ".grow"
+                grown = np.lib.format.open_memmap(
+                    file_grown,
+                    mode="w+",
+                    dtype=column.dtype,
+                    shape=(capacity,) + column.shape[1:],
+                )
+                grown[: self._n] = column[: self._n]
+                del column
+                os.replace(file_grown, file_column)
+            self._columns[name] = grown
+        self._capacity = capacity
+
+    def append(
+        self, source_name: Path, shape: Tuple[int], corners: Optional[np.ndarray]
+    ) -> int:
+        if self._n == self._capacity:
+            self._grow(2 * self._capacity)
+        i = self._n
+        self.source_names.append(str(source_name))
+        self._columns["shapes"][i] = shape[:2]
+        self._columns["detected"][i] = corners is not None
+        if corners is not None:
+            self._columns["corners"][i] = np.reshape(corners, (-1, 2))
+        self._n += 1
+        return i
+
+    @classmethod
+    def from_frames(
+        cls,
+        frames: Iterable[Tuple[Path, Tuple[int], Optional[np.ndarray]]],
+        n_points: int,
+        capacity: int = 1024,
+        dir_memmap: Optional[Path] = None,
+    ) -> FrameStore:
+        store = cls(n_points, capacity=capacity, dir_memmap=dir_memmap)
+        for source_name, shape, corners in frames:
+            store.append(source_name, shape, corners)
+        return store
+
+    @classmethod
+    def from_columns(
+        cls,
+        source_names: List[str],
+        columns: Dict[str, np.ndarray],
+        dir_memmap: Optional[Path] = None,
+    ) -> FrameStore:
+        # Store filled at once with the columns of another, such as the
+        # frames of several stores put together
+        n_points = columns["corners"].shape[1]
+        store = cls(n_points, capacity=len(source_names), dir_memmap=dir_memmap)
+        for name in frame_columns(n_points):
+            assert len(columns[name]) == len(
+                source_names
+            ), f"Expected {len(source_names)} rows in column {name}, but it has {len(columns[name])}!"
+            store._columns[name][: len(source_names)] = columns[name]
+        store.source_names = [str(source_name) for source_name in source_names]
+        store._n = len(source_names)
+        return store
+
+    def extend(self, other: FrameStore) -> np.ndarray:
+        # Appends every row of another store, poses and residuals included,
+        # and returns the indices they are stored at
+        assert (
+            other.n_points == self.n_points
+        ), f"Expected frames with {self.n_points} points, but they have {other.n_points}!"
+        start = self._n
+        capacity = self._capacity
+        while capacity < start + len(other):
+            capacity *= 2
+        if capacity > self._capacity:
+            self._grow(capacity)
+        for name, column in self._columns.items():
+            column[start : start + len(other)] = other._columns[name][: len(other)]
+        self.source_names += other.source_names
+        self._n += len(other)
+        return np.arange(start, self._n)
+
+    def select(self, indices: np.ndarray) -> FrameStore:
+        # New store, in memory, with the given rows in the given order
+        return FrameStore.from_columns(
+            [self.source_names[i] for i in indices],
+            {name: column[indices] for name, column in self.columns().items()},
+        )
+
+    def reorder(self, permutation: np.ndarray) -> None:
+        # Puts the rows in the order of the given permutation of them
+        assert len(permutation) == len(
+            self
+        ), f"Expected a permutation of {len(self)} rows, but it has {len(permutation)}!"
+        for column in self._columns.values():
+            column[: self._n] = column[: self._n][permutation]
+        self.source_names = [self.source_names[i] for i in permutation]
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {name: self._columns[name][: self._n] for name in self._columns}
+
+    # Views of the filled rows of every column
+    @property
+    def shapes(self) -> np.ndarray:
+        return self._columns["shapes"][: self._n]
+
+    @property
+    def detected(self) -> np.ndarray:
+        return self._columns["detected"][: self._n]
+
+    @property
+    def corners(self) -> np.ndarray:
+        return self._columns["corners"][: self._n]
+
+    @property
+    def rvecs(self) -> np.ndarray:
+        return self._columns["rvecs"][: self._n]
+
+    @property
+    def tvecs(self) -> np.ndarray:
+        return self._columns["tvecs"][: self._n]
+
+    @property
+    def residuals(self) -> np.ndarray:
+        return self._columns["residuals"][: self._n]
+
+    @property
+    def rms(self) -> np.ndarray:
+        return self._columns["rms"][: self._n]
+
+    @property
+    def n_detected(self) -> int:
+        return int(np.count_nonzero(self.detected))
+
+    def detected_indices(self) -> np.ndarray:
+        return np.flatnonzero(self.detected)
+
+    def rotation_matrices(self, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        # Rnc of the given frames, all detected frames by default
+        indices = self.detected_indices() if indices is None else indices
+        return np.transpose(rodrigues_batch(self.rvecs[indices]), (0, 2, 1))
+
+    def camera_positions(self, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        # rCNn of the given frames, all detected frames by default
+        indices = self.detected_indices() if indices is None else indices
+        Rnc = self.rotation_matrices(indices)
+        return -np.einsum("nij,nj->ni", Rnc, self.tvecs[indices])
+
+    def pose_arrays(self) -> dict:
+        # Stacked arrays of the poses of the detected frames, as exported
+        indices = self.detected_indices()
+        data = dict()
+        data["source_names"] = np.array(
+            [Path(self.source_names[i]).name for i in indices], dtype=str
+        )
+        data["rCNn"] = self.camera_positions(indices)
+        data["Rnc"] = self.rotation_matrices(indices)
+        data["reprojection_errors"] = np.ascontiguousarray(self.residuals[indices])
+        data["reprojection_rms"] = np.ascontiguousarray(self.rms[indices])
+        return data
+
+    def flush(self) -> None:
+        # The mapped columns have room for more rows than are filled, so the
+        # number of rows and the source names are written next to them
+        if self.dir_memmap is None:
+            return
+        for column in self._columns.values():
+            column.flush()
+        index = dict()
+        index["n_frames"] = self._n
+        index["n_points"] = self.n_points
+        index["source_names"] = self.source_names
+        with open(os.path.join(self.dir_memmap, "frames.json"), "w") as f:
+            json.dump(index, f)
+
+    @classmethod
+    def open(cls, dir_memmap: Path) -> FrameStore:
+        # Maps a store written by flush() back in
+        file_index = Path(os.path.join(dir_memmap, "frames.json"))
+        assert file_index.is_file(), f"Expected {file_index} to be a file!"
+        with open(file_index, "r") as f:
+            index = json.load(f)
+        store = cls.__new__(cls)
+        store.n_points = index["n_points"]
+        store.dir_memmap = Path(dir_memmap)
+        store.source_names = list(index["source_names"])
+        store._n = index["n_frames"]
+        store._columns = {
+            name: np.load(os.path.join(dir_memmap, f"{name}.npy"), mmap_mode="r+")
+            for name in frame_columns(store.n_points)
+        }
+        store._capacity = len(store._columns["detected"])
+        return store
@@ -1,6 +1,33 @@
+import importlib.util
+import resource
+import sys
+from types import ModuleType
 from typing import List, Tuple
 
 
+def lazy_import(name: str) -> ModuleType:
+    # Returns a module that is only executed once one of its attributes is
+    # accessed, so heavy dependencies do not slow down start up when unused
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def load_lazy_modules(*modules: ModuleType) -> None:
+    # Executes lazily imported modules right away. Loading one is not thread
+    # safe, so this has to happen before they are used from several threads.
+    for module in modules:
+        dir(module)
+
+
 def add_extension(file_path: str, extension: str) -> str:
     if not file_path.lower().endswith(extension.lower()):
         if "." in file_path:
@@ -30,3 +57,20 @@ def shape_to_string(shape: List[int]) -> str:
             f"Expected all elements of shape to be integers, but they are of types {[type(s) for s in shape]}."
         )
     return "[" + "x".join([str(s) for s in shape]) + "]"
+
+
+def peak_memory_usage() -> Tuple[int, int]:
+    # Peak resident set size in bytes of this process and of the largest
+    # child process that has finished (i.e. detection workers)
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    peak_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return peak_self, peak_children
+
+
+def format_bytes(n_bytes: int) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if abs(n_bytes) < 1024 or unit == "GiB":
+            break
+        n_bytes /= 1024
+    return f"{n_bytes:.1f} {unit}"
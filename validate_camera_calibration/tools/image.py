@@ -1,21 +1,107 @@
+from __future__ import annotations
+
 from pathlib import Path
 
-import cv2
-import numpy as np
-from typing_extensions import Any, List, Self, Tuple
+from typing_extensions import List, Optional, Self, Tuple
+
+import validate_camera_calibration.tools.general as gn
+from validate_camera_calibration.tools.detectors import Detector, create_detector
+
+cv2 = gn.lazy_import("cv2")
+np = gn.lazy_import("numpy")
 
 
 def supported_image_extensions() -> List[str]:
     return [".jpg", ".jpeg", ".png", ".bmp", ".tiff"]
 
 
+def supported_decode_modes() -> List[str]:
+    return ["color", "grey"]
+
+
+# Scale denominators a JPEG can be decoded at directly, without decoding the
+# full resolution pixels first
+REDUCED_DECODE_FACTORS = (1, 2, 4, 8)
+
+
+def supports_reduced_decode(file_path: Path) -> bool:
+    # OpenCV decodes other formats at full resolution and resizes afterwards
+    return Path(file_path).suffix.lower() in [".jpg", ".jpeg"]
+
+
+def imread_flags(mode: str = "color", reduction: int = 1) -> int:
+    assert (
+        mode in supported_decode_modes()
+    ), f"Expected mode to be one of {supported_decode_modes()}, but it is {mode}!"
+    assert (
+        reduction in REDUCED_DECODE_FACTORS
+    ), f"Expected reduction to be one of {REDUCED_DECODE_FACTORS}, but it is {reduction}!"
+    if reduction == 1:
+        return cv2.IMREAD_COLOR if mode == "color" else cv2.IMREAD_GRAYSCALE
+    name = "COLOR" if mode == "color" else "GRAYSCALE"
+    return getattr(cv2, f"IMREAD_REDUCED_{name}_{reduction}")
+
+
+def decode_reduction(
+    detection_scale: float, image_width: int, image_height: int
+) -> int:
+    # Largest decode reduction that still leaves the coarse search at least
+    # detection_scale of the full resolution, and that divides the image size
+    # so the full resolution shape can be recovered from the reduced one
+    for reduction in sorted(REDUCED_DECODE_FACTORS, reverse=True):
+        if (
+            reduction * detection_scale <= 1
+            and image_width % reduction == 0
+            and image_height % reduction == 0
+        ):
+            return reduction
+    return 1
+
+
+def detection_parameters(
+    pattern_size: Tuple[int],
+    scale: float = 1.0,
+    reduction: int = 1,
+    detector: Optional[Detector] = None,
+    decode_mode: str = "grey",
+) -> dict:
+    # Everything besides the pixels that the result of detect_chessboard depends
+    # on. A file decoded to grey and one decoded in colour and converted to
+    # grey afterwards differ slightly, and so do the corners found in them.
+    assert (
+        decode_mode in supported_decode_modes()
+    ), f"Expected decode_mode to be one of {supported_decode_modes()}, but it is {decode_mode}!"
+    detector = create_detector() if detector is None else detector
+    params = dict()
+    params["pattern_size"] = list(pattern_size)
+    params["scale"] = scale
+    params["decode_mode"] = decode_mode
+    if reduction > 1:
+        params["decode_reduction"] = reduction
+    params.update(detector.cache_parameters())
+    return params
+
+
 class Image:
-    def __init__(self, img: np.ndarray, file_path: Path = None) -> None:
+    __slots__ = (
+        "img",
+        "shape",
+        "reduction",
+        "file_path",
+        "chess_board_corners",
+        "_has_calibration_artifact_in_frame",
+    )
+
+    def __init__(
+        self, img: np.ndarray, file_path: Path = None, reduction: int = 1
+    ) -> None:
         assert isinstance(
             img, np.ndarray
         ), f"Expected img to be a numpy array, but it is of type {type(img).__name__}!"
         self.img = img
         self.shape = img.shape
+        # Factor by which img is smaller than the image on file
+        self.reduction = reduction
         self._has_calibration_artifact_in_frame = False
         self.file_path = file_path
         self.chess_board_corners = None
@@ -23,31 +109,99 @@ class Image:
     def __repr__(self) -> str:
         return f"Image({self.img.shape})"
 
-    def detect_chessboard(self, pattern_size: Tuple[int]) -> None:
+    @property
+    def full_shape(self) -> Tuple[int]:
+        # Shape of the image before any reduction at decode time
+        return (
+            self.shape[0] * self.reduction,
+            self.shape[1] * self.reduction,
+        ) + self.shape[2:]
+
+    def grey(self) -> np.ndarray:
+        if len(self.img.shape) == 2:
+            return self.img
+        return cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY)
+
+    def detect_chessboard(
+        self,
+        pattern_size: Tuple[int],
+        scale: float = 1.0,
+        detector: Optional[Detector] = None,
+    ) -> None:
         assert isinstance(
             pattern_size, tuple
         ), f"Expected pattern_size to be a list, but it is of type {type(pattern_size).__name__}!"
         assert len(pattern_size) == 2, "Expected pattern_size to be of length 2!"
-        corners = None
-        flags = (
-            cv2.CALIB_CB_FAST_CHECK
-            + cv2.CALIB_CB_ADAPTIVE_THRESH
-            + cv2.CALIB_CB_NORMALIZE_IMAGE
+        assert 0 < scale <= 1, f"Expected scale to be in (0, 1], but it is {scale}!"
+        assert self.reduction == 1, "Expected a full resolution image!"
+        detector = create_detector() if detector is None else detector
+        if scale < 1:
+            corners = self.find_chessboard_coarse(pattern_size, scale, detector)
+            if corners is None:
+                self.chess_board_corners = None
+                return
+            self.refine_chessboard(corners, pattern_size, scale, detector)
+            return
+        img_grey = self.grey()
+        corners = detector.find(img_grey, pattern_size)
+        if corners is not None:
+            corners = detector.refine(img_grey, corners, pattern_size)
+        self._has_calibration_artifact_in_frame = corners is not None
+        self.chess_board_corners = corners
+
+    def find_chessboard_coarse(
+        self,
+        pattern_size: Tuple[int],
+        scale: float,
+        detector: Optional[Detector] = None,
+    ) -> Optional[np.ndarray]:
+        # Find the board on a copy of the image downscaled by scale, and return
+        # the unrefined corners in full resolution pixels, accounting for both
+        # the downscaling and any reduction at decode time
+        img_small = self.grey()
+        if scale < 1:
+            img_small = cv2.resize(
+                img_small, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+            )
+        detector = create_detector() if detector is None else detector
+        corners = detector.find(img_small, pattern_size, scale / self.reduction)
+        if corners is None:
+            return None
+
+        # Map the corners back to full resolution, accounting for pixel centres
+        total_scale = scale / self.reduction
+        return (corners.reshape(-1, 1, 2) + 0.5) / total_scale - 0.5
+
+    def refine_chessboard(
+        self,
+        corners: np.ndarray,
+        pattern_size: Tuple[int],
+        scale: float,
+        detector: Optional[Detector] = None,
+    ) -> None:
+        # Refine corners found at the given scale on the full resolution pixels
+        # surrounding the board only
+        assert self.reduction == 1, "Expected a full resolution image!"
+        detector = create_detector() if detector is None else detector
+        height, width = self.img.shape[:2]
+        margin = detector.roi_margin(corners, scale)
+        x0, y0 = np.maximum(np.floor(corners.min(axis=(0, 1))).astype(int) - margin, 0)
+        x1, y1 = np.minimum(
+            np.ceil(corners.max(axis=(0, 1))).astype(int) + margin + 1,
+            [width, height],
         )
-        img_grey = cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY)
-        retval, corners = cv2.findChessboardCorners(
-            self.img, pattern_size, corners, flags=flags
+        img_roi = self.img[y0:y1, x0:x1]
+        if len(img_roi.shape) == 3:
+            img_roi = cv2.cvtColor(img_roi, cv2.COLOR_BGR2GRAY)
+        offset = np.array([x0, y0], dtype=np.float32)
+        corners = detector.refine(
+            img_roi,
+            np.ascontiguousarray(corners - offset, dtype=np.float32),
+            pattern_size,
+            scale,
         )
-        if retval:
-            self._has_calibration_artifact_in_frame = True
-            corners = cv2.cornerSubPix(
-                img_grey,
-                corners,
-                (11, 11),
-                (-1, -1),
-                (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001),
-            )
-        self.chess_board_corners = corners
+        self._has_calibration_artifact_in_frame = corners is not None
+        self.chess_board_corners = None if corners is None else corners + offset
 
     def has_chessboard(self) -> bool:
         return self._has_calibration_artifact_in_frame
@@ -58,12 +212,24 @@ class Image:
         ), f"Failed to save {file_path}! Details:\n{self.__repr__()}"
 
     @staticmethod
-    def from_file(file_path: Path) -> Self:
+    def from_file(file_path: Path, mode: str = "color", reduction: int = 1) -> Self:
+        # With mode "grey" the file is decoded straight to a single channel, and
+        # with a reduction above 1 a JPEG is decoded at that fraction of its size
         file_path = Path(file_path)
         assert file_path.exists(), f"Expected {file_path} to exist."
         assert file_path.suffix.lower() in supported_image_extensions(), (
             f"Expected {file_path} to have a supported image extension. "
             f"Supported extensions are {supported_image_extensions()}"
         )
-        img = cv2.imread(str(file_path))
-        return Image(img, file_path)
+        img = cv2.imread(str(file_path), imread_flags(mode, reduction))
+        assert img is not None, f"Failed to decode {file_path}!"
+        return Image(img, file_path, reduction=reduction)
+
+    @staticmethod
+    def from_bytes(
+        data: bytes, file_path: Path, mode: str = "color", reduction: int = 1
+    ) -> Self:
+        # Same as from_file, for the contents of file_path read beforehand
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), imread_flags(mode, reduction))
+        assert img is not None, f"Failed to decode {file_path}!"
+        return Image(img, Path(file_path), reduction=reduction)
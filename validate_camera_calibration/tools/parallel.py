@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import collections
+import os
+from typing import Callable, Iterable, Iterator, Optional
+
+import validate_camera_calibration.tools.general as gn
+
+cv2 = gn.lazy_import("cv2")
+futures = gn.lazy_import("concurrent.futures")
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def _init_worker() -> None:
+    # Each worker process handles one image at a time, so stop OpenCV from
+    # spawning its own thread pool on top of the process pool.
+    cv2.setNumThreads(1)
+
+
+def _init_worker_with(initializer: Callable, initargs: tuple) -> None:
+    _init_worker()
+    initializer(*initargs)
+
+
+def worker_pool(
+    workers: int, initializer: Optional[Callable] = None, initargs: tuple = ()
+) -> futures.ProcessPoolExecutor:
+    # initializer runs once in every worker, e.g. to hand it data that all of
+    # its tasks share instead of sending that data along with each task
+    assert workers >= 1, f"Expected workers to be at least 1, but it is {workers}!"
+    if initializer is None:
+        return futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker
+        )
+    return futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker_with,
+        initargs=(initializer, initargs),
+    )
+
+
+def ordered_map(
+    fn: Callable,
+    items: Iterable,
+    workers: int = 1,
+    chunksize: int = 1,
+    max_pending: Optional[int] = None,
+    executor: Optional[futures.Executor] = None,
+) -> Iterator:
+    # Runs on the given executor if there is one, which is left running
+    # afterwards, and otherwise on a pool of its own
+    assert workers >= 1, f"Expected workers to be at least 1, but it is {workers}!"
+    if executor is not None:
+        yield from _ordered_map(fn, items, executor, chunksize, max_pending)
+        return
+    if workers == 1:
+        yield from map(fn, items)
+        return
+    with worker_pool(workers) as pool:
+        yield from _ordered_map(fn, items, pool, chunksize, max_pending)
+
+
+def _ordered_map(
+    fn: Callable,
+    items: Iterable,
+    pool: futures.Executor,
+    chunksize: int,
+    max_pending: Optional[int],
+) -> Iterator:
+    if max_pending is None:
+        yield from pool.map(fn, items, chunksize=chunksize)
+        return
+    # Executor.map submits every item up front. With max_pending only that
+    # many items are taken from a lazy iterable, such as decoded video
+    # frames, ahead of the consumer.
+    assert (
+        max_pending >= 1
+    ), f"Expected max_pending to be at least 1, but it is {max_pending}!"
+    pending = collections.deque()
+    try:
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from typing_extensions import List, Optional, Tuple
+
+import validate_camera_calibration.tools.general as gn
+
+cv2 = gn.lazy_import("cv2")
+np = gn.lazy_import("numpy")
+
+# A warm started pose is solved again from scratch when its reprojection RMS
+# is above this many pixels and above twice that of the frame before it
+WARM_START_MIN_RMS = 1.0
+WARM_START_RMS_RATIO = 2.0
+
+
+def supported_pnp_methods() -> List[str]:
+    # iterative: Levenberg-Marquardt from a homography initialisation,
+    # ippe: closed form for planar targets, sqpnp and epnp: general closed form
+    return ["iterative", "ippe", "sqpnp", "epnp"]
+
+
+def pnp_flags(method: str) -> int:
+    assert (
+        method in supported_pnp_methods()
+    ), f"Expected method to be one of {supported_pnp_methods()}, but it is {method}!"
+    return getattr(cv2, f"SOLVEPNP_{method.upper()}")
+
+
+def pnp_rms(
+    rPNn: np.ndarray,
+    rQOi: np.ndarray,
+    rvec: np.ndarray,
+    tvec: np.ndarray,
+    Kc: np.ndarray,
+    dist: np.ndarray,
+) -> float:
+    rQOi_projected, _ = cv2.projectPoints(rPNn, rvec, tvec, Kc, dist)
+    residuals = rQOi_projected.reshape(-1, 2) - rQOi.reshape(-1, 2)
+    return float(np.sqrt(np.mean(np.sum(residuals**2, axis=1))))
+
+
+# Solves the pose of the grid in frame after frame. With warm_start every frame
+# starts the iterative solver from the pose of the frame before it, which in an
+# ordered sequence such as a video is already close, so it converges in a few
+# iterations. A frame the previous pose does not suit, such as the first after
+# a cut, is solved again from scratch with the chosen method.
+class PnPSolver:
+    def __init__(
+        self,
+        rPNn: np.ndarray,
+        Kc: np.ndarray,
+        dist: np.ndarray,
+        method: str = "iterative",
+        warm_start: bool = False,
+    ) -> None:
+        self.flags = pnp_flags(method)
+        self.method = method
+        self.warm_start = warm_start
+        self.rPNn = np.ascontiguousarray(rPNn, dtype=np.float64)
+        self.Kc = Kc
+        self.dist = dist
+        self.n_solved = 0
+        self.n_warm_started = 0
+        self.n_restarted = 0
+        self._previous: Optional[Tuple[np.ndarray, np.ndarray, float]] = None
+
+    def __repr__(self) -> str:
+        return f"PnPSolver(method={self.method}, warm_start={self.warm_start})"
+
+    def reset(self) -> None:
+        # Forget the previous pose, e.g. at the start of another sequence
+        self._previous = None
+
+    def _solve_cold(self, rQOi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        retval, rvec, tvec = cv2.solvePnP(
+            self.rPNn, rQOi, self.Kc, self.dist, flags=self.flags
+        )
+        return rvec, tvec
+
+    def solve(self, rQOi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # rvec and tvec of the grid frame n relative to the camera frame c
+        rQOi = np.ascontiguousarray(rQOi, dtype=np.float64).reshape(-1, 2)
+        self.n_solved += 1
+        if not self.warm_start:
+            return self._solve_cold(rQOi)
+
+        if self._previous is None:
+            rvec, tvec = self._solve_cold(rQOi)
+        else:
+            rvec_previous, tvec_previous, rms_previous = self._previous
+            retval, rvec, tvec = cv2.solvePnP(
+                self.rPNn,
+                rQOi,
+                self.Kc,
+                self.dist,
+                rvec_previous.copy(),
+                tvec_previous.copy(),
+                useExtrinsicGuess=True,
+                flags=cv2.SOLVEPNP_ITERATIVE,
+            )
+            self.n_warm_started += 1
+        rms = pnp_rms(self.rPNn, rQOi, rvec, tvec, self.Kc, self.dist)
+
+        if self._previous is not None and (
+            tvec[2, 0] <= 0
+            or rms > max(WARM_START_MIN_RMS, WARM_START_RMS_RATIO * rms_previous)
+        ):
+            rvec_cold, tvec_cold = self._solve_cold(rQOi)
+            rms_cold = pnp_rms(
+                self.rPNn, rQOi, rvec_cold, tvec_cold, self.Kc, self.dist
+            )
+            self.n_restarted += 1
+            if rms_cold < rms or tvec[2, 0] <= 0:
+                rvec, tvec, rms = rvec_cold, tvec_cold, rms_cold
+        self._previous = (rvec, tvec, rms)
+        return rvec, tvec
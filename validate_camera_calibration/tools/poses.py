@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+
+from typing_extensions import List
+
+import validate_camera_calibration.tools.general as gn
+import validate_camera_calibration.tools.yaml_utils as yu
+from validate_camera_calibration.tools.frames import FrameStore
+
+np = gn.lazy_import("numpy")
+yaml = gn.lazy_import("yaml")
+progress = gn.lazy_import("rich.progress")
+
+
+def supported_pose_formats() -> List[str]:
+    return ["yaml", "npz", "jsonl"]
+
+
+def export_poses_yaml(data: dict, dir_poses: Path) -> None:
+    for i in progress.track(range(len(data["source_names"])), "Saving poses"):
+        image_name = Path(str(data["source_names"][i])).stem
+        file_pose = Path(os.path.join(dir_poses, f"pose_{image_name}.yaml"))
+        pose_out = dict()
+        #
+        pose_out["rCNn"] = yu.numpy_to_yaml_dict(data["rCNn"][i].reshape(3, 1))
+        #
+        pose_out["Rnc"] = yu.numpy_to_yaml_dict(data["Rnc"][i])
+        #
+        pose_out["reprojection_error"] = data["reprojection_rms"][i].item()
+        with open(file_pose, "w") as f:
+            yaml.dump(pose_out, f, Dumper=getattr(yaml, "CDumper", yaml.Dumper))
+
+
+def export_poses_npz(data: dict, dir_poses: Path) -> Path:
+    file_poses = Path(os.path.join(dir_poses, "poses.npz"))
+    np.savez(file_poses, **data)
+    return file_poses
+
+
+def export_poses_jsonl(data: dict, dir_poses: Path) -> Path:
+    file_poses = Path(os.path.join(dir_poses, "poses.jsonl"))
+    with open(file_poses, "w") as f:
+        for i, source_name in enumerate(data["source_names"]):
+            pose_out = dict()
+            pose_out["source_name"] = str(source_name)
+            pose_out["rCNn"] = data["rCNn"][i].tolist()
+            pose_out["Rnc"] = data["Rnc"][i].tolist()
+            pose_out["reprojection_error"] = data["reprojection_rms"][i].item()
+            pose_out["reprojection_errors"] = data["reprojection_errors"][i].tolist()
+            f.write(json.dumps(pose_out) + "\n")
+    return file_poses
+
+
+def export_poses(
+    store: FrameStore, dir_poses: Path, poses_format: str = "yaml"
+) -> None:
+    # Exports the poses of the detected frames of the store
+    assert (
+        poses_format in supported_pose_formats()
+    ), f"Expected poses_format to be one of {supported_pose_formats()}, but it is {poses_format}!"
+    data = store.pose_arrays()
+    n_poses = len(data["source_names"])
+    if poses_format == "yaml":
+        export_poses_yaml(data, dir_poses)
+    elif poses_format == "npz":
+        file_poses = export_poses_npz(data, dir_poses)
+        print(f"Saved {n_poses} poses to {file_poses}.")
+    elif poses_format == "jsonl":
+        file_poses = export_poses_jsonl(data, dir_poses)
+        print(f"Saved {n_poses} poses to {file_poses}.")
+
+
+def load_poses(file_path: Path) -> dict:
+    # Reads a poses.npz or poses.jsonl bundle back into stacked arrays, with the
+    # same keys as FrameStore.pose_arrays
+    file_path = Path(file_path)
+    assert file_path.exists(), f"Expected {file_path} to exist."
+    if file_path.suffix == ".npz":
+        with np.load(file_path) as data:
+            return {key: data[key] for key in data.files}
+    assert (
+        file_path.suffix == ".jsonl"
+    ), f"Expected {file_path} to be a .npz or .jsonl file!"
+    with open(file_path, "r") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    data = dict()
+    data["source_names"] = np.array([line["source_name"] for line in lines], dtype=str)
+    data["rCNn"] = np.array([line["rCNn"] for line in lines], dtype=float)
+    data["Rnc"] = np.array([line["Rnc"] for line in lines], dtype=float)
+    data["reprojection_errors"] = np.array(
+        [line["reprojection_errors"] for line in lines], dtype=float
+    )
+    data["reprojection_rms"] = np.array(
+        [line["reprojection_error"] for line in lines], dtype=float
+    )
+    return data
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+
+from typing_extensions import Callable, Iterable, Iterator, Optional
+
+import validate_camera_calibration.tools.general as gn
+from validate_camera_calibration.tools.parallel import ordered_map
+
+np = gn.lazy_import("numpy")
+futures = gn.lazy_import("concurrent.futures")
+
+# Upper bound on the reader threads, reads beyond it only queue up in the
+# file system client anyway
+MAX_PREFETCH_THREADS = 8
+
+
+# Contents of a file read ahead of its consumer, and its pixels when they were
+# decoded ahead as well. Sent to worker processes in place of the file path.
+class PrefetchedFile:
+    __slots__ = ("data", "img", "read_seconds", "decode_seconds")
+
+    def __init__(
+        self,
+        data: bytes,
+        img: Optional[np.ndarray] = None,
+        read_seconds: float = 0.0,
+        decode_seconds: float = 0.0,
+    ) -> None:
+        self.data = data
+        self.img = img
+        self.read_seconds = read_seconds
+        self.decode_seconds = decode_seconds
+
+    def __repr__(self) -> str:
+        decoded = ", decoded" if self.img is not None else ""
+        return f"PrefetchedFile({gn.format_bytes(len(self.data))}{decoded})"
+
+
+def read_file(file_path: Path) -> PrefetchedFile:
+    start = time.perf_counter()
+    with open(file_path, "rb") as f:
+        data = f.read()
+    return PrefetchedFile(data, read_seconds=time.perf_counter() - start)
+
+
+def prefetch(
+    fn: Callable,
+    items: Iterable,
+    depth: int,
+    threads: Optional[int] = None,
+) -> Iterator:
+    # Runs fn on the items on a few threads, at most depth items ahead of the
+    # consumer and in order. Reading a file and decoding it with OpenCV both
+    # release the GIL, so this overlaps with the work done on earlier items.
+    assert depth >= 1, f"Expected depth to be at least 1, but it is {depth}!"
+    threads = min(depth, MAX_PREFETCH_THREADS) if threads is None else threads
+    assert threads >= 1, f"Expected threads to be at least 1, but it is {threads}!"
+    with futures.ThreadPoolExecutor(
+        max_workers=threads, thread_name_prefix="prefetch"
+    ) as pool:
+        yield from ordered_map(fn, items, max_pending=depth, executor=pool)
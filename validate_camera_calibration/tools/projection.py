@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import importlib.util
+
+from typing_extensions import List, Tuple
+
+import validate_camera_calibration.tools.general as gn
+
+cv2 = gn.lazy_import("cv2")
+np = gn.lazy_import("numpy")
+
+# Below this many points the one-off cost of importing numba and loading the
+# compiled kernel outweighs its speed-up over numpy
+NUMBA_MIN_POINTS = 100000
+
+
+def projection_backends() -> List[str]:
+    backends = ["numpy", "opencv"]
+    if importlib.util.find_spec("numba") is not None:
+        backends.insert(0, "numba")
+    return backends
+
+
+def _brown_conrady_coefficients(dist: np.ndarray) -> np.ndarray:
+    # k1, k2, p1, p2, k3 as used by cv2.projectPoints
+    dist = np.asarray(dist, dtype=float).flatten()
+    assert dist.size >= 4, "Expected at least 4 distortion coefficients!"
+    coefficients = np.zeros(5)
+    coefficients[: min(dist.size, 5)] = dist[:5]
+    return coefficients
+
+
+def _supports_brown_conrady(dist: np.ndarray) -> bool:
+    dist = np.asarray(dist, dtype=float).flatten()
+    return dist.size <= 5 or not np.any(dist[5:])
+
+
+def rodrigues_batch(rvecs: np.ndarray) -> np.ndarray:
+    rvecs = np.asarray(rvecs, dtype=float).reshape(-1, 3)
+    theta = np.linalg.norm(rvecs, axis=1)
+    small = theta < 1e-12
+    k = rvecs / np.where(small, 1.0, theta)[:, None]
+    K = np.zeros((rvecs.shape[0], 3, 3))
+    K[:, 0, 1] = -k[:, 2]
+    K[:, 0, 2] = k[:, 1]
+    K[:, 1, 0] = k[:, 2]
+    K[:, 1, 2] = -k[:, 0]
+    K[:, 2, 0] = -k[:, 1]
+    K[:, 2, 1] = k[:, 0]
+    s = np.sin(theta)[:, None, None]
+    c = np.cos(theta)[:, None, None]
+    R = np.eye(3) + s * K + (1 - c) * (K @ K)
+    R[small] = np.eye(3)
+    return R
+
+
+def _project_numpy(
+    rPNn: np.ndarray,
+    rvecs: np.ndarray,
+    tvecs: np.ndarray,
+    Kc: np.ndarray,
+    coefficients: np.ndarray,
+) -> np.ndarray:
+    k1, k2, p1, p2, k3 = coefficients
+    R = rodrigues_batch(rvecs)
+    # Points in camera coordinates, (N, P, 3)
+    rPCc = np.einsum("nij,npj->npi", R, rPNn) + tvecs[:, None, :]
+    z = rPCc[..., 2]
+    z = np.where(z != 0, 1.0 / z, 1.0)
+    x = rPCc[..., 0] * z
+    y = rPCc[..., 1] * z
+    r2 = x * x + y * y
+    radial = 1 + r2 * (k1 + r2 * (k2 + r2 * k3))
+    xy2 = 2 * x * y
+    xd = x * radial + p1 * xy2 + p2 * (r2 + 2 * x * x)
+    yd = y * radial + p1 * (r2 + 2 * y * y) + p2 * xy2
+    rQOi = np.empty(rPCc.shape[:2] + (2,))
+    rQOi[..., 0] = Kc[0, 0] * xd + Kc[0, 2]
+    rQOi[..., 1] = Kc[1, 1] * yd + Kc[1, 2]
+    return rQOi
+
+
+def _project_opencv(
+    rPNn: np.ndarray,
+    rvecs: np.ndarray,
+    tvecs: np.ndarray,
+    Kc: np.ndarray,
+    dist: np.ndarray,
+) -> np.ndarray:
+    rQOi = np.empty(rPNn.shape[:2] + (2,))
+    for n in range(rPNn.shape[0]):
+        rQOi_n, _ = cv2.projectPoints(rPNn[n], rvecs[n], tvecs[n], Kc, dist)
+        rQOi[n] = rQOi_n.reshape(-1, 2)
+    return rQOi
+
+
+def project_points_batch(
+    rPNn: np.ndarray,
+    rvecs: np.ndarray,
+    tvecs: np.ndarray,
+    Kc: np.ndarray,
+    dist: np.ndarray,
+    backend: str = "auto",
+) -> np.ndarray:
+    rvecs = np.ascontiguousarray(rvecs, dtype=float).reshape(-1, 3)
+    tvecs = np.ascontiguousarray(tvecs, dtype=float).reshape(-1, 3)
+    n_frames = rvecs.shape[0]
+    assert (
+        tvecs.shape[0] == n_frames
+    ), f"Expected {n_frames} tvecs, but there are {tvecs.shape[0]}!"
+    rPNn = np.asarray(rPNn, dtype=float)
+    if rPNn.ndim == 2:
+        rPNn = np.broadcast_to(rPNn, (n_frames,) + rPNn.shape)
+    assert rPNn.ndim == 3 and rPNn.shape[2] == 3, "Expected rPNn to be (N, P, 3)!"
+    assert (
+        rPNn.shape[0] == n_frames
+    ), f"Expected {n_frames} sets of object points, but there are {rPNn.shape[0]}!"
+    Kc = np.asarray(Kc, dtype=float)
+
+    if backend == "auto":
+        backend = "numpy"
+        if rPNn.shape[0] * rPNn.shape[1] >= NUMBA_MIN_POINTS:
+            backend = projection_backends()[0]
+    assert (
+        backend in projection_backends()
+    ), f"Expected backend to be one of {projection_backends()}, but it is {backend}!"
+    if not _supports_brown_conrady(dist):
+        # Higher order distortion models are only handled by OpenCV
+        backend = "opencv"
+
+    if backend == "opencv":
+        return _project_opencv(rPNn, rvecs, tvecs, Kc, dist)
+    coefficients = _brown_conrady_coefficients(dist)
+    if backend == "numba":
+        from validate_camera_calibration.tools.projection_numba import project_numba
+
+        return project_numba(np.ascontiguousarray(rPNn), rvecs, tvecs, Kc, coefficients)
+    return _project_numpy(rPNn, rvecs, tvecs, Kc, coefficients)
+
+
+def reprojection_errors_batch(
+    rPNn: np.ndarray,
+    rQOi: np.ndarray,
+    rvecs: np.ndarray,
+    tvecs: np.ndarray,
+    Kc: np.ndarray,
+    dist: np.ndarray,
+    backend: str = "auto",
+) -> np.ndarray:
+    # Residual norms as one contiguous (N, P) array
+    rQOi = np.asarray(rQOi, dtype=float)
+    rQOi = rQOi.reshape(rQOi.shape[0], -1, 2)
+    rQOi_reprojected = project_points_batch(rPNn, rvecs, tvecs, Kc, dist, backend)
+    return np.ascontiguousarray(np.linalg.norm(rQOi_reprojected - rQOi, axis=2))
+
+
+def reprojection_statistics(reprojection_errors: np.ndarray) -> Tuple[float]:
+    # RMS, mean and standard deviation over every point of every frame
+    reprojection_errors = np.asarray(reprojection_errors)
+    rms = np.sqrt(np.mean(reprojection_errors**2))
+    return rms, np.mean(reprojection_errors), np.std(reprojection_errors)
@@ -0,0 +1,57 @@
+import os
+
+import numba
+import numpy as np
+
+# Worker pools fork this process, and a process that forked after a kernel ran
+# on TBB threads hangs at exit, so OpenMP and the workqueue are tried first
+if "NUMBA_THREADING_LAYER_PRIORITY" not in os.environ:
+    numba.config.THREADING_LAYER_PRIORITY = ["omp", "workqueue", "tbb"]
+
+
+# Same model as projection._project_numpy, compiled and parallelised over frames
+@numba.njit(parallel=True, cache=True)
+def project_numba(rPNn, rvecs, tvecs, Kc, coefficients):
+    k1, k2, p1, p2, k3 = coefficients
+    fx = Kc[0, 0]
+    fy = Kc[1, 1]
+    cx = Kc[0, 2]
+    cy = Kc[1, 2]
+    n_frames, n_points = rPNn.shape[0], rPNn.shape[1]
+    rQOi = np.empty((n_frames, n_points, 2))
+    for n in numba.prange(n_frames):
+        rx, ry, rz = rvecs[n, 0], rvecs[n, 1], rvecs[n, 2]
+        theta = np.sqrt(rx * rx + ry * ry + rz * rz)
+        if theta < 1e-12:
+            R = np.eye(3)
+        else:
+            kx, ky, kz = rx / theta, ry / theta, rz / theta
+            s = np.sin(theta)
+            c = np.cos(theta)
+            C = 1 - c
+            R = np.empty((3, 3))
+            R[0, 0] = c + kx * kx * C
+            R[0, 1] = kx * ky * C - kz * s
+            R[0, 2] = kx * kz * C + ky * s
+            R[1, 0] = ky * kx * C + kz * s
+            R[1, 1] = c + ky * ky * C
+            R[1, 2] = ky * kz * C - kx * s
+            R[2, 0] = kz * kx * C - ky * s
+            R[2, 1] = kz * ky * C + kx * s
+            R[2, 2] = c + kz * kz * C
+        for p in range(n_points):
+            X, Y, Z = rPNn[n, p, 0], rPNn[n, p, 1], rPNn[n, p, 2]
+            xc = R[0, 0] * X + R[0, 1] * Y + R[0, 2] * Z + tvecs[n, 0]
+            yc = R[1, 0] * X + R[1, 1] * Y + R[1, 2] * Z + tvecs[n, 1]
+            zc = R[2, 0] * X + R[2, 1] * Y + R[2, 2] * Z + tvecs[n, 2]
+            zc = 1.0 / zc if zc != 0 else 1.0
+            x = xc * zc
+            y = yc * zc
+            r2 = x * x + y * y
+            radial = 1 + r2 * (k1 + r2 * (k2 + r2 * k3))
+            xy2 = 2 * x * y
+            xd = x * radial + p1 * xy2 + p2 * (r2 + 2 * x * x)
+            yd = y * radial + p1 * (r2 + 2 * y * y) + p2 * xy2
+            rQOi[n, p, 0] = fx * xd + cx
+            rQOi[n, p, 1] = fy * yd + cy
+    return rQOi
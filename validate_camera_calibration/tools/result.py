@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from typing_extensions import List, Optional, Tuple
+
+import validate_camera_calibration.tools.general as gn
+from validate_camera_calibration.tools.camera import Camera
+from validate_camera_calibration.tools.crossval import CrossValidation
+from validate_camera_calibration.tools.detectors import Detector
+from validate_camera_calibration.tools.frames import FrameStore
+from validate_camera_calibration.tools.pnp import PnPSolver
+from validate_camera_calibration.tools.timing import StageTimer
+
+np = gn.lazy_import("numpy")
+
+
+# Outcome of validating a camera calibration on a set of frames. The corners,
+# pose and residuals of every frame stay in the columns of the FrameStore, next
+# to the reprojection statistics over all detected frames and, if they were
+# asked for, their bootstrap intervals and the cross-validation. Nothing is
+# printed or written to disk to build one; the command line prints its repr.
+class ValidationResult:
+    def __init__(
+        self,
+        camera: Camera,
+        pattern_size: Tuple[int],
+        rPNn: np.ndarray,
+        detector: Detector,
+        store: FrameStore,
+        solver: PnPSolver,
+        statistics: Tuple[float],
+        intervals: Optional[np.ndarray] = None,
+        cross_validation: Optional[CrossValidation] = None,
+        timer: Optional[StageTimer] = None,
+    ) -> None:
+        self.camera = camera
+        self.pattern_size = pattern_size
+        self.rPNn = rPNn
+        self.detector = detector
+        self.store = store
+        self.solver = solver
+        self.statistics = statistics
+        self.intervals = intervals
+        self.cross_validation = cross_validation
+        self.timer = timer
+
+    @property
+    def n_frames(self) -> int:
+        return len(self.store)
+
+    @property
+    def n_poses(self) -> int:
+        return self.store.n_detected
+
+    @property
+    def source_names(self) -> List[str]:
+        return self.store.source_names
+
+    @property
+    def detected(self) -> np.ndarray:
+        return self.store.detected
+
+    @property
+    def rms(self) -> float:
+        return self.statistics[0]
+
+    @property
+    def mean(self) -> float:
+        return self.statistics[1]
+
+    @property
+    def std(self) -> float:
+        return self.statistics[2]
+
+    def poses(self) -> dict:
+        # rCNn, Rnc and residuals of the detected frames, same keys as the
+        # exported npz poses
+        return self.store.pose_arrays()
+
+    def frame(self, index: int) -> dict:
+        # Everything known about one frame, detected or not
+        data = dict()
+        data["source_name"] = self.store.source_names[index]
+        data["detected"] = bool(self.store.detected[index])
+        if data["detected"]:
+            data["corners"] = self.store.corners[index].copy()
+            data["rvec"] = self.store.rvecs[index].copy()
+            data["tvec"] = self.store.tvecs[index].copy()
+            data["reprojection_errors"] = self.store.residuals[index].copy()
+            data["reprojection_rms"] = float(self.store.rms[index])
+        return data
+
+    def as_dict(self) -> dict:
+        # Summary without the per-frame arrays, ready for json
+        data = dict()
+        data["frames"] = self.n_frames
+        data["poses"] = self.n_poses
+        data["detector"] = self.detector.name
+        data["pnp_method"] = self.solver.method
+        data["reprojection_rms"] = float(self.rms)
+        data["reprojection_mean"] = float(self.mean)
+        data["reprojection_std"] = float(self.std)
+        # 95% bootstrap confidence intervals over frames, if computed
+        intervals = (None,) * 3 if self.intervals is None else self.intervals
+        for name, interval in zip(["rms", "mean", "std"], intervals):
+            data[f"reprojection_{name}_ci"] = (
+                None if interval is None else [float(x) for x in interval]
+            )
+        data["cross_validation"] = (
+            None if self.cross_validation is None else self.cross_validation.as_dict()
+        )
+        if self.timer is not None:
+            data["timings"] = self.timer.as_dict()
+        return data
+
+    def __repr__(self) -> str:
+        intervals = (None,) * 3 if self.intervals is None else self.intervals
+        out_str = f"Reprojection error from {self.n_poses} image frames, each with {len(self.rPNn)} points:\n"
+        for label, value, interval in zip(
+            ["  RMS", " Mean", "  STD"], self.statistics, intervals
+        ):
+            out_str += f"{label}: {value:4g} [pix]"
+            if interval is not None:
+                out_str += f", 95% CI [{interval[0]:4g}, {interval[1]:4g}]"
+            out_str += "\n"
+        if self.cross_validation is not None:
+            out_str += str(self.cross_validation)
+        return out_str
@@ -0,0 +1,494 @@
+from __future__ import annotations
+
+import collections
+import json
+import os
+import signal
+import socketserver
+import stat
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from typing_extensions import Dict, List, Optional, Tuple
+
+import validate_camera_calibration.tools.general as gn
+from validate_camera_calibration.tools.camera import Camera
+from validate_camera_calibration.tools.detectors import Detector
+from validate_camera_calibration.tools.parallel import worker_pool
+from validate_camera_calibration.tools.pnp import PnPSolver
+from validate_camera_calibration.tools.prefetch import PrefetchedFile
+from validate_camera_calibration.tools.projection import reprojection_errors_batch
+from validate_camera_calibration.tools.timing import StageTimer
+from validate_camera_calibration.tools.validation import (
+    load_calibration_setup,
+    process_image_file,
+)
+
+cv2 = gn.lazy_import("cv2")
+np = gn.lazy_import("numpy")
+
+# Frames the latency percentiles are taken over, and seconds the recent
+# throughput is measured over
+LATENCY_WINDOW = 1000
+THROUGHPUT_WINDOW = 60.0
+
+# Detection state a worker keeps between requests: the camera, whose
+# undistortion maps are built on first use and then reused, the grid and the
+# detector. Handed over once by the pool initializer.
+_STATE = dict()
+
+
+def _init_service_worker(
+    camera: Camera,
+    pattern_size: Tuple[int],
+    detector: Detector,
+    detection_scale: float,
+) -> None:
+    _STATE.update(
+        camera=camera,
+        pattern_size=pattern_size,
+        detector=detector,
+        detection_scale=detection_scale,
+    )
+
+
+def _worker_pid(_: int) -> int:
+    return os.getpid()
+
+
+def detect_frame(
+    task: Tuple[Path, Optional[bytes], Optional[Path]],
+) -> Tuple[Tuple[int], Optional[np.ndarray], dict]:
+    # Frames are posted as the bytes of an image file, which are decoded as if
+    # they had been read ahead, or as the path of a file to read
+    image_path, data, dir_undistorted = task
+    prefetched = None if data is None else PrefetchedFile(data)
+    return process_image_file(
+        (image_path, True, prefetched, None),
+        pattern_size=_STATE["pattern_size"],
+        camera=_STATE["camera"],
+        dir_undistorted=dir_undistorted,
+        detection_scale=_STATE["detection_scale"],
+        detector=_STATE["detector"],
+    )
+
+
+# Validates frames as they are posted, with the camera, the grid detector and
+# the worker pool loaded once for the lifetime of the service. Requests come in
+# on several threads at once, so the counters behind the metrics are guarded
+# by a lock. With a single worker frames are processed on the request threads.
+class ValidationService:
+    def __init__(
+        self,
+        camera: Camera,
+        pattern_size: Tuple[int],
+        rPNn: np.ndarray,
+        detector: Detector,
+        workers: int = 1,
+        detection_scale: float = 1.0,
+        pnp_method: str = "iterative",
+        dir_base: Optional[Path] = None,
+        dir_undistorted: Optional[Path] = None,
+    ) -> None:
+        assert workers >= 1, f"Expected workers to be at least 1, but it is {workers}!"
+        self.camera = camera
+        self.pattern_size = pattern_size
+        self.rPNn = rPNn
+        self.detector = detector
+        self.workers = workers
+        self.detection_scale = detection_scale
+        self.pnp_method = pnp_method
+        # Relative paths in requests are relative to this directory
+        self.dir_base = dir_base
+        # Undistorted frames are only ever written below this directory
+        self.dir_undistorted = dir_undistorted
+        self.timer = StageTimer()
+        self.start_time = time.time()
+        self.n_requests = 0
+        self.n_frames = 0
+        self.n_detected = 0
+        self.n_errors = 0
+        self.n_pending = 0
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self._completed = collections.deque()
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def __repr__(self) -> str:
+        return (
+            f"ValidationService(workers={self.workers}, detector={self.detector.name})"
+        )
+
+    def start(self) -> None:
+        # Load OpenCV and numpy before requests arrive on several threads at
+        # once, and start every worker, so the first frame does not wait for it
+        gn.load_lazy_modules(cv2, np)
+        shared = (self.camera, self.pattern_size, self.detector, self.detection_scale)
+        if self.workers == 1:
+            _init_service_worker(*shared)
+            return
+        self._pool = worker_pool(self.workers, _init_service_worker, shared)
+        list(self._pool.map(_worker_pid, range(self.workers)))
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self) -> ValidationService:
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def resolve(self, image_path: str) -> Path:
+        image_path = Path(image_path)
+        if self.dir_base is not None and not image_path.is_absolute():
+            image_path = Path(os.path.join(self.dir_base, image_path))
+        return image_path
+
+    def undistorted_directory(self, dir_undistorted: str) -> Path:
+        # Directory a request names for its undistorted frames, relative to
+        # the service's own. Anything that resolves outside of it, such as an
+        # absolute path or one going up with .., is refused, as any client
+        # that reaches the service can name one.
+        assert (
+            self.dir_undistorted is not None
+        ), "Expected the service to be started with a directory for undistorted frames!"
+        dir_root = os.path.realpath(self.dir_undistorted)
+        dir_export = os.path.realpath(os.path.join(dir_root, str(dir_undistorted)))
+        assert (
+            os.path.commonpath([dir_root, dir_export]) == dir_root
+        ), f"Expected undistorted_dir to be inside {self.dir_undistorted}, but it is {dir_undistorted}!"
+        return Path(dir_export)
+
+    def _frame_result(
+        self,
+        image_path: Path,
+        shape: Tuple[int],
+        corners: Optional[np.ndarray],
+        timings: dict,
+    ) -> dict:
+        data = dict()
+        data["name"] = str(image_path)
+        data["shape"] = [int(x) for x in shape[:2]]
+        height, width = shape[:2]
+        assert (width, height) == (
+            self.camera.image_width,
+            self.camera.image_height,
+        ), f"Expected image size to be {self.camera.image_width}x{self.camera.image_height}, but it is {width}x{height}!"
+        data["detected"] = corners is not None
+        if corners is not None:
+            start = time.perf_counter()
+            solver = PnPSolver(
+                self.rPNn, self.camera.Kc, self.camera.dist, method=self.pnp_method
+            )
+            rvec, tvec = solver.solve(corners)
+            reprojection_errors = reprojection_errors_batch(
+                self.rPNn,
+                corners.reshape(1, -1, 2),
+                rvec.reshape(1, 3),
+                tvec.reshape(1, 3),
+                self.camera.Kc,
+                self.camera.dist,
+            )[0]
+            timings["pnp"] = time.perf_counter() - start
+            Rnc = cv2.Rodrigues(rvec)[0].T
+            data["corners"] = corners.reshape(-1, 2).tolist()
+            data["rvec"] = rvec.reshape(3).tolist()
+            data["tvec"] = tvec.reshape(3).tolist()
+            data["rCNn"] = (-Rnc @ tvec.reshape(3)).tolist()
+            data["Rnc"] = Rnc.tolist()
+            data["reprojection_errors"] = reprojection_errors.tolist()
+            data["reprojection_rms"] = float(np.sqrt(np.mean(reprojection_errors**2)))
+        data["timings_ms"] = {
+            stage: 1e3 * seconds for stage, seconds in timings.items()
+        }
+        return data
+
+    def process(
+        self,
+        tasks: List[Tuple[Path, Optional[bytes]]],
+        dir_undistorted: Optional[Path] = None,
+    ) -> List[dict]:
+        # Corners, pose and reprojection errors of every frame, in the order
+        # of the tasks. A frame that fails gets an error instead, and does not
+        # fail the others. dir_undistorted comes from undistorted_directory.
+        start = time.perf_counter()
+        if dir_undistorted is not None:
+            dir_undistorted.mkdir(parents=True, exist_ok=True)
+        tasks = [
+            (self.resolve(image_path) if data is None else Path(image_path), data)
+            for image_path, data in tasks
+        ]
+        with self._lock:
+            self.n_requests += 1
+            self.n_pending += len(tasks)
+
+        results = []
+        if self._pool is None:
+            pending = [None] * len(tasks)
+        else:
+            pending = [
+                self._pool.submit(detect_frame, (image_path, data, dir_undistorted))
+                for image_path, data in tasks
+            ]
+        for (image_path, data), future in zip(tasks, pending):
+            try:
+                if future is None:
+                    detection = detect_frame((image_path, data, dir_undistorted))
+                else:
+                    detection = future.result()
+                result = self._frame_result(image_path, *detection)
+            except Exception as error:
+                result = dict(
+                    name=str(image_path), error=f"{type(error).__name__}: {error}"
+                )
+            results.append(result)
+            self._record(result, time.perf_counter() - start)
+        return results
+
+    def _record(self, result: dict, seconds: float) -> None:
+        with self._lock:
+            self.n_pending -= 1
+            self.n_frames += 1
+            if "error" in result:
+                self.n_errors += 1
+                return
+            self.n_detected += int(result["detected"])
+            self._latencies.append(seconds)
+            now = time.time()
+            self._completed.append(now)
+            while self._completed[0] < now - THROUGHPUT_WINDOW:
+                self._completed.popleft()
+            for stage, ms in result["timings_ms"].items():
+                self.timer.add(stage, ms / 1e3, summed_over_workers=stage != "pnp")
+
+    def status(self) -> dict:
+        data = dict()
+        data["status"] = "ok"
+        data["pid"] = os.getpid()
+        data["uptime_seconds"] = time.time() - self.start_time
+        data["workers"] = self.workers
+        data["detector"] = self.detector.name
+        data["detector_params"] = self.detector.params
+        data["pattern_size"] = list(self.pattern_size)
+        data["detection_scale"] = self.detection_scale
+        data["pnp_method"] = self.pnp_method
+        camera = dict()
+        camera["from_file"] = (
+            str(self.camera.from_file) if self.camera.from_file is not None else None
+        )
+        camera["image_width"] = self.camera.image_width
+        camera["image_height"] = self.camera.image_height
+        camera["camera_matrix"] = self.camera.Kc.tolist()
+        camera["distortion_coefficients"] = self.camera.dist.tolist()
+        data["camera"] = camera
+        return data
+
+    def metrics(self) -> dict:
+        with self._lock:
+            uptime = time.time() - self.start_time
+            latencies = np.array(self._latencies)
+            recent = len(self._completed)
+            data = dict()
+            data["uptime_seconds"] = uptime
+            data["requests"] = self.n_requests
+            data["frames"] = self.n_frames
+            data["detected"] = self.n_detected
+            data["errors"] = self.n_errors
+            # Frames received but not answered yet
+            data["queue_depth"] = self.n_pending
+            data["frames_per_second"] = self.n_frames / uptime if uptime > 0 else 0.0
+            data["recent_frames_per_second"] = recent / min(THROUGHPUT_WINDOW, uptime)
+            # Time from receiving a request to finishing each of its frames
+            latency = dict()
+            if len(latencies) > 0:
+                for name, q in [("p50", 50), ("p95", 95), ("p99", 99)]:
+                    latency[name] = 1e3 * float(np.percentile(latencies, q))
+                latency["max"] = 1e3 * float(np.max(latencies))
+            data["latency_ms"] = latency
+            data["stages"] = self.timer.as_dict()
+        return data
+
+
+def request_length(headers: Dict[str, str]) -> int:
+    # Bytes in the request body, none without a Content-Length header
+    length = headers.get("Content-Length", "0").strip()
+    assert (
+        length.isdigit()
+    ), f"Expected Content-Length to be a non-negative integer, but it is {length}!"
+    return int(length)
+
+
+def parse_frames_request(
+    body: bytes, content_type: str, query: Dict[str, List[str]], index: int
+) -> Tuple[List[Tuple[str, Optional[bytes]]], Optional[str]]:
+    # A json body names image files with "path" or "paths", any other body is
+    # the bytes of one image file, named by the name query parameter. The
+    # undistorted frames are exported to "undistorted_dir" if it is given, a
+    # directory relative to that of the service.
+    if content_type.split(";")[0].strip() == "application/json":
+        request = json.loads(body or b"{}")
+        assert isinstance(request, dict), "Expected a json object!"
+        paths = request.get("paths", [request["path"]] if "path" in request else [])
+        assert (
+            isinstance(paths, list) and len(paths) > 0
+        ), "Expected the request to name at least one image file in path or paths!"
+        return [(str(path), None) for path in paths], request.get("undistorted_dir")
+    assert len(body) > 0, "Expected the request body to hold an image file!"
+    name = query.get("name", [f"frame_{index:06d}.png"])[0]
+    return [(name, body)], query.get("undistorted_dir", [None])[0]
+
+
+def make_handler(service: ValidationService) -> type:
+    class ValidationRequestHandler(BaseHTTPRequestHandler):
+        # Keep connections open between requests, so a client pays for the
+        # connection once and not per frame
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+        def send_json(
+            self, status: HTTPStatus, data: dict, close: bool = False
+        ) -> None:
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if close:
+                self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            path = urlparse(self.path).path
+            if path == "/status":
+                self.send_json(HTTPStatus.OK, service.status())
+            elif path == "/metrics":
+                self.send_json(HTTPStatus.OK, service.metrics())
+            else:
+                self.send_json(HTTPStatus.NOT_FOUND, dict(error=f"No such path {path}"))
+
+        def do_POST(self) -> None:
+            start = time.perf_counter()
+            url = urlparse(self.path)
+            try:
+                body = self.rfile.read(request_length(self.headers))
+            except (AssertionError, ValueError) as error:
+                # Without its length the body cannot be told apart from the
+                # next request, so the connection is closed after the answer
+                self.send_json(
+                    HTTPStatus.BAD_REQUEST, dict(error=str(error)), close=True
+                )
+                return
+            if url.path != "/frames":
+                self.send_json(
+                    HTTPStatus.NOT_FOUND, dict(error=f"No such path {url.path}")
+                )
+                return
+            try:
+                tasks, dir_undistorted = parse_frames_request(
+                    body,
+                    self.headers.get("Content-Type", ""),
+                    parse_qs(url.query),
+                    service.n_requests,
+                )
+                if dir_undistorted is not None:
+                    dir_undistorted = service.undistorted_directory(dir_undistorted)
+            except (AssertionError, KeyError, ValueError) as error:
+                self.send_json(HTTPStatus.BAD_REQUEST, dict(error=str(error)))
+                return
+            try:
+                frames = service.process(tasks, dir_undistorted)
+            except Exception as error:
+                # Errors of single frames are in their results, anything else
+                # still gets an answer rather than a dropped connection
+                self.send_json(
+                    HTTPStatus.INTERNAL_SERVER_ERROR,
+                    dict(error=f"{type(error).__name__}: {error}"),
+                )
+                return
+            latency_ms = 1e3 * (time.perf_counter() - start)
+            self.send_json(HTTPStatus.OK, dict(frames=frames, latency_ms=latency_ms))
+
+    return ValidationRequestHandler
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(
+    service: ValidationService,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    socket_path: Optional[Path] = None,
+) -> socketserver.BaseServer:
+    handler = make_handler(service)
+    if socket_path is None:
+        return ThreadingHTTPServer((host, port), handler)
+    socket_path = Path(socket_path)
+    if socket_path.exists():
+        # Left behind by a service that did not shut down cleanly
+        assert stat.S_ISSOCK(
+            socket_path.stat().st_mode
+        ), f"Expected {socket_path} to be a socket or not to exist!"
+        socket_path.unlink()
+    return UnixHTTPServer(str(socket_path), handler)
+
+
+def serve(
+    dir_base: Path,
+    dir_calibration: Path,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    socket_path: Optional[Path] = None,
+    workers: int = 1,
+    file_camera_params: Optional[Path] = None,
+    detection_scale: float = 1.0,
+    pnp_method: str = "iterative",
+    detector_name: Optional[str] = None,
+) -> None:
+    camera, pattern_size, rPNn, detector = load_calibration_setup(
+        dir_calibration, file_camera_params, detector_name
+    )
+    service = ValidationService(
+        camera,
+        pattern_size,
+        rPNn,
+        detector,
+        workers=workers,
+        detection_scale=detection_scale,
+        pnp_method=pnp_method,
+        dir_base=dir_calibration,
+        dir_undistorted=Path(os.path.join(dir_base, "undistorted")),
+    )
+    with service:
+        server = create_server(service, host, port, socket_path)
+        if socket_path is None:
+            host, port = server.server_address[:2]
+            print(f"Serving on http://{host}:{port} with {workers} workers.")
+        else:
+            print(f"Serving on {socket_path} with {workers} workers.")
+        print("POST images or paths to /frames, GET /status and /metrics.")
+        # Stop the same way on SIGTERM as on Ctrl+C. serve_forever only
+        # returns when shut down from another thread.
+        signal.signal(
+            signal.SIGTERM,
+            lambda *args: threading.Thread(target=server.shutdown).start(),
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if socket_path is not None and Path(socket_path).exists():
+                Path(socket_path).unlink()
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import glob
+import json
+import os
+from pathlib import Path
+
+from typing_extensions import Dict, List, Tuple
+
+import validate_camera_calibration.tools.general as gn
+from validate_camera_calibration.tools.frames import FrameStore, frame_columns
+
+np = gn.lazy_import("numpy")
+
+# Version of the partial result files, raised whenever their content changes
+PARTIAL_VERSION = 1
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    # "i/n" is the i-th of n shards, counting from 1
+    index, _, count = shard.partition("/")
+    assert (
+        index.isdigit() and count.isdigit()
+    ), f"Expected a shard to be given as i/n, but it is {shard}!"
+    index, count = int(index), int(count)
+    assert (
+        1 <= index <= count
+    ), f"Expected the shard index to be in [1, {count}], but it is {index}!"
+    return index, count
+
+
+def shard_range(n_items: int, shard: Tuple[int, int]) -> range:
+    # Contiguous block of the sorted items, the blocks of all shards differ in
+    # size by at most one item
+    index, count = shard
+    return range((index - 1) * n_items // count, index * n_items // count)
+
+
+def shard_videos(n_videos: int, shard: Tuple[int, int]) -> List[int]:
+    # The frames of a video are read in order, so each video goes to one shard
+    index, count = shard
+    return list(range(index - 1, n_videos, count))
+
+
+def shard_directory(dir_base: Path) -> Path:
+    return Path(os.path.join(dir_base, "shards"))
+
+
+def partial_file_name(shard: Tuple[int, int]) -> str:
+    index, count = shard
+    return f"shard_{index:0{len(str(count))}d}_of_{count}.npz"
+
+
+def find_partial_files(dir_base: Path) -> List[Path]:
+    return sorted(
+        Path(f) for f in glob.glob(os.path.join(shard_directory(dir_base), "*.npz"))
+    )
+
+
+def frame_order(
+    image_indices: range, video_frames: List[Tuple[int, int]]
+) -> np.ndarray:
+    # Group and position of every frame of a shard, in the order they are
+    # stored. Group 0 holds the images by their index among all image files,
+    # group 1 + j the frames of video j in the order they were read, so sorting
+    # the frames of all shards by it gives the order of a run without shards.
+    groups = [np.zeros(len(image_indices), dtype=np.int64)]
+    positions = [np.asarray(image_indices, dtype=np.int64)]
+    for video_index, n_frames in video_frames:
+        groups.append(np.full(n_frames, 1 + video_index, dtype=np.int64))
+        positions.append(np.arange(n_frames, dtype=np.int64))
+    return np.stack([np.concatenate(groups), np.concatenate(positions)], axis=1)
+
+
+def save_partial(
+    file_path: Path,
+    store: FrameStore,
+    order: np.ndarray,
+    metadata: dict,
+    arrays: Dict[str, np.ndarray],
+) -> None:
+    # The columns of the frames of one shard, with the setup it ran with:
+    # settings in metadata and the camera and grid in arrays, kept as they
+    # are. Written to a temporary file first, so a merge never reads a
+    # partial that is cut short.
+    assert len(order) == len(
+        store
+    ), f"Expected an order for each of the {len(store)} frames, but got {len(order)}!"
+    metadata = dict(metadata, version=PARTIAL_VERSION, n_points=store.n_points)
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_tmp = Path(str(file_path) + ".tmp")
+    with open(file_tmp, "wb") as f:
+        np.savez(
+            f,
+            metadata=np.array(json.dumps(metadata)),
+            source_names=np.array(store.source_names, dtype=str),
+            order=order,
+            **store.columns(),
+            **{f"setup_{name}": array for name, array in arrays.items()},
+        )
+    os.replace(file_tmp, file_path)
+
+
+def load_partial(
+    file_path: Path,
+) -> Tuple[dict, Dict[str, np.ndarray], List[str], np.ndarray, Dict[str, np.ndarray]]:
+    file_path = Path(file_path)
+    assert file_path.is_file(), f"Expected {file_path} to be a file!"
+    with np.load(file_path) as data:
+        metadata = json.loads(str(data["metadata"]))
+        assert (
+            metadata.get("version") == PARTIAL_VERSION
+        ), f"Expected {file_path} to be a partial result of version {PARTIAL_VERSION}!"
+        source_names = data["source_names"].tolist()
+        order = data["order"]
+        columns = {name: data[name] for name in frame_columns(metadata["n_points"])}
+        arrays = {
+            name[len("setup_") :]: data[name]
+            for name in data.files
+            if name.startswith("setup_")
+        }
+    return metadata, arrays, source_names, order, columns
+
+
+def _differing_keys(a: dict, b: dict, arrays: bool = False) -> List[str]:
+    def same(x, y) -> bool:
+        if arrays:
+            return (
+                x is not None
+                and y is not None
+                and x.dtype == y.dtype
+                and np.array_equal(x, y)
+            )
+        return x == y
+
+    return sorted(key for key in set(a) | set(b) if not same(a.get(key), b.get(key)))
+
+
+def merge_partials(
+    file_paths: List[Path],
+) -> Tuple[FrameStore, dict, Dict[str, np.ndarray]]:
+    # Frames of every shard of a run put together in the order a run without
+    # shards stores them. All shards must be there, once, and have run with
+    # the same setup.
+    assert len(file_paths) > 0, "Expected at least one partial result to merge!"
+    partials = [load_partial(file_path) for file_path in file_paths]
+
+    metadata, arrays = partials[0][:2]
+    setup = {key: value for key, value in metadata.items() if key != "shard"}
+    count = metadata["shard"][1]
+    found = dict()
+    for file_path, (other, other_arrays, _, _, _) in zip(file_paths, partials):
+        index, other_count = other["shard"]
+        assert (
+            other_count == count
+        ), f"Expected {file_path} to be a shard of {count}, but it is one of {other_count}!"
+        assert (
+            index not in found
+        ), f"Expected one partial result of shard {index}/{count}, but got {found.get(index)} and {file_path}!"
+        found[index] = file_path
+        other_setup = {key: value for key, value in other.items() if key != "shard"}
+        differing = _differing_keys(setup, other_setup) + _differing_keys(
+            arrays, other_arrays, arrays=True
+        )
+        assert (
+            len(differing) == 0
+        ), f"Expected every shard to run with the same setup, but {file_path} differs from {file_paths[0]} in {differing}!"
+    missing = [index for index in range(1, count + 1) if index not in found]
+    assert (
+        len(missing) == 0
+    ), f"Expected partial results of all {count} shards, but shards {missing} are missing!"
+
+    source_names = [name for _, _, names, _, _ in partials for name in names]
+    order = np.concatenate([order for _, _, _, order, _ in partials])
+    permutation = np.lexsort((order[:, 1], order[:, 0]))
+    columns: Dict[str, np.ndarray] = {
+        name: np.concatenate([columns[name] for *_, columns in partials])[permutation]
+        for name in frame_columns(metadata["n_points"])
+    }
+    store = FrameStore.from_columns([source_names[i] for i in permutation], columns)
+    return store, setup, arrays
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from typing_extensions import Tuple
+
+import validate_camera_calibration.tools.general as gn
+
+np = gn.lazy_import("numpy")
+
+
+# Count, mean and sum of squared deviations of a set of samples. Two sets are
+# combined with the parallel update of Chan et al., so statistics over many
+# frames are kept up to date without stacking every residual again, and the
+# contribution of a frame can be taken out again when it changes.
+class RunningStatistics:
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0) -> None:
+        self.count = int(count)
+        self.mean = float(mean)
+        self.m2 = float(m2)
+
+    @classmethod
+    def from_samples(cls, samples: np.ndarray) -> RunningStatistics:
+        samples = np.asarray(samples, dtype=float).ravel()
+        if samples.size == 0:
+            return cls()
+        mean = np.mean(samples)
+        return cls(samples.size, mean, np.sum((samples - mean) ** 2))
+
+    def __repr__(self) -> str:
+        rms, mean, std = self.as_tuple()
+        return f"RunningStatistics(count={self.count}, rms={rms:4g}, mean={mean:4g}, std={std:4g})"
+
+    def __add__(self, other: RunningStatistics) -> RunningStatistics:
+        count = self.count + other.count
+        if count == 0:
+            return RunningStatistics()
+        delta = other.mean - self.mean
+        mean = self.mean + delta * other.count / count
+        m2 = self.m2 + other.m2 + delta**2 * self.count * other.count / count
+        return RunningStatistics(count, mean, m2)
+
+    def __sub__(self, other: RunningStatistics) -> RunningStatistics:
+        # Inverse of __add__, for removing samples that were merged in before
+        count = self.count - other.count
+        assert count >= 0, "Expected to remove at most as many samples as were added!"
+        if count == 0:
+            return RunningStatistics()
+        mean = (self.mean * self.count - other.mean * other.count) / count
+        delta = other.mean - mean
+        m2 = self.m2 - other.m2 - delta**2 * count * other.count / self.count
+        return RunningStatistics(count, mean, max(m2, 0.0))
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.count if self.count > 0 else 0.0
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.variance))
+
+    @property
+    def rms(self) -> float:
+        return float(np.sqrt(self.variance + self.mean**2))
+
+    def as_tuple(self) -> Tuple[float]:
+        # Same order as projection.reprojection_statistics
+        return self.rms, self.mean, self.std
+
+
+def bootstrap_intervals(
+    reprojection_errors: np.ndarray,
+    n_resamples: int = 1000,
+    confidence: float = 0.95,
+    seed: int = 0,
+    max_elements: int = 1 << 22,
+) -> np.ndarray:
+    # Percentile intervals of the RMS, mean and standard deviation, one row
+    # each, from resampling whole frames with replacement. The points of a
+    # frame share its pose and are not independent, so resampling points
+    # would make the intervals too narrow. Every statistic follows from the
+    # per-frame sums of the residuals and their squares, so a resample only
+    # adds up n_frames numbers. Resamples are drawn in blocks of at most
+    # max_elements indices to bound memory.
+    assert (
+        n_resamples > 0
+    ), f"Expected n_resamples to be positive, but it is {n_resamples}!"
+    assert (
+        0 < confidence < 1
+    ), f"Expected confidence to be between 0 and 1, but it is {confidence}!"
+    reprojection_errors = np.asarray(reprojection_errors, dtype=float)
+    reprojection_errors = reprojection_errors.reshape(len(reprojection_errors), -1)
+    n_frames, n_points = reprojection_errors.shape
+    assert n_frames > 0, "Expected residuals of at least one frame!"
+    sums = np.sum(reprojection_errors, axis=1)
+    squares = np.sum(reprojection_errors**2, axis=1)
+
+    rng = np.random.default_rng(seed)
+    block = max(1, max_elements // n_frames)
+    mean = np.empty(n_resamples)
+    mean_square = np.empty(n_resamples)
+    for start in range(0, n_resamples, block):
+        stop = min(start + block, n_resamples)
+        indices = rng.integers(
+            0, n_frames, size=(stop - start, n_frames), dtype=np.int32
+        )
+        mean[start:stop] = np.sum(np.take(sums, indices), axis=1)
+        mean_square[start:stop] = np.sum(np.take(squares, indices), axis=1)
+    mean /= n_frames * n_points
+    mean_square /= n_frames * n_points
+    resampled = np.stack(
+        [
+            np.sqrt(mean_square),
+            mean,
+            np.sqrt(np.maximum(mean_square - mean**2, 0.0)),
+        ]
+    )
+    tail = 100 * (1 - confidence) / 2
+    return np.percentile(resampled, [tail, 100 - tail], axis=1).T
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+from typing_extensions import List, Tuple
+
+import validate_camera_calibration.tools.general as gn
+from validate_camera_calibration.tools.camera import Camera
+from validate_camera_calibration.tools.detectors import grid_points
+
+cv2 = gn.lazy_import("cv2")
+np = gn.lazy_import("numpy")
+yaml = gn.lazy_import("yaml")
+progress = gn.lazy_import("rich.progress")
+
+
+def synthetic_camera(image_width: int, image_height: int) -> Camera:
+    # Moderate barrel distortion, focal length giving a ~65 degree field of view
+    f = 0.8 * image_width
+    Kc = np.array(
+        [[f, 0.0, (image_width - 1) / 2], [0.0, f, (image_height - 1) / 2], [0, 0, 1]]
+    )
+    dist = np.array([[-0.12, 0.04, 0.0005, -0.0005, 0.0]])
+    return Camera(Kc, dist, image_width, image_height)
+
+
+def supported_grid_types() -> List[str]:
+    return ["chessboard", "circles", "asymmetric_circles"]
+
+
+def grid_extent(pattern_size: Tuple[int], grid_type: str = "chessboard") -> Tuple[int]:
+    # Columns and rows of grid spacings the points span, plus one. The columns
+    # of an asymmetric circle grid are two spacings apart.
+    assert (
+        grid_type in supported_grid_types()
+    ), f"Expected grid_type to be one of {supported_grid_types()}, but it is {grid_type}!"
+    if grid_type == "asymmetric_circles":
+        return (2 * pattern_size[0], pattern_size[1])
+    return tuple(pattern_size)
+
+
+def random_board_poses(
+    n_images: int,
+    pattern_size: Tuple[int],
+    grid_square_size: float,
+    camera: Camera,
+    rng: np.random.Generator,
+    grid_type: str = "chessboard",
+) -> Tuple[np.ndarray, np.ndarray]:
+    # Board poses that keep the whole grid in view, as rvecs and tvecs of the
+    # board frame n relative to the camera frame c
+    pattern_size = grid_extent(pattern_size, grid_type)
+    board_width = (pattern_size[0] + 1) * grid_square_size
+    board_height = (pattern_size[1] + 1) * grid_square_size
+    f = camera.Kc[0, 0]
+    distance = (
+        2.0
+        * f
+        * max(board_width / camera.image_width, board_height / camera.image_height)
+    )
+    rvecs = np.empty((n_images, 3))
+    tvecs = np.empty((n_images, 3))
+    for i in range(n_images):
+        rvec = rng.normal(0, [0.25, 0.25, 0.15])
+        R, _ = cv2.Rodrigues(rvec)
+        z = distance * rng.uniform(0.9, 1.3)
+        centre = np.array(
+            [
+                rng.uniform(-0.1, 0.1) * z * camera.image_width / f,
+                rng.uniform(-0.1, 0.1) * z * camera.image_height / f,
+                z,
+            ]
+        )
+        # Place the centre of the grid at the chosen point in front of the camera
+        rMNn = np.array(
+            [
+                (pattern_size[0] - 1) * grid_square_size / 2,
+                (pattern_size[1] - 1) * grid_square_size / 2,
+                0.0,
+            ]
+        )
+        rvecs[i] = rvec.flatten()
+        tvecs[i] = centre - R @ rMNn
+    return rvecs, tvecs
+
+
+def board_texture(
+    pattern_size: Tuple[int], pixels_per_square: int, grid_type: str = "chessboard"
+) -> np.ndarray:
+    # Board texture with a one square white border around the squares. Grid
+    # point (x, y), in grid spacings, lies at texture pixel (x + 2, y + 2) * s
+    # - 0.5, as texture pixel u covers [u - 0.5, u + 0.5].
+    s = pixels_per_square
+    n_cols, n_rows = np.add(grid_extent(pattern_size, grid_type), 1)
+    texture = np.full(((n_rows + 2) * s, (n_cols + 2) * s), 255, np.uint8)
+    if grid_type == "chessboard":
+        for row in range(n_rows):
+            for col in range(n_cols):
+                if (row + col) % 2 == 0:
+                    texture[
+                        (row + 1) * s : (row + 2) * s, (col + 1) * s : (col + 2) * s
+                    ] = 0
+    else:
+        # Dark dots drawn with 8 bits of subpixel precision
+        shift = 8
+        rPNn = grid_points(
+            pattern_size, 1.0, asymmetric=grid_type == "asymmetric_circles"
+        )
+        for x, y, _ in rPNn:
+            centre = np.round(((np.array([x, y]) + 2) * s - 0.5) * 2**shift)
+            cv2.circle(
+                texture,
+                tuple(int(c) for c in centre),
+                int(round(0.3 * s * 2**shift)),
+                0,
+                thickness=-1,
+                lineType=cv2.LINE_AA,
+                shift=shift,
+            )
+    return cv2.GaussianBlur(texture, (0, 0), s / 32)
+
+
+def render_board(
+    camera: Camera,
+    rvec: np.ndarray,
+    tvec: np.ndarray,
+    pattern_size: Tuple[int],
+    grid_square_size: float,
+    distortion_maps: Tuple[np.ndarray, np.ndarray],
+    pixels_per_square: int = 64,
+    grid_type: str = "chessboard",
+) -> np.ndarray:
+    s = pixels_per_square
+    texture = board_texture(pattern_size, s, grid_type)
+
+    # The first grid point is the origin of the board frame
+    scale = grid_square_size / s
+    A = np.array(
+        [
+            [scale, 0.0, (0.5 - 2 * s) * scale],
+            [0.0, scale, (0.5 - 2 * s) * scale],
+            [0.0, 0.0, 1.0],
+        ]
+    )
+    R, _ = cv2.Rodrigues(np.asarray(rvec, dtype=float))
+    H = camera.Kc @ np.column_stack([R[:, 0], R[:, 1], np.asarray(tvec).flatten()]) @ A
+    img_ideal = cv2.warpPerspective(
+        texture,
+        H,
+        (camera.image_width, camera.image_height),
+        flags=cv2.INTER_AREA,
+        borderValue=160,
+    )
+
+    # Distort by sampling the ideal image at the undistorted location of every pixel
+    img = cv2.remap(img_ideal, *distortion_maps, cv2.INTER_LINEAR, borderValue=160)
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+
+def distortion_maps(camera: Camera) -> Tuple[np.ndarray, np.ndarray]:
+    # For each distorted pixel, the pixel it comes from in an ideal pinhole image
+    ys, xs = np.mgrid[0 : camera.image_height, 0 : camera.image_width]
+    pixels = np.stack([xs.ravel(), ys.ravel()], axis=-1).astype(np.float32)
+    criteria = (cv2.TERM_CRITERIA_COUNT + cv2.TERM_CRITERIA_EPS, 40, 1e-10)
+    pixels = pixels.reshape(-1, 1, 2)
+    if hasattr(cv2, "undistortPointsIter"):
+        # OpenCV 4 only iterates to a criteria in this separate function
+        undistorted = cv2.undistortPointsIter(
+            pixels, camera.Kc, camera.dist, None, camera.Kc, criteria
+        )
+    else:
+        undistorted = cv2.undistortPoints(
+            pixels, camera.Kc, camera.dist, R=None, P=camera.Kc, criteria=criteria
+        )
+    undistorted = undistorted.reshape(camera.image_height, camera.image_width, 2)
+    return undistorted[..., 0].copy(), undistorted[..., 1].copy()
+
+
+def generate_dataset(
+    dir_base: Path,
+    n_images: int = 20,
+    image_width: int = 1280,
+    image_height: int = 960,
+    pattern_size: Tuple[int] = (9, 6),
+    grid_square_size: float = 0.03,
+    n_blank_images: int = 0,
+    extension: str = ".png",
+    seed: int = 0,
+    grid_type: str = "chessboard",
+) -> Path:
+    # Writes <dir_base>/calibration in the layout expected by validate, together
+    # with the true board poses in <dir_base>/ground_truth.npz
+    dir_base = Path(dir_base)
+    dir_calibration = Path(os.path.join(dir_base, "calibration"))
+    dir_calibration.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    camera = synthetic_camera(image_width, image_height)
+    camera.to_file(os.path.join(dir_calibration, "camera_params.yaml"))
+    calibration_grid = dict()
+    calibration_grid["grid_width"] = pattern_size[0]
+    calibration_grid["grid_height"] = pattern_size[1]
+    calibration_grid["grid_square_size"] = grid_square_size
+    if grid_type != "chessboard":
+        calibration_grid["detector"] = grid_type
+    with open(os.path.join(dir_calibration, "calibration_grid_params.yaml"), "w") as f:
+        yaml.dump(calibration_grid, f)
+
+    rvecs, tvecs = random_board_poses(
+        n_images, pattern_size, grid_square_size, camera, rng, grid_type=grid_type
+    )
+    maps = distortion_maps(camera)
+    source_names = []
+    for i in progress.track(range(n_images), "Rendering synthetic images"):
+        img = render_board(
+            camera,
+            rvecs[i],
+            tvecs[i],
+            pattern_size,
+            grid_square_size,
+            maps,
+            grid_type=grid_type,
+        )
+        noise = rng.normal(0, 2.0, img.shape)
+        img = np.clip(img + noise, 0, 255).astype(np.uint8)
+        source_names.append(f"frame_{i:06d}{extension}")
+        cv2.imwrite(os.path.join(dir_calibration, source_names[-1]), img)
+    for i in range(n_blank_images):
+        img = np.full((image_height, image_width, 3), 160, np.uint8)
+        cv2.imwrite(os.path.join(dir_calibration, f"blank_{i:06d}{extension}"), img)
+
+    Rcn = np.stack([cv2.Rodrigues(rvec)[0] for rvec in rvecs])
+    Rnc = np.transpose(Rcn, (0, 2, 1))
+    rCNn = -np.einsum("nij,nj->ni", Rnc, tvecs)
+    np.savez(
+        os.path.join(dir_base, "ground_truth.npz"),
+        source_names=np.array(source_names, dtype=str),
+        rvecs=rvecs,
+        tvecs=tvecs,
+        rCNn=rCNn,
+        Rnc=Rnc,
+        pattern_size=np.array(pattern_size),
+        grid_square_size=grid_square_size,
+        grid_type=grid_type,
+    )
+    return dir_calibration
@@ -0,0 +1,83 @@
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from typing_extensions import Iterator
+
+import validate_camera_calibration.tools.general as gn
+
+
+class StageTimer:
+    # Wall time, frame count and peak memory per pipeline stage. Stages that
+    # run inside worker processes are accumulated with add() and report time
+    # summed over all workers rather than wall time.
+    def __init__(self) -> None:
+        self.stages = dict()
+
+    def _stage(self, name: str, summed_over_workers: bool) -> dict:
+        if name not in self.stages:
+            stage = dict()
+            stage["seconds"] = 0.0
+            stage["frames"] = 0
+            stage["peak_rss_bytes"] = 0
+            stage["summed_over_workers"] = summed_over_workers
+            self.stages[name] = stage
+        return self.stages[name]
+
+    def add(
+        self,
+        name: str,
+        seconds: float,
+        frames: int = 1,
+        summed_over_workers: bool = True,
+    ) -> None:
+        stage = self._stage(name, summed_over_workers)
+        stage["seconds"] += seconds
+        stage["frames"] += frames
+
+    @contextmanager
+    def measure(self, name: str, frames: int = 0) -> Iterator[dict]:
+        # The stage is only registered once it finishes, so nested stages are
+        # listed before the stage enclosing them
+        counts = dict(frames=frames)
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            stage = self._stage(name, False)
+            stage["seconds"] += time.perf_counter() - start
+            stage["frames"] += counts["frames"]
+            stage["peak_rss_bytes"] = max(gn.peak_memory_usage())
+
+    def as_dict(self) -> dict:
+        data = dict()
+        for name, stage in self.stages.items():
+            data[name] = dict(stage)
+            seconds = stage["seconds"]
+            fps = stage["frames"] / seconds if stage["frames"] and seconds > 0 else None
+            data[name]["frames_per_second"] = fps
+        return data
+
+    def __repr__(self) -> str:
+        out_str = f"{'Stage':<20}{'Time [s]':>10}{'Frames':>8}{'Frames/s':>10}{'Peak RSS':>12}\n"
+        for name, stage in self.as_dict().items():
+            label = name + ("*" if stage["summed_over_workers"] else "")
+            fps = stage["frames_per_second"]
+            fps = f"{fps:.1f}" if fps is not None else "-"
+            rss = stage["peak_rss_bytes"]
+            rss = gn.format_bytes(rss) if rss > 0 else "-"
+            out_str += f"{label:<20}{stage['seconds']:>10.3f}{stage['frames']:>8}{fps:>10}{rss:>12}\n"
+        if any(stage["summed_over_workers"] for stage in self.stages.values()):
+            out_str += "* Time summed over worker processes\n"
+        return out_str
+
+    def to_file(self, file_path: Path) -> Path:
+        # Written to the path as given, .json is only added to one without
+        # any extension
+        file_path = Path(file_path)
+        if file_path.suffix == "":
+            file_path = file_path.with_suffix(".json")
+        with open(file_path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+        return file_path
@@ -1,16 +1,81 @@
+from __future__ import annotations
+
+import collections
+import itertools
 import os
 import shutil
+import time
+from functools import partial
 from pathlib import Path
 
-import cv2
-import numpy as np
-import yaml
-from rich.progress import track
+from typing_extensions import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import validate_camera_calibration.tools.general as gn
-import validate_camera_calibration.tools.yaml_utils as yu
+from validate_camera_calibration.tools.cache import DetectionCache, cache_directory
 from validate_camera_calibration.tools.camera import Camera
-from validate_camera_calibration.tools.image import Image, supported_image_extensions
+from validate_camera_calibration.tools.detectors import (
+    Detector,
+    create_detector,
+    grid_points,
+)
+from validate_camera_calibration.tools.discovery import (
+    FileChecksum,
+    FileDiscovery,
+    scan_files,
+    verify_file,
+    verify_unread_file,
+)
+from validate_camera_calibration.tools.frames import FrameStore
+from validate_camera_calibration.tools.image import (
+    Image,
+    decode_reduction as choose_decode_reduction,
+    detection_parameters,
+    supported_image_extensions,
+    supports_reduced_decode,
+)
+from validate_camera_calibration.tools.parallel import ordered_map
+from validate_camera_calibration.tools.pnp import PnPSolver
+from validate_camera_calibration.tools.poses import export_poses as export_poses_to_dir
+from validate_camera_calibration.tools.prefetch import (
+    PrefetchedFile,
+    prefetch,
+    read_file,
+)
+from validate_camera_calibration.tools.projection import (
+    reprojection_errors_batch,
+    reprojection_statistics,
+)
+from validate_camera_calibration.tools.crossval import cross_validate
+from validate_camera_calibration.tools.result import ValidationResult
+from validate_camera_calibration.tools.shards import (
+    find_partial_files,
+    frame_order,
+    merge_partials,
+    partial_file_name,
+    save_partial,
+    shard_directory,
+    shard_range,
+    shard_videos,
+)
+from validate_camera_calibration.tools.statistics import bootstrap_intervals
+from validate_camera_calibration.tools.timing import StageTimer
+from validate_camera_calibration.tools.writer import (
+    EXPORT_MANIFEST,
+    ImageWriter,
+    finish_export_directory,
+    prepare_export_directory,
+)
+from validate_camera_calibration.tools.video import (
+    VideoFrameReader,
+    supported_video_extensions,
+    video_frame_name,
+)
+
+cv2 = gn.lazy_import("cv2")
+np = gn.lazy_import("numpy")
+yaml = gn.lazy_import("yaml")
+progress = gn.lazy_import("rich.progress")
+futures = gn.lazy_import("concurrent.futures")
 
 
 def get_calibration_grid_parameters(file_path: Path) -> dict:
@@ -21,16 +86,664 @@ def get_calibration_grid_parameters(file_path: Path) -> dict:
     return data
 
 
-def validate(
+def process_image(
+    image: Image,
+    detect: bool,
+    pattern_size: Tuple[int],
+    timings: dict,
+    camera: Optional[Camera] = None,
+    dir_undistorted: Optional[Path] = None,
+    detection_scale: float = 1.0,
+    detector: Optional[Detector] = None,
+    writer: Optional[ImageWriter] = None,
+) -> Optional[np.ndarray]:
+    corners = None
+    if detect:
+        start = time.perf_counter()
+        image.detect_chessboard(pattern_size, scale=detection_scale, detector=detector)
+        corners = image.chess_board_corners if image.has_chessboard() else None
+        timings["detect"] = time.perf_counter() - start
+    if dir_undistorted is not None:
+        start = time.perf_counter()
+        writer = ImageWriter() if writer is None else writer
+        image_undistorted = camera.undistort_image(image)
+        writer.write(
+            writer.output_path(dir_undistorted, image.file_path),
+            image_undistorted.img,
+        )
+        timings["export_undistorted"] = time.perf_counter() - start
+    return corners
+
+
+def first_decode(
+    image_path: Path,
+    detect: bool,
+    dir_undistorted: Optional[Path] = None,
+    decode_reduction: int = 1,
+) -> Tuple[str, int]:
+    # Decode mode and reduction an image file is decoded with first. Colour is
+    # only needed for the undistorted export, and otherwise the file is decoded
+    # straight to grey, at reduced resolution for the coarse search of a JPEG.
+    if dir_undistorted is not None:
+        return "color", 1
+    if detect and decode_reduction > 1 and supports_reduced_decode(image_path):
+        return "grey", decode_reduction
+    return "grey", 1
+
+
+def decode_image_file(
+    image_path: Path,
+    prefetched: Optional[PrefetchedFile],
+    mode: str,
+    reduction: int,
+    timings: dict,
+) -> Image:
+    # Decodes the bytes read ahead if there are any, and takes the pixels as
+    # they are if they were decoded ahead with the same mode and reduction
+    start = time.perf_counter()
+    if prefetched is None:
+        image = Image.from_file(image_path, mode=mode, reduction=reduction)
+    elif prefetched.img is not None:
+        image = Image(prefetched.img, Path(image_path), reduction=reduction)
+        prefetched.img = None
+        start -= prefetched.decode_seconds
+    else:
+        image = Image.from_bytes(
+            prefetched.data, image_path, mode=mode, reduction=reduction
+        )
+    timings["decode"] = timings.get("decode", 0.0) + time.perf_counter() - start
+    return image
+
+
+def process_image_file(
+    task: Tuple[Path, bool, Optional[PrefetchedFile], Optional[FileChecksum]],
+    pattern_size: Tuple[int],
+    camera: Optional[Camera] = None,
+    dir_undistorted: Optional[Path] = None,
+    detection_scale: float = 1.0,
+    decode_reduction: int = 1,
+    detector: Optional[Detector] = None,
+    writer: Optional[ImageWriter] = None,
+) -> Tuple[Tuple[int], Optional[np.ndarray], dict]:
+    # Runs in a worker process, so only the image shape, the corners and the
+    # time spent per stage are returned to the caller rather than the decoded
+    # pixels. The undistorted image is exported from here to avoid decoding
+    # every file a second time. The file is read here unless it was read
+    # ahead, in which case its bytes come with the task. A file listed in a
+    # manifest with its size or hash is read whole to check it, and decoded
+    # from the bytes read.
+    image_path, detect, prefetched, checksum = task
+    timings = dict()
+    if checksum is not None and prefetched is None:
+        prefetched = read_file(image_path)
+    # The decode mode follows from the run, not from whether this export is
+    # up to date, so the corners do not depend on what an earlier run wrote
+    mode, reduction = first_decode(
+        image_path, detect, dir_undistorted, decode_reduction
+    )
+    if (
+        dir_undistorted is not None
+        and writer is not None
+        and writer.up_to_date(dir_undistorted, image_path)
+    ):
+        dir_undistorted = None
+    if prefetched is not None:
+        timings["read"] = prefetched.read_seconds
+    if checksum is not None:
+        verify_file(image_path, prefetched.data, checksum)
+    image = decode_image_file(image_path, prefetched, mode, reduction, timings)
+    if reduction > 1:
+        return _process_image_file_reduced(
+            image, prefetched, pattern_size, detection_scale, detector, timings
+        )
+
+    corners = process_image(
+        image,
+        detect,
+        pattern_size,
+        timings,
+        camera=camera,
+        dir_undistorted=dir_undistorted,
+        detection_scale=detection_scale,
+        detector=detector,
+        writer=writer,
+    )
+    return image.shape, corners, timings
+
+
+def _process_image_file_reduced(
+    image: Image,
+    prefetched: Optional[PrefetchedFile],
+    pattern_size: Tuple[int],
+    detection_scale: float,
+    detector: Optional[Detector],
+    timings: dict,
+) -> Tuple[Tuple[int], Optional[np.ndarray], dict]:
+    # Searches a JPEG decoded at a fraction of its size, and only decodes the
+    # full resolution pixels to refine the corners when the board was found
+    start = time.perf_counter()
+    corners = image.find_chessboard_coarse(
+        pattern_size, detection_scale * image.reduction, detector
+    )
+    timings["detect"] = time.perf_counter() - start
+    if corners is None:
+        return image.full_shape, None, timings
+
+    image = decode_image_file(image.file_path, prefetched, "grey", 1, timings)
+    start = time.perf_counter()
+    image.refine_chessboard(corners, pattern_size, detection_scale, detector)
+    timings["detect"] += time.perf_counter() - start
+    corners = image.chess_board_corners if image.has_chessboard() else None
+    return image.shape, corners, timings
+
+
+def prefetch_image_file(
+    task: Tuple[Path, bool, Optional[FileChecksum]],
+    decode: bool = False,
+    dir_undistorted: Optional[Path] = None,
+    decode_reduction: int = 1,
+) -> Tuple[Path, bool, PrefetchedFile, Optional[FileChecksum]]:
+    # Runs on a prefetch thread. Decoding ahead only pays off when detection
+    # runs in this process, as decoded pixels are far larger than the file
+    # to send to a worker process.
+    image_path, detect, checksum = task
+    prefetched = read_file(image_path)
+    if decode:
+        start = time.perf_counter()
+        mode, reduction = first_decode(
+            image_path, detect, dir_undistorted, decode_reduction
+        )
+        prefetched.img = Image.from_bytes(
+            prefetched.data, image_path, mode=mode, reduction=reduction
+        ).img
+        prefetched.decode_seconds = time.perf_counter() - start
+    return image_path, detect, prefetched, checksum
+
+
+def process_video_frame(
+    task: Tuple[Path, np.ndarray],
+    pattern_size: Tuple[int],
+    camera: Optional[Camera] = None,
+    dir_undistorted: Optional[Path] = None,
+    detection_scale: float = 1.0,
+    detector: Optional[Detector] = None,
+    writer: Optional[ImageWriter] = None,
+) -> Tuple[Tuple[int], Optional[np.ndarray], dict]:
+    # Same as process_image_file, for a frame already in memory, such as one
+    # decoded from a video
+    frame_path, img = task
+    timings = dict()
+    image = Image(img, file_path=frame_path)
+    corners = process_image(
+        image,
+        True,
+        pattern_size,
+        timings,
+        camera=camera,
+        dir_undistorted=dir_undistorted,
+        detection_scale=detection_scale,
+        detector=detector,
+        writer=writer,
+    )
+    return image.shape, corners, timings
+
+
+def detect_chessboards(
+    image_paths: Iterable[Path],
+    pattern_size: Tuple[int],
+    workers: int = 1,
+    cache: Optional[DetectionCache] = None,
+    camera: Optional[Camera] = None,
+    dir_undistorted: Optional[Path] = None,
+    detection_scale: float = 1.0,
+    timer: Optional[StageTimer] = None,
+    decode_reduction: int = 1,
+    prefetch_depth: int = 0,
+    detector: Optional[Detector] = None,
+    writer: Optional[ImageWriter] = None,
+    checksums: Optional[Dict[str, FileChecksum]] = None,
+    executor: Optional[futures.Executor] = None,
+    save_cache: bool = True,
+) -> Iterator[Tuple[Path, Tuple[int], Optional[np.ndarray]]]:
+    # With save_cache False the caller saves the cache, such as one that
+    # calls this many times over and only saves now and then
+    assert (
+        dir_undistorted is None or camera is not None
+    ), "Expected a camera to export undistorted images!"
+    assert (
+        prefetch_depth >= 0
+    ), f"Expected prefetch_depth to be non-negative, but it is {prefetch_depth}!"
+    checksums = dict() if checksums is None else checksums
+
+    # Serve what we can from the cache and only decode the remaining images,
+    # and the cached ones whose undistorted export is missing or out of date.
+    # Images are taken from image_paths as the workers get to them, so work
+    # starts while they are still being found. Each is queued with its cache
+    # entry, and the queue is worked off in step with the decoded ones.
+    queued = collections.deque()
+
+    def tasks() -> Iterator[Tuple[Path, bool, Optional[FileChecksum]]]:
+        for image_path in image_paths:
+            entry = cache.get(image_path) if cache is not None else None
+            export = dir_undistorted is not None
+            if (
+                export
+                and writer is not None
+                and writer.up_to_date(dir_undistorted, image_path)
+            ):
+                writer.n_kept += 1
+                export = False
+            decode = entry is None or export
+            checksum = checksums.get(image_path)
+            if checksum is not None and not decode:
+                # Decoded images are checked by the workers as they read them
+                verify_unread_file(image_path, checksum)
+            queued.append((image_path, entry, decode))
+            if decode:
+                yield image_path, entry is None, checksum
+
+    process = partial(
+        process_image_file,
+        pattern_size=pattern_size,
+        camera=camera,
+        dir_undistorted=dir_undistorted,
+        detection_scale=detection_scale,
+        decode_reduction=decode_reduction,
+        detector=detector,
+        writer=writer,
+    )
+    if prefetch_depth == 0:
+        processed = ordered_map(
+            process,
+            (
+                (image_path, detect, None, checksum)
+                for image_path, detect, checksum in tasks()
+            ),
+            workers=workers,
+            max_pending=4 * workers,
+            executor=executor,
+        )
+    else:
+        # Files are read on threads up to prefetch_depth ahead of the workers,
+        # which only take as many as they can work on, so the read ahead bytes
+        # do not pile up in front of a process pool
+        gn.load_lazy_modules(cv2, np)
+        prefetched = prefetch(
+            partial(
+                prefetch_image_file,
+                decode=workers == 1,
+                dir_undistorted=dir_undistorted,
+                decode_reduction=decode_reduction,
+            ),
+            tasks(),
+            prefetch_depth,
+        )
+        processed = ordered_map(
+            process,
+            prefetched,
+            workers=workers,
+            max_pending=2 * workers,
+            executor=executor,
+        )
+    complete = False
+    try:
+        for shape, corners, timings in processed:
+            image_path, entry, decode = queued.popleft()
+            while not decode:
+                yield (image_path, *entry)
+                image_path, entry, decode = queued.popleft()
+            if timer is not None:
+                for stage, seconds in timings.items():
+                    timer.add(stage, seconds)
+            if entry is not None:
+                shape, corners = entry
+            elif cache is not None:
+                cache.put(image_path, shape, corners)
+            yield image_path, shape, corners
+        # Only cached images are left once every decoded one is done
+        while len(queued) > 0:
+            image_path, entry, _ = queued.popleft()
+            yield (image_path, *entry)
+        complete = True
+    finally:
+        processed.close()
+        if prefetch_depth > 0:
+            prefetched.close()
+        if cache is not None and save_cache:
+            cache.save(prune=complete)
+
+
+def detect_chessboards_in_frames(
+    frames: Iterable[Tuple[Path, np.ndarray]],
+    pattern_size: Tuple[int],
+    workers: int = 1,
+    camera: Optional[Camera] = None,
+    dir_undistorted: Optional[Path] = None,
+    detection_scale: float = 1.0,
+    timer: Optional[StageTimer] = None,
+    executor: Optional[futures.Executor] = None,
+    detector: Optional[Detector] = None,
+    writer: Optional[ImageWriter] = None,
+) -> Iterator[Tuple[Path, Tuple[int], Optional[np.ndarray]]]:
+    # Named frames already in memory are handed to the workers in order with
+    # only a few of them in flight, so frames that are produced one by one,
+    # such as those of a long video, are never all held in memory
+    assert (
+        dir_undistorted is None or camera is not None
+    ), "Expected a camera to export undistorted images!"
+    frame_paths = collections.deque()
+
+    def tasks() -> Iterator[Tuple[Path, np.ndarray]]:
+        for frame_path, img in frames:
+            frame_paths.append(frame_path)
+            yield frame_path, img
+
+    process = partial(
+        process_video_frame,
+        pattern_size=pattern_size,
+        camera=camera,
+        dir_undistorted=dir_undistorted,
+        detection_scale=detection_scale,
+        detector=detector,
+        writer=writer,
+    )
+    processed = ordered_map(
+        process,
+        tasks(),
+        workers=workers,
+        max_pending=2 * workers,
+        executor=executor,
+    )
+    try:
+        for shape, corners, timings in processed:
+            if timer is not None:
+                for stage, seconds in timings.items():
+                    timer.add(stage, seconds)
+            yield frame_paths.popleft(), shape, corners
+    finally:
+        processed.close()
+
+
+def detect_chessboards_in_video(
+    reader: VideoFrameReader,
+    pattern_size: Tuple[int],
+    workers: int = 1,
+    camera: Optional[Camera] = None,
+    dir_undistorted: Optional[Path] = None,
+    detection_scale: float = 1.0,
+    timer: Optional[StageTimer] = None,
+    executor: Optional[futures.Executor] = None,
+    detector: Optional[Detector] = None,
+    writer: Optional[ImageWriter] = None,
+) -> Iterator[Tuple[Path, Tuple[int], Optional[np.ndarray]]]:
+    # Frames are decoded here, in order, while the workers search the ones
+    # before them. Without an undistorted export only the grey frame is sent
+    # to the workers.
+    dir_video = reader.video_path.parent
+
+    def frames() -> Iterator[Tuple[Path, np.ndarray]]:
+        frames = iter(reader)
+        while True:
+            start = time.perf_counter()
+            frame = next(frames, None)
+            if frame is None:
+                return
+            frame_index, img = frame
+            if dir_undistorted is None:
+                img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            if timer is not None:
+                timer.add(
+                    "decode_video",
+                    time.perf_counter() - start,
+                    summed_over_workers=False,
+                )
+            frame_path = Path(
+                os.path.join(
+                    dir_video, video_frame_name(reader.video_path, frame_index)
+                )
+            )
+            yield frame_path, img
+
+    yield from detect_chessboards_in_frames(
+        frames(),
+        pattern_size,
+        workers=workers,
+        camera=camera,
+        dir_undistorted=dir_undistorted,
+        detection_scale=detection_scale,
+        timer=timer,
+        executor=executor,
+        detector=detector,
+        writer=writer,
+    )
+
+
+def detection_scale_deviation(
+    image_paths: List[Path],
+    corners: List[np.ndarray],
+    pattern_size: Tuple[int],
+    detector: Optional[Detector] = None,
+) -> Optional[Tuple[float, float, int]]:
+    # Mean and max distance between the given corners and those found by full
+    # resolution detection, over the frames where both found the board
+    distances = []
+    for image_path, corners_scaled in zip(image_paths, corners):
+        image = Image.from_file(image_path, mode="grey")
+        image.detect_chessboard(pattern_size, detector=detector)
+        if image.has_chessboard():
+            distances.append(
+                np.linalg.norm(
+                    image.chess_board_corners.reshape(-1, 2)
+                    - corners_scaled.reshape(-1, 2),
+                    axis=1,
+                )
+            )
+    if len(distances) == 0:
+        return None
+    distances = np.hstack(distances)
+    return (
+        np.mean(distances),
+        np.max(distances),
+        len(distances) // int(np.prod(pattern_size)),
+    )
+
+
+def calibration_grid_points(
+    pattern_size: Tuple[int], grid_square_size: float
+) -> np.ndarray:
+    return grid_points(pattern_size, grid_square_size)
+
+
+def undistorted_export_settings(camera: Camera) -> dict:
+    # The undistorted images depend on the camera besides the encoder settings
+    settings = dict()
+    settings["Kc"] = np.asarray(camera.Kc, dtype=float).tolist()
+    settings["dist"] = np.asarray(camera.dist, dtype=float).ravel().tolist()
+    return settings
+
+
+def prepare_undistorted_directory(
     dir_base: Path,
-    dir_calibration: Path,
-    export_undistorted_images: bool = False,
-    export_poses: bool = False,
-    file_camera_params: Path = None,
+    writer: ImageWriter,
+    camera: Camera,
+    manifest_name: str = EXPORT_MANIFEST,
+) -> Path:
+    # Images exported before with the same camera and settings are kept, so
+    # exporting again only writes the new and changed ones
+    dir_undistorted = Path(os.path.join(dir_base, "undistorted"))
+    prepare_export_directory(
+        dir_undistorted, writer, undistorted_export_settings(camera), manifest_name
+    )
+    return dir_undistorted
+
+
+def finish_undistorted_directory(
+    dir_undistorted: Path,
+    writer: ImageWriter,
+    camera: Camera,
+    source_names: List[str],
+    timer: Optional[StageTimer] = None,
+    manifest_name: str = EXPORT_MANIFEST,
+    prune: bool = True,
 ) -> None:
-    assert dir_base.is_dir(), f"Expected {dir_base} to be a directory!"
-    assert dir_calibration.is_dir(), f"Expected {dir_calibration} to be a directory!"
+    start = time.perf_counter()
+    finish_export_directory(
+        dir_undistorted,
+        writer,
+        undistorted_export_settings(camera),
+        source_names,
+        manifest_name,
+        prune=prune,
+    )
+    if timer is not None and writer.threads > 0 and writer.n_written > 0:
+        # Encoding on the writer threads, only the wait for the last images
+        # in flight is spent here
+        timer.add("encode", writer.seconds, writer.n_written)
+        timer.add(
+            "flush_undistorted",
+            time.perf_counter() - start,
+            frames=0,
+            summed_over_workers=False,
+        )
+
+
+def save_poses(dir_base: Path, store: FrameStore, poses_format: str = "yaml") -> None:
+    dir_poses = Path(os.path.join(dir_base, "poses"))
+    if dir_poses.exists():
+        shutil.rmtree(dir_poses)
+    dir_poses.mkdir(parents=True, exist_ok=True)
+    export_poses_to_dir(store, dir_poses, poses_format)
+
+
+def frame_shape_mismatch(store: FrameStore, camera: Camera) -> np.ndarray:
+    # Indices of the frames whose size differs from that of the camera
+    return np.flatnonzero(
+        (store.shapes[:, 0] != camera.image_height)
+        | (store.shapes[:, 1] != camera.image_width)
+    )
+
+
+def frame_shape_message(store: FrameStore, camera: Camera, i: int) -> str:
+    height, width = store.shapes[i]
+    return (
+        f"Expected image size of {store.source_names[i]} to be "
+        f"{camera.image_width}x{camera.image_height}, but it is {width}x{height}!"
+    )
+
+
+def check_frame_shapes(store: FrameStore, camera: Camera) -> None:
+    mismatch = frame_shape_mismatch(store, camera)
+    if len(mismatch) > 0:
+        raise AssertionError(frame_shape_message(store, camera, mismatch[0]))
+
+
+def solve_frame_poses(
+    store: FrameStore,
+    rPNn: np.ndarray,
+    camera: Camera,
+    timer: Optional[StageTimer] = None,
+    pnp_method: str = "iterative",
+    pnp_warm_start: bool = False,
+) -> PnPSolver:
+    # Solves the pose of every detected frame into the rvecs and tvecs columns,
+    # in the order the frames were stored, so that a warm start follows the
+    # sequence of images or video frames
+    check_frame_shapes(store, camera)
+    solver = PnPSolver(
+        rPNn, camera.Kc, camera.dist, method=pnp_method, warm_start=pnp_warm_start
+    )
+    indices = store.detected_indices()
+    start = time.perf_counter()
+    rvecs, tvecs, corners = store.rvecs, store.tvecs, store.corners
+    for i in indices:
+        rvec, tvec = solver.solve(corners[i])
+        rvecs[i] = rvec.reshape(3)
+        tvecs[i] = tvec.reshape(3)
+    if timer is not None:
+        timer.add(
+            "pnp",
+            time.perf_counter() - start,
+            frames=len(indices),
+            summed_over_workers=False,
+        )
+    return solver
+
+
+def compute_frame_residuals(
+    store: FrameStore,
+    rPNn: np.ndarray,
+    camera: Camera,
+    projection_backend: str = "auto",
+) -> np.ndarray:
+    # Reprojection error of every point of every detected frame in one go,
+    # read from and written to the columns of the store
+    indices = store.detected_indices()
+    reprojection_errors = reprojection_errors_batch(
+        rPNn,
+        store.corners[indices],
+        store.rvecs[indices],
+        store.tvecs[indices],
+        camera.Kc,
+        camera.dist,
+        backend=projection_backend,
+    )
+    store.residuals[indices] = reprojection_errors
+    store.rms[indices] = np.sqrt(np.mean(reprojection_errors**2, axis=1))
+    return reprojection_errors
+
+
+def find_files(
+    dir_calibration: Path, extensions: List[str], recursive: bool = False
+) -> List[str]:
+    # Sorted paths, relative to the directory, of the non-hidden files in it
+    # with one of the extensions
+    return sorted(scan_files(dir_calibration, extensions, recursive))
+
+
+def find_image_files(dir_calibration: Path, recursive: bool = False) -> List[str]:
+    return find_files(dir_calibration, supported_image_extensions(), recursive)
+
+
+def find_video_files(dir_calibration: Path, recursive: bool = False) -> List[str]:
+    return find_files(dir_calibration, supported_video_extensions(), recursive)
+
+
+def calibration_grid_detector(
+    calibration_grid: dict, detector_name: Optional[str] = None
+) -> Detector:
+    # The detector named on the command line, or else in the grid parameters.
+    # The detector_params of the grid parameters only apply to the detector
+    # named there.
+    detector_grid = calibration_grid.get("detector", "classic")
+    name = detector_grid if detector_name is None else detector_name
+    params = calibration_grid.get("detector_params") if name == detector_grid else None
+    return create_detector(name, params)
 
+
+def calibration_grid_setup(
+    calibration_grid: dict, detector_name: Optional[str] = None
+) -> Tuple[Tuple[int], np.ndarray, Detector]:
+    # Pattern size, grid points and grid detector from grid parameters with
+    # the keys of calibration_grid_params.yaml
+    for key in ["grid_width", "grid_height", "grid_square_size"]:
+        assert (
+            key in calibration_grid
+        ), f"Expected the calibration grid parameters to contain {key}!"
+    pattern_size = (calibration_grid["grid_width"], calibration_grid["grid_height"])
+    detector = calibration_grid_detector(calibration_grid, detector_name)
+
+    # Object points, which depend on the grid layout the detector finds
+    rPNn = detector.grid_points(pattern_size, calibration_grid["grid_square_size"])
+    return pattern_size, rPNn, detector
+
+
+def load_calibration_setup(
+    dir_calibration: Path,
+    file_camera_params: Optional[Path] = None,
+    detector_name: Optional[str] = None,
+) -> Tuple[Camera, Tuple[int], np.ndarray, Detector]:
+    # Camera, grid pattern size, grid points and grid detector from the yaml
+    # files in the calibration directory
     # Check that the calibration directory contains a camera_params.yaml file
     if file_camera_params is None:
         file_camera_params = Path(os.path.join(dir_calibration, "camera_params.yaml"))
@@ -50,138 +763,679 @@ def validate(
         file_calibration_grid_params.is_file()
     ), f"Expected calibration_grid_params.yaml to be a file in {dir_calibration}!"
 
-    # Find images in the calibration directory
-    supported_extensions = supported_image_extensions()
-    image_files = [
-        f
-        for f in os.listdir(dir_calibration)
-        if Path(f).suffix.lower() in supported_extensions
-        and not Path(f).stem.startswith(".")
-    ]
-
-    image_files.sort()
-
-    print(f"Found {len(image_files)} images in {dir_calibration}.")
-    assert (
-        len(image_files) > 0
-    ), f"Expected to find at least one image in {dir_calibration}!"
-
     # Load camera parameters
     camera = Camera.from_file(file_camera_params)
 
-    print(camera.as_latex_table())
-
     # Load calibration grid
     calibration_grid = get_calibration_grid_parameters(file_calibration_grid_params)
-    pattern_size = (calibration_grid["grid_width"], calibration_grid["grid_height"])
+    pattern_size, rPNn, detector = calibration_grid_setup(
+        calibration_grid, detector_name
+    )
+    return camera, pattern_size, rPNn, detector
+
+
+def evaluate_frames(
+    store: FrameStore,
+    camera: Camera,
+    pattern_size: Tuple[int],
+    rPNn: np.ndarray,
+    detector: Detector,
+    timer: Optional[StageTimer] = None,
+    workers: int = 1,
+    projection_backend: str = "auto",
+    pnp_method: str = "iterative",
+    pnp_warm_start: bool = False,
+    bootstrap_resamples: int = 1000,
+    cross_validation: Optional[str] = None,
+    progress_bar: bool = True,
+) -> ValidationResult:
+    # Everything after the detection: poses, residuals and their statistics,
+    # the same for frames from files and from memory. Prints nothing.
+    timer = StageTimer() if timer is None else timer
+    solver = solve_frame_poses(
+        store,
+        rPNn,
+        camera,
+        timer=timer,
+        pnp_method=pnp_method,
+        pnp_warm_start=pnp_warm_start,
+    )
+    return summarize_frames(
+        store,
+        camera,
+        pattern_size,
+        rPNn,
+        detector,
+        solver,
+        timer=timer,
+        workers=workers,
+        projection_backend=projection_backend,
+        bootstrap_resamples=bootstrap_resamples,
+        cross_validation=cross_validation,
+        progress_bar=progress_bar,
+    )
+
 
-    # Load images
-    images = []
-    for image_file in track(image_files, "Loading images"):
-        image = Image.from_file(os.path.join(dir_calibration, image_file))
-        assert image.shape[0] == camera.image_height, (
-            f"Expected image height to be {camera.image_height}, "
-            f"but it is {image.shape[0]}!"
+def summarize_frames(
+    store: FrameStore,
+    camera: Camera,
+    pattern_size: Tuple[int],
+    rPNn: np.ndarray,
+    detector: Detector,
+    solver: PnPSolver,
+    timer: Optional[StageTimer] = None,
+    workers: int = 1,
+    projection_backend: str = "auto",
+    bootstrap_resamples: int = 1000,
+    cross_validation: Optional[str] = None,
+    progress_bar: bool = True,
+) -> ValidationResult:
+    # Residuals and their statistics of frames whose poses are solved
+    timer = StageTimer() if timer is None else timer
+    n_poses = store.n_detected
+    assert n_poses > 0, "Expected to find a calibration grid in at least one frame!"
+
+    with timer.measure("stats", frames=n_poses):
+        reprojection_errors = compute_frame_residuals(
+            store, rPNn, camera, projection_backend
         )
-        assert image.shape[1] == camera.image_width, (
-            f"Expected image width to be {camera.image_width}, "
-            f"but it is {image.shape[1]}!"
+        statistics = tuple(
+            float(x) for x in reprojection_statistics(reprojection_errors)
         )
+    intervals = None
+    if bootstrap_resamples > 0:
+        with timer.measure("bootstrap", frames=bootstrap_resamples):
+            intervals = bootstrap_intervals(reprojection_errors, bootstrap_resamples)
 
-        # Detect checkerboard
-        image.detect_chessboard(pattern_size)
-
-        if image.has_chessboard():
-            images.append(image)
+    cross_validated = None
+    if cross_validation is not None:
+        # Refit the calibration on subsets of the detected corners, to see how
+        # well the supplied parameters are determined by these frames
+        with timer.measure("cross_validation") as stage:
+            cross_validated = cross_validate(
+                store,
+                rPNn,
+                camera,
+                folds=cross_validation,
+                workers=workers,
+                progress_bar=progress_bar,
+            )
+            stage["frames"] = cross_validated.n_folds
 
-    print(
-        f"Found {len(images)} out of {len(image_files)} images with a calibration grid."
+    return ValidationResult(
+        camera,
+        pattern_size,
+        rPNn,
+        detector,
+        store,
+        solver,
+        statistics,
+        intervals=intervals,
+        cross_validation=cross_validated,
+        timer=timer,
     )
 
-    # Object points
-    rPNn = np.meshgrid(np.arange(0, pattern_size[0]), np.arange(0, pattern_size[1]))
-    rPNn = (
-        np.hstack(
-            (
-                rPNn[0].reshape(-1, 1),
-                rPNn[1].reshape(-1, 1),
-                np.zeros((pattern_size[0] * pattern_size[1], 1)),
-            )
-        ).astype(float)
-        * calibration_grid["grid_square_size"]
+
+def named_frames(
+    frames: Iterable[Union[np.ndarray, Image]],
+) -> Iterator[Tuple[Path, np.ndarray]]:
+    # Images keep the name of their file, other frames are named by index
+    for index, frame in enumerate(frames):
+        if isinstance(frame, Image):
+            name = frame.file_path
+            frame = frame.img
+        else:
+            name = None
+        if name is None:
+            name = f"frame_{index:06d}"
+        yield Path(name), frame
+
+
+def validate_frames(
+    frames: Iterable[Union[np.ndarray, Image]],
+    camera: Camera,
+    calibration_grid: dict,
+    detector_name: Optional[str] = None,
+    workers: int = 1,
+    detection_scale: float = 1.0,
+    projection_backend: str = "auto",
+    pnp_method: str = "iterative",
+    pnp_warm_start: bool = False,
+    bootstrap_resamples: int = 1000,
+    cross_validation: Optional[str] = None,
+    frame_store_dir: Optional[Path] = None,
+) -> ValidationResult:
+    # Validates the calibration on frames in memory, numpy images or Image
+    # objects, with grid parameters that have the keys of
+    # calibration_grid_params.yaml. Nothing is read from or written to disk,
+    # unless frame_store_dir is given, and nothing is printed.
+    pattern_size, rPNn, detector = calibration_grid_setup(
+        calibration_grid, detector_name
     )
+    timer = StageTimer()
+    with timer.measure("total") as stage:
+        store = FrameStore.from_frames(
+            detect_chessboards_in_frames(
+                named_frames(frames),
+                pattern_size,
+                workers=workers,
+                detection_scale=detection_scale,
+                timer=timer,
+                detector=detector,
+            ),
+            len(rPNn),
+            dir_memmap=frame_store_dir,
+        )
+        stage["frames"] = len(store)
+        result = evaluate_frames(
+            store,
+            camera,
+            pattern_size,
+            rPNn,
+            detector,
+            timer=timer,
+            workers=workers,
+            projection_backend=projection_backend,
+            pnp_method=pnp_method,
+            pnp_warm_start=pnp_warm_start,
+            bootstrap_resamples=bootstrap_resamples,
+            cross_validation=cross_validation,
+            progress_bar=False,
+        )
+        store.flush()
+    return result
 
-    poses = []
-    for image in track(
-        images, "Solving camera pose from calibration grid using solvePnP"
-    ):
-        # Image points
-        rQOi = image.chess_board_corners.reshape(-1, 2)
 
-        # Solve PnP
-        retval, rvec, tvec = cv2.solvePnP(rPNn, rQOi, camera.Kc, camera.dist)
+def print_found_files(n_images: int, n_videos: int, dir_calibration: Path) -> None:
+    if n_videos > 0:
+        print(f"Found {n_images} images and {n_videos} videos in {dir_calibration}.")
+    else:
+        print(f"Found {n_images} images in {dir_calibration}.")
+    assert (
+        n_images + n_videos > 0
+    ), f"Expected to find at least one image or video in {dir_calibration}!"
+
 
-        # Compute reprojection error
-        rQOi_reprojected, _ = cv2.projectPoints(
-            rPNn, rvec, tvec, camera.Kc, camera.dist
+def shard_setup(
+    shard: Tuple[int, int],
+    n_image_files: int,
+    n_video_files: int,
+    camera: Camera,
+    pattern_size: Tuple[int],
+    rPNn: np.ndarray,
+    detector: Detector,
+    detection: dict,
+    frame_step: int,
+    duplicate_threshold: float,
+    pnp_method: str,
+    pnp_warm_start: bool,
+) -> Tuple[dict, dict]:
+    # Everything the frames of a shard depend on, which merge checks to be the
+    # same for all shards: settings, and the camera and grid as arrays
+    setup = dict()
+    setup["shard"] = list(shard)
+    setup["n_image_files"] = n_image_files
+    setup["n_video_files"] = n_video_files
+    setup["image_size"] = [camera.image_width, camera.image_height]
+    setup["pattern_size"] = list(pattern_size)
+    setup["detector"] = detector.name
+    setup["detector_params"] = detector.params
+    setup["detection"] = detection
+    setup["frame_step"] = frame_step
+    setup["duplicate_threshold"] = duplicate_threshold
+    setup["pnp_method"] = pnp_method
+    setup["pnp_warm_start"] = pnp_warm_start
+    arrays = dict()
+    arrays["Kc"] = np.asarray(camera.Kc)
+    arrays["dist"] = np.asarray(camera.dist)
+    arrays["rPNn"] = np.asarray(rPNn)
+    return setup, arrays
+
+
+def validate(
+    dir_base: Path,
+    dir_calibration: Path,
+    export_undistorted_images: bool = False,
+    export_poses: bool = False,
+    file_camera_params: Path = None,
+    workers: int = 1,
+    use_cache: bool = True,
+    projection_backend: str = "auto",
+    detection_scale: float = 1.0,
+    detection_scale_check_frames: int = 5,
+    poses_format: str = "yaml",
+    timings_file: Optional[Path] = None,
+    frame_step: int = 1,
+    duplicate_threshold: float = 1.0,
+    reduced_decode: bool = False,
+    frame_store_dir: Optional[Path] = None,
+    prefetch_depth: int = 0,
+    pnp_method: str = "iterative",
+    pnp_warm_start: bool = False,
+    detector_name: Optional[str] = None,
+    cross_validation: Optional[str] = None,
+    bootstrap_resamples: int = 1000,
+    writer: Optional[ImageWriter] = None,
+    shard: Optional[Tuple[int, int]] = None,
+    recursive: bool = False,
+    file_manifest: Optional[Path] = None,
+) -> Optional[ValidationResult]:
+    # Validates the calibration on the images and videos in dir_calibration,
+    # printing the results as it goes. A shard only takes its part of them and
+    # saves its frames for merge, and has no result if it found no grid.
+    timer = StageTimer()
+    with timer.measure("total") as stage:
+        result = _validate(
+            dir_base,
+            dir_calibration,
+            timer,
+            export_undistorted_images=export_undistorted_images,
+            export_poses=export_poses,
+            file_camera_params=file_camera_params,
+            workers=workers,
+            use_cache=use_cache,
+            projection_backend=projection_backend,
+            detection_scale=detection_scale,
+            detection_scale_check_frames=detection_scale_check_frames,
+            poses_format=poses_format,
+            frame_step=frame_step,
+            duplicate_threshold=duplicate_threshold,
+            reduced_decode=reduced_decode,
+            frame_store_dir=frame_store_dir,
+            prefetch_depth=prefetch_depth,
+            pnp_method=pnp_method,
+            pnp_warm_start=pnp_warm_start,
+            detector_name=detector_name,
+            cross_validation=cross_validation,
+            bootstrap_resamples=bootstrap_resamples,
+            writer=writer,
+            shard=shard,
+            recursive=recursive,
+            file_manifest=file_manifest,
         )
-        rQOi_reprojected = rQOi_reprojected.reshape(-1, 2)
-        reprojection_error = np.linalg.norm(rQOi_reprojected - rQOi, axis=1)
+        stage["frames"] = 0 if result is None else result.n_frames
+    print(timer)
+    if timings_file is not None:
+        file_timings = timer.to_file(timings_file)
+        print(f"Saved timings to {file_timings}.")
+    return result
 
-        rNCc = tvec
-        Rcn, _ = cv2.Rodrigues(rvec)
 
-        Rnc = Rcn.T
-        rCNn = -Rnc @ rNCc
+def _validate(
+    dir_base: Path,
+    dir_calibration: Path,
+    timer: StageTimer,
+    export_undistorted_images: bool = False,
+    export_poses: bool = False,
+    file_camera_params: Path = None,
+    workers: int = 1,
+    use_cache: bool = True,
+    projection_backend: str = "auto",
+    detection_scale: float = 1.0,
+    detection_scale_check_frames: int = 5,
+    poses_format: str = "yaml",
+    frame_step: int = 1,
+    duplicate_threshold: float = 1.0,
+    reduced_decode: bool = False,
+    frame_store_dir: Optional[Path] = None,
+    prefetch_depth: int = 0,
+    pnp_method: str = "iterative",
+    pnp_warm_start: bool = False,
+    detector_name: Optional[str] = None,
+    cross_validation: Optional[str] = None,
+    bootstrap_resamples: int = 1000,
+    writer: Optional[ImageWriter] = None,
+    shard: Optional[Tuple[int, int]] = None,
+    recursive: bool = False,
+    file_manifest: Optional[Path] = None,
+) -> Optional[ValidationResult]:
+    assert dir_base.is_dir(), f"Expected {dir_base} to be a directory!"
+    assert dir_calibration.is_dir(), f"Expected {dir_calibration} to be a directory!"
 
-        # Add pose to image
-        pose = dict()
-        pose["rCNn"] = rCNn
-        pose["Rnc"] = Rnc
-        pose["reprojection_error"] = reprojection_error
-        pose["source_name"] = image.file_path
-        poses.append(pose)
+    camera, pattern_size, rPNn, detector = load_calibration_setup(
+        dir_calibration, file_camera_params, detector_name
+    )
 
-    reprojection_errors = np.hstack([pose["reprojection_error"] for pose in poses])
-    reproj_rms = np.sqrt(np.mean(reprojection_errors**2))
-    reproj_mean = np.mean(reprojection_errors)
-    reproj_std = np.std(reprojection_errors)
-    print(
-        f"Reprojection error from {len(poses)} image frames, each with {pattern_size[0] * pattern_size[1]} points:"
+    # Find images and videos in the calibration directory, or in a manifest,
+    # on a thread that hands out the images while those before are processed
+    discovery = FileDiscovery(
+        dir_calibration,
+        recursive=recursive,
+        file_manifest=file_manifest,
+        unique_names=export_undistorted_images or export_poses,
     )
-    print(f"  RMS: {reproj_rms:4g} [pix]")
-    print(f" Mean: {reproj_mean:4g} [pix]")
-    print(f"  STD: {reproj_std:4g} [pix]")
+    image_files = discovery
+    video_files = discovery.video_files
+    if shard is not None:
+        # A block of the sorted images and every n-th video, merge puts the
+        # frames of all shards back in the order of a run without shards.
+        # Picking the block takes the whole list of images.
+        with timer.measure("scan") as stage:
+            image_files, video_files = discovery.collect()
+            stage["frames"] += len(image_files)
+        print_found_files(len(image_files), len(video_files), dir_calibration)
+        n_image_files, n_video_files = len(image_files), len(video_files)
+        image_indices = shard_range(n_image_files, shard)
+        video_indices = shard_videos(n_video_files, shard)
+        image_files = [image_files[i] for i in image_indices]
+        video_files = [video_files[j] for j in video_indices]
+        print(
+            f"Shard {shard[0]}/{shard[1]} takes {len(image_files)} images and "
+            f"{len(video_files)} videos."
+        )
+
+    print(camera.as_latex_table())
 
+    # Load images, detect checkerboards and solve poses as a single stream, so
+    # only the corners and pose of each frame are kept once its pixels are gone
+    # Decode JPEGs at reduced resolution for the coarse search. The undistorted
+    # export needs every image at full resolution, so there is nothing to save.
+    decode_reduction = 1
+    if reduced_decode and not export_undistorted_images:
+        decode_reduction = choose_decode_reduction(
+            detection_scale, camera.image_width, camera.image_height
+        )
+    detection = detection_parameters(
+        pattern_size,
+        scale=detection_scale,
+        reduction=decode_reduction,
+        detector=detector,
+        decode_mode="color" if export_undistorted_images else "grey",
+    )
+    cache = None
+    if use_cache:
+        # Shards running side by side on one root path keep their own cache
+        cache_params = detection if shard is None else dict(detection, shard=shard)
+        cache = DetectionCache(cache_directory(dir_base), cache_params)
+    dir_undistorted = None
+    manifest_name = EXPORT_MANIFEST
+    if shard is not None:
+        manifest_name = f".export_{Path(partial_file_name(shard)).stem}.json"
+    description = "Detecting calibration grid"
     if export_undistorted_images:
-        dir_undistorted = Path(os.path.join(dir_base, "undistorted"))
-        if dir_undistorted.exists():
-            shutil.rmtree(dir_undistorted)
-        os.mkdir(dir_undistorted)
-        for image_file in track(image_files, "Saving undistorted images"):
-            image = Image.from_file(os.path.join(dir_calibration, image_file))
-            image_undistorted = camera.undistort_image(image)
-            image_undistorted.to_file(
-                os.path.join(
-                    dir_undistorted,
-                    image_file,
+        writer = ImageWriter() if writer is None else writer
+        dir_undistorted = prepare_undistorted_directory(
+            dir_base, writer, camera, manifest_name
+        )
+        description += ", saving undistorted images"
+    image_paths = (os.path.join(dir_calibration, f) for f in image_files)
+    readers = []
+
+    def video_frames() -> Iterator[Tuple[Path, Tuple[int], Optional[np.ndarray]]]:
+        # All videos are known once every image has been found
+        for f in video_files:
+            reader = VideoFrameReader(
+                os.path.join(dir_calibration, f),
+                frame_step=frame_step,
+                duplicate_threshold=duplicate_threshold,
+            )
+            readers.append(reader)
+            yield from detect_chessboards_in_video(
+                reader,
+                pattern_size,
+                workers=workers,
+                camera=camera,
+                dir_undistorted=dir_undistorted,
+                detection_scale=detection_scale,
+                timer=timer,
+                detector=detector,
+                writer=writer,
+            )
+
+    frames = itertools.chain(
+        detect_chessboards(
+            image_paths,
+            pattern_size,
+            workers=workers,
+            cache=cache,
+            camera=camera,
+            dir_undistorted=dir_undistorted,
+            detection_scale=detection_scale,
+            timer=timer,
+            decode_reduction=decode_reduction,
+            prefetch_depth=prefetch_depth,
+            detector=detector,
+            writer=writer,
+            checksums=discovery.checksums,
+        ),
+        video_frames(),
+    )
+    # The number of images is only known once they have all been found, and
+    # that of video frames left after decimation and duplicate skipping once
+    # the videos have been read
+    total = None
+    if shard is not None and len(video_files) == 0:
+        total = len(image_files)
+    frames = progress.track(frames, description, total=total)
+    store = FrameStore.from_frames(
+        frames,
+        len(rPNn),
+        capacity=max(1, len(image_files)) if shard is not None else 1024,
+        dir_memmap=frame_store_dir,
+    )
+    n_poses = store.n_detected
+    n_images = len(store) - sum(reader.n_accepted for reader in readers)
+    if shard is None:
+        timer.add(
+            "scan", discovery.seconds, discovery.n_images, summed_over_workers=False
+        )
+        print_found_files(n_images, len(video_files), dir_calibration)
+        if not discovery.ordered:
+            # The images were searched in the order they were found, they are
+            # kept in the order of their sorted paths
+            names = np.array(store.source_names[:n_images], dtype=str)
+            store.reorder(
+                np.concatenate(
+                    [np.argsort(names, kind="stable"), np.arange(n_images, len(store))]
                 )
             )
+    if dir_undistorted is not None:
+        finish_undistorted_directory(
+            dir_undistorted,
+            writer,
+            camera,
+            store.source_names,
+            timer=timer,
+            manifest_name=manifest_name,
+            # An image moves to the next shard when images before it are
+            # added or removed, and that shard may already have exported it
+            prune=shard is None,
+        )
+        print(
+            f"Saved {len(store) - writer.n_kept} undistorted images to {dir_undistorted}, "
+            f"kept {writer.n_kept} exported before."
+        )
+
+    if cache is not None and cache.hits > 0:
+        print(f"Reused {cache.hits} cached detections from {cache.file_path}.")
+    for reader in readers:
+        print(
+            f"Read {reader.n_frames} frames from {reader.video_path.name}: "
+            f"decoded every {reader.frame_step}, skipped {reader.n_duplicates} "
+            f"near duplicates, searched {reader.n_accepted} for the calibration grid."
+        )
+    print(
+        f"Found {n_poses} out of {len(store)} images with a calibration grid "
+        f"using the {detector.name} detector."
+    )
+
+    if detection_scale < 1 and detection_scale_check_frames > 0:
+        # Compare a few frames against full resolution detection, so the loss
+        # in accuracy from the coarse search can be judged. Video frames are
+        # left out, as they cannot be read again by name.
+        from_files = [
+            i for i in store.detected_indices() if Path(store.source_names[i]).is_file()
+        ]
+        step = max(1, len(from_files) // detection_scale_check_frames)
+        sample = from_files[::step][:detection_scale_check_frames]
+        deviation = detection_scale_deviation(
+            [store.source_names[i] for i in sample],
+            [store.corners[i] for i in sample],
+            pattern_size,
+            detector=detector,
+        )
+        if deviation is not None:
+            print(
+                f"Corners detected at scale {detection_scale:g} deviate from full "
+                f"resolution by {deviation[0]:4g} [pix] mean, {deviation[1]:4g} [pix] "
+                f"max over {deviation[2]} frames."
+            )
+
+    file_partial = None
+    if shard is not None:
+        file_partial = os.path.join(shard_directory(dir_base), partial_file_name(shard))
+        setup, setup_arrays = shard_setup(
+            shard,
+            n_image_files,
+            n_video_files,
+            camera,
+            pattern_size,
+            rPNn,
+            detector,
+            detection,
+            frame_step,
+            duplicate_threshold,
+            pnp_method,
+            pnp_warm_start,
+        )
+        order = frame_order(
+            image_indices,
+            [(j, reader.n_accepted) for j, reader in zip(video_indices, readers)],
+        )
+        if n_poses == 0:
+            # The other shards may well have found the grid
+            save_partial(file_partial, store, order, setup, setup_arrays)
+            print(f"Saved the frames of shard {shard[0]}/{shard[1]} to {file_partial}.")
+            return None
+
+    assert (
+        n_poses > 0
+    ), f"Expected to find a calibration grid in at least one image in {dir_calibration}!"
+
+    result = evaluate_frames(
+        store,
+        camera,
+        pattern_size,
+        rPNn,
+        detector,
+        timer=timer,
+        workers=workers,
+        projection_backend=projection_backend,
+        pnp_method=pnp_method,
+        pnp_warm_start=pnp_warm_start,
+        bootstrap_resamples=bootstrap_resamples,
+        cross_validation=cross_validation,
+    )
+    if pnp_warm_start:
+        print(
+            f"Warm started {result.solver.n_warm_started} out of {n_poses} poses from "
+            f"the previous frame, solved {result.solver.n_restarted} of them again "
+            f"from scratch."
+        )
+    print(result)
+    if file_partial is not None:
+        with timer.measure("save_partial", frames=len(store)):
+            save_partial(file_partial, store, order, setup, setup_arrays)
+        print(f"Saved the frames of shard {shard[0]}/{shard[1]} to {file_partial}.")
+
     if export_poses:
-        dir_poses = Path(os.path.join(dir_base, "poses"))
-        if dir_poses.exists():
-            shutil.rmtree(dir_poses)
-        dir_poses.mkdir(parents=True, exist_ok=True)
-        for i, pose in enumerate(track(poses, "Saving poses")):
-            image_name = Path(pose["source_name"]).stem
-            file_pose = Path(os.path.join(dir_poses, f"pose_{image_name}.yaml"))
-            pose_out = dict()
-            #
-            pose_out["rCNn"] = yu.numpy_to_yaml_dict(pose["rCNn"])
-            #
-            pose_out["Rnc"] = yu.numpy_to_yaml_dict(pose["Rnc"])
-            #
-            rms = np.sqrt(np.mean(pose["reprojection_error"] ** 2))
-            pose_out["reprojection_error"] = rms.item()
-            with open(file_pose, "w") as f:
-                yaml.dump(pose_out, f)
+        with timer.measure("export_poses", frames=n_poses):
+            save_poses(dir_base, store, poses_format)
+    store.flush()
+
+    peak_rss, peak_rss_workers = gn.peak_memory_usage()
+    print(
+        f"Peak memory: {gn.format_bytes(peak_rss)} "
+        f"(largest worker: {gn.format_bytes(peak_rss_workers)})"
+    )
+
+    return result
+
+
+def merge(
+    dir_base: Path,
+    partial_files: Optional[List[Path]] = None,
+    export_poses: bool = False,
+    workers: int = 1,
+    projection_backend: str = "auto",
+    poses_format: str = "yaml",
+    timings_file: Optional[Path] = None,
+    bootstrap_resamples: int = 1000,
+    cross_validation: Optional[str] = None,
+) -> ValidationResult:
+    # Puts the frames saved by the shards of a run together, by default those
+    # in <dir_base>/shards, and reports and exports the same as a run without
+    # shards would have
+    timer = StageTimer()
+    with timer.measure("total") as stage:
+        if not partial_files:
+            partial_files = find_partial_files(dir_base)
+        assert (
+            len(partial_files) > 0
+        ), f"Expected to find partial results in {shard_directory(dir_base)}!"
+        with timer.measure("merge") as merge_stage:
+            store, setup, arrays = merge_partials(partial_files)
+            merge_stage["frames"] = len(store)
+        stage["frames"] = len(store)
+        print(
+            f"Merged {len(partial_files)} shards with {setup['n_image_files']} images "
+            f"and {setup['n_video_files']} videos, {len(store)} frames."
+        )
+
+        camera = Camera(arrays["Kc"], arrays["dist"], *setup["image_size"])
+        print(camera.as_latex_table())
+        pattern_size = tuple(setup["pattern_size"])
+        rPNn = arrays["rPNn"]
+        detector = create_detector(setup["detector"], setup["detector_params"])
+        n_poses = store.n_detected
+        print(
+            f"Found {n_poses} out of {len(store)} images with a calibration grid "
+            f"using the {detector.name} detector."
+        )
+        assert (
+            n_poses > 0
+        ), "Expected to find a calibration grid in at least one frame of the shards!"
+
+        if setup["pnp_warm_start"]:
+            # Without shards the warm start runs on across the frames the
+            # shards were split at, so the poses are solved again in order
+            result = evaluate_frames(
+                store,
+                camera,
+                pattern_size,
+                rPNn,
+                detector,
+                timer=timer,
+                workers=workers,
+                projection_backend=projection_backend,
+                pnp_method=setup["pnp_method"],
+                pnp_warm_start=True,
+                bootstrap_resamples=bootstrap_resamples,
+                cross_validation=cross_validation,
+            )
+        else:
+            solver = PnPSolver(rPNn, camera.Kc, camera.dist, method=setup["pnp_method"])
+            result = summarize_frames(
+                store,
+                camera,
+                pattern_size,
+                rPNn,
+                detector,
+                solver,
+                timer=timer,
+                workers=workers,
+                projection_backend=projection_backend,
+                bootstrap_resamples=bootstrap_resamples,
+                cross_validation=cross_validation,
+            )
+        print(result)
+
+        if export_poses:
+            with timer.measure("export_poses", frames=n_poses):
+                save_poses(dir_base, store, poses_format)
+
+    print(timer)
+    if timings_file is not None:
+        file_timings = timer.to_file(timings_file)
+        print(f"Saved timings to {file_timings}.")
+    return result
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from typing_extensions import Iterator, List, Optional, Tuple
+
+import validate_camera_calibration.tools.general as gn
+
+cv2 = gn.lazy_import("cv2")
+np = gn.lazy_import("numpy")
+
+
+def supported_video_extensions() -> List[str]:
+    return [".mp4", ".avi", ".mov", ".mkv"]
+
+
+# Width of the thumbnails compared by the near-duplicate filter
+THUMBNAIL_WIDTH = 64
+
+
+def thumbnail(img: np.ndarray, width: int = THUMBNAIL_WIDTH) -> np.ndarray:
+    # Small grey copy of a frame. Area averaging also suppresses sensor noise,
+    # so a static scene gives nearly identical thumbnails.
+    if len(img.shape) == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    height = max(1, round(img.shape[0] * width / img.shape[1]))
+    return cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA).astype(
+        np.float32
+    )
+
+
+def frame_difference(thumbnail_a: np.ndarray, thumbnail_b: np.ndarray) -> float:
+    # Mean absolute grey level difference between two thumbnails
+    return float(cv2.norm(thumbnail_a, thumbnail_b, cv2.NORM_L1) / thumbnail_a.size)
+
+
+def video_frame_name(video_path: Path, frame_index: int) -> str:
+    # Stands in for a file name in poses and undistorted exports
+    return f"{Path(video_path).stem}_frame_{frame_index:06d}.png"
+
+
+# Streams the frames of a video file without writing them to disk. Only every
+# frame_step-th frame is decoded, and a frame is dropped when it differs from
+# the last accepted frame by less than duplicate_threshold grey levels on
+# average, so near-identical frames from a camera held still never reach the
+# chessboard detection.
+class VideoFrameReader:
+    def __init__(
+        self,
+        video_path: Path,
+        frame_step: int = 1,
+        duplicate_threshold: float = 0.0,
+    ) -> None:
+        assert Path(video_path).is_file(), f"Expected {video_path} to be a file!"
+        assert (
+            frame_step >= 1
+        ), f"Expected frame_step to be at least 1, but it is {frame_step}!"
+        assert (
+            duplicate_threshold >= 0
+        ), f"Expected duplicate_threshold to be non-negative, but it is {duplicate_threshold}!"
+        self.video_path = Path(video_path)
+        self.frame_step = frame_step
+        self.duplicate_threshold = duplicate_threshold
+        self.n_frames = 0
+        self.n_decoded = 0
+        self.n_duplicates = 0
+        self.n_accepted = 0
+
+    def __repr__(self) -> str:
+        return f"VideoFrameReader({self.video_path}, frame_step={self.frame_step})"
+
+    def frame_count(self) -> Optional[int]:
+        # Number of frames reported by the container, which may be inaccurate
+        capture = cv2.VideoCapture(str(self.video_path))
+        try:
+            count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        finally:
+            capture.release()
+        return count if count > 0 else None
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        capture = cv2.VideoCapture(str(self.video_path))
+        assert capture.isOpened(), f"Expected to be able to open {self.video_path}!"
+        previous = None
+        try:
+            while True:
+                frame_index = self.n_frames
+                if frame_index % self.frame_step != 0:
+                    # Advance without converting the frame to an image
+                    if not capture.grab():
+                        break
+                    self.n_frames += 1
+                    continue
+                retval, img = capture.read()
+                if not retval:
+                    break
+                self.n_frames += 1
+                self.n_decoded += 1
+                if self.duplicate_threshold > 0:
+                    current = thumbnail(img)
+                    if (
+                        previous is not None
+                        and frame_difference(current, previous)
+                        < self.duplicate_threshold
+                    ):
+                        self.n_duplicates += 1
+                        continue
+                    previous = current
+                self.n_accepted += 1
+                yield frame_index, img
+        finally:
+            capture.release()
@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+
+from typing_extensions import Dict, List, Optional, Tuple
+
+import validate_camera_calibration.tools.general as gn
+from validate_camera_calibration.tools.cache import DetectionCache, cache_directory
+from validate_camera_calibration.tools.camera import Camera
+from validate_camera_calibration.tools.detectors import Detector
+from validate_camera_calibration.tools.frames import FrameStore
+from validate_camera_calibration.tools.image import (
+    detection_parameters,
+    supported_image_extensions,
+)
+from validate_camera_calibration.tools.parallel import worker_pool
+from validate_camera_calibration.tools.statistics import RunningStatistics
+from validate_camera_calibration.tools.timing import StageTimer
+from validate_camera_calibration.tools.validation import (
+    compute_frame_residuals,
+    detect_chessboards,
+    finish_undistorted_directory,
+    frame_shape_message,
+    frame_shape_mismatch,
+    load_calibration_setup,
+    prepare_undistorted_directory,
+    save_poses,
+    solve_frame_poses,
+)
+from validate_camera_calibration.tools.writer import ImageWriter
+
+np = gn.lazy_import("numpy")
+futures = gn.lazy_import("concurrent.futures")
+
+# Seconds between saves of the detection cache while watching, it is saved
+# once more when watching stops
+CACHE_SAVE_INTERVAL = 30.0
+# Rows of changed and deleted images are dropped from the store once there are
+# more of them than of images still there, and at least this many
+MIN_COMPACT_ROWS = 256
+
+
+def scan_image_files(dir_calibration: Path) -> Dict[str, Tuple[int, int]]:
+    # Size and modification time of every supported, non-hidden image file
+    supported_extensions = supported_image_extensions()
+    signatures = dict()
+    with os.scandir(dir_calibration) as entries:
+        for entry in entries:
+            path = Path(entry.name)
+            if path.suffix.lower() not in supported_extensions:
+                continue
+            if path.stem.startswith(".") or not entry.is_file():
+                continue
+            stat = entry.stat()
+            signatures[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return signatures
+
+
+# Poses and reprojection statistics of the images in a directory that keeps
+# receiving new files. The frames of every poll are appended to one store, and
+# each image points at its latest row. Once most rows belong to images that
+# changed or are gone, the store is compacted to those still pointed at, so a
+# directory whose images keep being overwritten does not grow it without
+# bound. Each frame keeps its own statistics, which are merged into and
+# removed from the running total as frames are added, changed or deleted, so
+# an update only costs as much as the frames that changed.
+class WatchState:
+    def __init__(self, n_points: int) -> None:
+        self.signatures: Dict[str, Tuple[int, int]] = dict()
+        self.store = FrameStore(n_points)
+        self.rows: Dict[str, int] = dict()
+        self.frame_statistics: Dict[str, RunningStatistics] = dict()
+        self.total = RunningStatistics()
+
+    @property
+    def n_images(self) -> int:
+        return len(self.rows)
+
+    @property
+    def n_poses(self) -> int:
+        return len(self.frame_statistics)
+
+    def remove(self, name: str) -> None:
+        self.signatures.pop(name, None)
+        self.rows.pop(name, None)
+        statistics = self.frame_statistics.pop(name, None)
+        if statistics is not None:
+            self.total = self.total - statistics
+
+    def skip(self, name: str, signature: Tuple[int, int]) -> None:
+        # Keeps the signature of an image that cannot be used, so it is only
+        # looked at again once it changes
+        self.remove(name)
+        self.signatures[name] = signature
+
+    def add(self, name: str, signature: Tuple[int, int], row: int) -> None:
+        self.remove(name)
+        self.signatures[name] = signature
+        self.rows[name] = row
+        if self.store.detected[row]:
+            statistics = RunningStatistics.from_samples(self.store.residuals[row])
+            self.frame_statistics[name] = statistics
+            self.total = self.total + statistics
+
+    @property
+    def n_dead_rows(self) -> int:
+        return len(self.store) - len(self.rows)
+
+    def compact(self, min_rows: int = MIN_COMPACT_ROWS) -> bool:
+        # Keeps only the latest row of every image, in the order they were
+        # added, if enough rows are no longer pointed at
+        if self.n_dead_rows < max(min_rows, len(self.rows)):
+            return False
+        names = sorted(self.rows, key=self.rows.get)
+        self.store = self.store.select(
+            np.array([self.rows[name] for name in names], dtype=np.int64)
+        )
+        self.rows = {name: row for row, name in enumerate(names)}
+        return True
+
+    def sorted_frames(self) -> FrameStore:
+        # Latest frame of every image still there, by name
+        return self.store.select(
+            np.array([self.rows[name] for name in sorted(self.rows)], dtype=np.int64)
+        )
+
+    def summary(self) -> str:
+        rms, mean, std = self.total.as_tuple()
+        return (
+            f"{self.n_poses} out of {self.n_images} images with a calibration grid, "
+            f"reprojection error RMS: {rms:4g} Mean: {mean:4g} STD: {std:4g} [pix]"
+        )
+
+
+def watch(
+    dir_base: Path,
+    dir_calibration: Path,
+    export_undistorted_images: bool = False,
+    export_poses: bool = False,
+    file_camera_params: Path = None,
+    workers: int = 1,
+    use_cache: bool = True,
+    projection_backend: str = "auto",
+    detection_scale: float = 1.0,
+    poses_format: str = "yaml",
+    timings_file: Optional[Path] = None,
+    interval: float = 1.0,
+    idle_timeout: Optional[float] = None,
+    prefetch_depth: int = 0,
+    pnp_method: str = "iterative",
+    detector_name: Optional[str] = None,
+    writer: Optional[ImageWriter] = None,
+) -> WatchState:
+    # Processes the images in dir_calibration and then keeps polling it for
+    # new, changed and deleted images until interrupted, or until no image has
+    # arrived for idle_timeout seconds
+    assert dir_base.is_dir(), f"Expected {dir_base} to be a directory!"
+    assert dir_calibration.is_dir(), f"Expected {dir_calibration} to be a directory!"
+    assert interval > 0, f"Expected interval to be positive, but it is {interval}!"
+
+    camera, pattern_size, rPNn, detector = load_calibration_setup(
+        dir_calibration, file_camera_params, detector_name
+    )
+    print(camera.as_latex_table())
+
+    cache = None
+    if use_cache:
+        cache = DetectionCache(
+            cache_directory(dir_base),
+            detection_parameters(
+                pattern_size,
+                scale=detection_scale,
+                detector=detector,
+                decode_mode="color" if export_undistorted_images else "grey",
+            ),
+        )
+    dir_undistorted = None
+    if export_undistorted_images:
+        writer = ImageWriter() if writer is None else writer
+        dir_undistorted = prepare_undistorted_directory(dir_base, writer, camera)
+
+    timer = StageTimer()
+    state = WatchState(len(rPNn))
+    # One pool for as long as the directory is watched, rather than one per
+    # poll
+    pool = worker_pool(workers) if workers > 1 else None
+    print(f"Watching {dir_calibration} for images, press Ctrl+C to stop.")
+    with timer.measure("total") as stage:
+        previous = dict()
+        last_change = time.monotonic()
+        last_save = time.monotonic()
+        polled = False
+        try:
+            while True:
+                with timer.measure("scan"):
+                    current = scan_image_files(dir_calibration)
+
+                # Only take files whose size and modification time have not
+                # changed since the previous poll, or that have not been
+                # touched for a whole interval, so that images still being
+                # written are left for a later poll
+                now_ns = time.time_ns()
+                ready = [
+                    name
+                    for name, signature in sorted(current.items())
+                    if state.signatures.get(name) != signature
+                    and (
+                        previous.get(name) == signature
+                        or now_ns - signature[1] > interval * 1e9
+                    )
+                ]
+                removed = [name for name in state.signatures if name not in current]
+                previous = current
+
+                for name in removed:
+                    state.remove(name)
+                if len(ready) > 0:
+                    _process(
+                        state,
+                        ready,
+                        current,
+                        dir_calibration,
+                        pattern_size,
+                        rPNn,
+                        camera,
+                        timer,
+                        workers=workers,
+                        cache=cache,
+                        dir_undistorted=dir_undistorted,
+                        detection_scale=detection_scale,
+                        projection_backend=projection_backend,
+                        prefetch_depth=prefetch_depth,
+                        pnp_method=pnp_method,
+                        detector=detector,
+                        writer=writer,
+                        executor=pool,
+                    )
+                    if writer is not None:
+                        # Every image of this poll is on disk before it is
+                        # reported
+                        writer.close()
+                    stage["frames"] += len(ready)
+                state.compact()
+                polled = True
+                if (
+                    cache is not None
+                    and time.monotonic() - last_save > CACHE_SAVE_INTERVAL
+                ):
+                    cache.save(prune=False)
+                    last_save = time.monotonic()
+                if len(ready) > 0 or len(removed) > 0:
+                    last_change = time.monotonic()
+                    print(f"+{len(ready)} -{len(removed)} images: {state.summary()}")
+                elif (
+                    idle_timeout is not None
+                    and time.monotonic() - last_change > idle_timeout
+                ):
+                    print(f"No new images for {idle_timeout:g} s, stopping.")
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if cache is not None:
+                # Entries of images that were never looked at are only stale
+                # once the whole directory has been gone through
+                cache.save(prune=polled)
+
+        print(state.summary())
+        if dir_undistorted is not None:
+            finish_undistorted_directory(
+                dir_undistorted,
+                writer,
+                camera,
+                [os.path.join(dir_calibration, name) for name in state.rows],
+                timer=timer,
+            )
+        if export_poses and state.n_poses > 0:
+            with timer.measure("export_poses", frames=state.n_poses):
+                save_poses(dir_base, state.sorted_frames(), poses_format)
+
+    print(timer)
+    if timings_file is not None:
+        file_timings = timer.to_file(timings_file)
+        print(f"Saved timings to {file_timings}.")
+    return state
+
+
+def _process(
+    state: WatchState,
+    names: List[str],
+    signatures: Dict[str, Tuple[int, int]],
+    dir_calibration: Path,
+    pattern_size: Tuple[int],
+    rPNn: np.ndarray,
+    camera: Camera,
+    timer: StageTimer,
+    workers: int = 1,
+    cache: Optional[DetectionCache] = None,
+    dir_undistorted: Optional[Path] = None,
+    detection_scale: float = 1.0,
+    projection_backend: str = "auto",
+    prefetch_depth: int = 0,
+    pnp_method: str = "iterative",
+    detector: Optional[Detector] = None,
+    writer: Optional[ImageWriter] = None,
+    executor: Optional[futures.Executor] = None,
+) -> None:
+    image_paths = [os.path.join(dir_calibration, name) for name in names]
+    frames = detect_chessboards(
+        image_paths,
+        pattern_size,
+        workers=min(workers, len(image_paths)),
+        cache=cache,
+        camera=camera,
+        dir_undistorted=dir_undistorted,
+        detection_scale=detection_scale,
+        timer=timer,
+        prefetch_depth=prefetch_depth,
+        detector=detector,
+        writer=writer,
+        executor=executor,
+        save_cache=False,
+    )
+    new = FrameStore.from_frames(frames, len(rPNn), capacity=len(names))
+
+    # An image of another size than the camera's is left out, rather than
+    # stopping the watch
+    mismatch = frame_shape_mismatch(new, camera)
+    if len(mismatch) > 0:
+        for i in mismatch:
+            print(f"{frame_shape_message(new, camera, i)} Skipping it.")
+            name = Path(new.source_names[i]).name
+            state.skip(name, signatures[name])
+        new = new.select(np.setdiff1d(np.arange(len(new)), mismatch))
+    solve_frame_poses(new, rPNn, camera, timer=timer, pnp_method=pnp_method)
+
+    # Residuals of the new frames only, merged into the running statistics
+    if new.n_detected > 0:
+        with timer.measure("stats", frames=new.n_detected):
+            compute_frame_residuals(new, rPNn, camera, projection_backend)
+    rows = state.store.extend(new)
+    for source_name, row in zip(new.source_names, rows):
+        name = Path(source_name).name
+        state.add(name, signatures[name], row)
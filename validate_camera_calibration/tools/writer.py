@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from typing_extensions import Iterable, List, Optional
+
+import validate_camera_calibration.tools.general as gn
+
+cv2 = gn.lazy_import("cv2")
+futures = gn.lazy_import("concurrent.futures")
+
+# Written next to the exported images once an export is complete
+EXPORT_MANIFEST = ".export.json"
+
+
+def supported_export_formats() -> List[str]:
+    # same keeps the extension of every source image, bmp is uncompressed
+    return ["same", "jpg", "png", "tiff", "bmp"]
+
+
+# Encodes and writes exported images with the chosen format and encoder
+# settings. With threads, encoding, which for PNG and TIFF takes longer than
+# the undistortion itself, runs on a small thread pool while the caller goes
+# on with the next image; OpenCV releases the GIL while it encodes. Once
+# max_pending images are waiting to be written, write blocks, so the memory
+# held by images in flight stays bounded. A writer sent to a worker process
+# only takes its settings along and writes there on the calling thread, the
+# worker processes already encode in parallel.
+class ImageWriter:
+    def __init__(
+        self,
+        export_format: str = "same",
+        jpeg_quality: int = 95,
+        png_compression: int = 1,
+        threads: int = 0,
+        max_pending: Optional[int] = None,
+    ) -> None:
+        assert (
+            export_format in supported_export_formats()
+        ), f"Expected export_format to be one of {supported_export_formats()}, but it is {export_format}!"
+        assert (
+            0 <= jpeg_quality <= 100
+        ), f"Expected jpeg_quality to be in [0, 100], but it is {jpeg_quality}!"
+        assert (
+            0 <= png_compression <= 9
+        ), f"Expected png_compression to be in [0, 9], but it is {png_compression}!"
+        assert (
+            threads >= 0
+        ), f"Expected threads to be non-negative, but it is {threads}!"
+        self.export_format = export_format
+        self.jpeg_quality = jpeg_quality
+        self.png_compression = png_compression
+        self.threads = threads
+        self.max_pending = max(1, 2 * threads) if max_pending is None else max_pending
+        assert (
+            self.max_pending >= 1
+        ), f"Expected max_pending to be at least 1, but it is {self.max_pending}!"
+        # Whether files written by an earlier export with the same settings
+        # are kept when they are newer than their source
+        self.incremental = True
+        # Files listed by the earlier export that is kept, those no longer
+        # exported again are removed once this export finishes
+        self.previous_files = []
+        # Images written here, and those kept from an earlier export
+        self.n_written = 0
+        self.n_kept = 0
+        self.seconds = 0.0
+        self._executor = None
+        self._slots = None
+        self._errors = []
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        settings = ", ".join(f"{key}={value}" for key, value in self.settings().items())
+        return f"ImageWriter({settings}, threads={self.threads})"
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        state.update(
+            threads=0,
+            n_written=0,
+            n_kept=0,
+            seconds=0.0,
+            previous_files=[],
+            _executor=None,
+            _slots=None,
+            _errors=[],
+            _lock=None,
+        )
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def settings(self) -> dict:
+        # Everything besides the pixels that the written files depend on
+        settings = dict()
+        settings["export_format"] = self.export_format
+        settings["jpeg_quality"] = self.jpeg_quality
+        settings["png_compression"] = self.png_compression
+        return settings
+
+    def output_path(self, dir_export: Path, source_path: Path) -> Path:
+        source_path = Path(source_path)
+        suffix = (
+            source_path.suffix
+            if self.export_format == "same"
+            else f".{self.export_format}"
+        )
+        return Path(os.path.join(dir_export, source_path.stem + suffix))
+
+    def params(self, file_path: Path) -> List[int]:
+        suffix = Path(file_path).suffix.lower()
+        if suffix in [".jpg", ".jpeg"]:
+            return [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        if suffix == ".png":
+            return [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        return []
+
+    def up_to_date(self, dir_export: Path, source_path: Path) -> bool:
+        # A file exported after its source was last changed is kept, as long
+        # as the directory was exported with the same settings before
+        if not self.incremental:
+            return False
+        try:
+            exported = os.stat(self.output_path(dir_export, source_path))
+            source = os.stat(source_path)
+        except OSError:
+            return False
+        return exported.st_mtime >= source.st_mtime
+
+    def _write(self, file_path: Path, img) -> None:
+        start = time.perf_counter()
+        assert cv2.imwrite(
+            str(file_path), img, self.params(file_path)
+        ), f"Failed to save {file_path}!"
+        with self._lock:
+            self.n_written += 1
+            self.seconds += time.perf_counter() - start
+
+    def _done(self, future: futures.Future) -> None:
+        self._slots.release()
+        if future.exception() is not None:
+            with self._lock:
+                self._errors.append(future.exception())
+
+    def write(self, file_path: Path, img) -> None:
+        if self.threads == 0:
+            self._write(file_path, img)
+            return
+        if self._executor is None:
+            self._executor = futures.ThreadPoolExecutor(max_workers=self.threads)
+            self._slots = threading.BoundedSemaphore(self.max_pending)
+        self.raise_errors()
+        self._slots.acquire()
+        self._executor.submit(self._write, file_path, img).add_done_callback(self._done)
+
+    def raise_errors(self) -> None:
+        with self._lock:
+            if len(self._errors) > 0:
+                raise self._errors[0]
+
+    def close(self) -> None:
+        # Waits for the images in flight, then raises the first failed write
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.raise_errors()
+
+
+def prepare_export_directory(
+    dir_export: Path,
+    writer: ImageWriter,
+    settings: dict,
+    manifest_name: str = EXPORT_MANIFEST,
+) -> None:
+    # Keeps the files of an earlier export if it finished with the same
+    # settings, otherwise removes the files it lists and writes every file
+    # again. Files in the directory that no export wrote are left alone. The
+    # manifest is removed until this export finishes, so an interrupted
+    # export is not mistaken for a complete one, and still removes the files
+    # of an earlier export whose source is gone once it finishes.
+    dir_export = Path(dir_export)
+    dir_export.mkdir(parents=True, exist_ok=True)
+    file_manifest = Path(os.path.join(dir_export, manifest_name))
+    manifest = None
+    if file_manifest.is_file():
+        with open(file_manifest, "r") as f:
+            manifest = json.load(f)
+        file_manifest.unlink()
+    previous = None if manifest is None else manifest.get("settings")
+    writer.incremental = writer.incremental and previous == dict(
+        settings, **writer.settings()
+    )
+    previous_files = [] if manifest is None else manifest.get("files", [])
+    writer.previous_files = list(previous_files) if writer.incremental else []
+    if not writer.incremental:
+        remove_export_files(dir_export, previous_files)
+
+
+def remove_export_files(dir_export: Path, names: Iterable[str]) -> None:
+    for name in names:
+        file_path = Path(os.path.join(dir_export, Path(name).name))
+        if file_path.is_file():
+            file_path.unlink()
+
+
+def finish_export_directory(
+    dir_export: Path,
+    writer: ImageWriter,
+    settings: dict,
+    source_paths: Iterable[Path],
+    manifest_name: str = EXPORT_MANIFEST,
+    prune: bool = True,
+) -> None:
+    # Waits for every file to be written before the export counts as complete.
+    # Files the earlier export wrote for sources that are not among
+    # source_paths any more, such as deleted images, are removed with prune,
+    # and otherwise stay listed so a later export can still remove them.
+    writer.close()
+    files = {
+        writer.output_path(dir_export, source_path).name for source_path in source_paths
+    }
+    stale = set(writer.previous_files) - files
+    if prune:
+        remove_export_files(dir_export, sorted(stale))
+    else:
+        files |= stale
+    writer.previous_files = []
+    manifest = dict()
+    manifest["settings"] = dict(settings, **writer.settings())
+    manifest["files"] = sorted(files)
+    with open(os.path.join(dir_export, manifest_name), "w") as f:
+        json.dump(manifest, f, indent=2)
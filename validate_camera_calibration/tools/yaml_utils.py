@@ -1,4 +1,8 @@
-import numpy as np
+from __future__ import annotations
+
+import validate_camera_calibration.tools.general as gn
+
+np = gn.lazy_import("numpy")
 
 
 def numpy_to_yaml_dict(x: np.ndarray) -> dict: